@@ -44,12 +44,15 @@ const char* units = "metric";
 
 // Google Sheets API
 const char* scriptUrl = "https://script.google.com/macros/s/AKfycbz8PNvMcZhqdUdaxWj70VaNGPWxSBVm7Mjy8tR4bnS7IsYa7bN47Or58cw_LgGqFf_EpQ/exec";
+// Mã trạm gửi kèm mỗi bản ghi (ingest_server.py ghi vào file riêng của trạm; Apps Script bỏ qua)
+const char* stationId = "esp32-01";
 
 // Biến toàn cục
 float last_t_dht = 0;
 float last_h_dht = 0;
 float last_t_api = 0;
 float last_h_api = 0;
+bool api_received = false;  // Đã nhận được dữ liệu API lần nào chưa (last_t_api/last_h_api hợp lệ)
 float predicted_temp = 0;
 float predicted_hum = 0;
 float prev_t_dht = 0;  // Giá trị trước đó để tính biến thiên
@@ -123,10 +126,21 @@ void setup() {
   // Hiển thị thông tin về mô hình AI
   Serial.println("\n=== THÔNG TIN MÔ HÌNH AI ===");
   Serial.printf("Số lượng đặc trưng: %d\n", NUM_FEATURES);
+#if defined(MODEL_FUSED) && MODEL_FIXED_POINT
+  // Header fused không có temp_intercept/hum_intercept, hệ số tự do nằm trong model_bias
+  float temp_bias = (float)model_bias[0] * MODEL_OUTPUT_SCALE;
+  float hum_bias = (float)model_bias[1] * MODEL_OUTPUT_SCALE;
+#elif defined(MODEL_FUSED)
+  float temp_bias = model_bias[0];
+  float hum_bias = model_bias[1];
+#else
+  float temp_bias = temp_intercept;
+  float hum_bias = hum_intercept;
+#endif
   Serial.println("Hệ số mô hình nhiệt độ:");
-  Serial.printf("- Intercept: %.4f\n", temp_intercept);
+  Serial.printf("- Intercept: %.4f\n", temp_bias);
   Serial.println("Hệ số mô hình độ ẩm:");
-  Serial.printf("- Intercept: %.4f\n", hum_intercept);
+  Serial.printf("- Intercept: %.4f\n", hum_bias);
   
   // Hiển thị ngưỡng cảnh báo
   Serial.println("\n=== NGƯỠNG CẢNH BÁO ===");
@@ -173,6 +187,13 @@ void loop() {
   
   // Gửi dữ liệu lên Sheets theo chu kỳ
   if (currentMillis - lastSendTime >= SEND_INTERVAL && dht_ready() && api_ready()) {
+#ifdef ROLLING_FEATURES
+    // Cập nhật bộ đệm vòng của các đặc trưng cửa sổ trượt (O(1), khai báo trong model_coef.h)
+    // theo nhịp các bản ghi đã xử lý khi huấn luyện, chỉ khi đã có dữ liệu API thật
+    if (api_received) {
+      rolling_update(last_t_dht, last_h_dht, last_t_api, last_h_api);
+    }
+#endif
     sendToSheets(last_t_dht, last_h_dht, last_t_api, last_h_api, predicted_temp, predicted_hum);
     lastSendTime = currentMillis;
   }
@@ -284,6 +305,7 @@ void getWeatherData() {
     if (!error) {
       last_t_api = doc["main"]["temp"];
       last_h_api = doc["main"]["humidity"];
+      api_received = true;
       Serial.printf("🌐 API: %.1f°C, %.1f%%\n", last_t_api, last_h_api);
       
       // Hiển thị thêm thông tin thời tiết nếu có
@@ -326,6 +348,7 @@ bool sendToSheets(float t_dht, float h_dht, float t_api, float h_api, float t_pr
   url += "&temp_pred=" + String(t_pred, 2);
   url += "&hum_pred=" + String(h_pred, 2);
   url += "&status=" + String(isPredictedAlert ? "WARNING" : "NORMAL");
+  url += "&station_id=" + String(stationId);
   url += "&nocache=" + String(random(100000));  // Ngăn cache
   
   http.begin(client, url);
@@ -375,6 +398,7 @@ void predictWeather() {
   // Xác định thứ tự đặc trưng dựa trên comment trong model_coef.h
   // temp_api, hum_api, temp_dht_lag1, temp_dht_lag3, hum_dht_lag1, hum_dht_lag3, 
   // temp_dht_diff, hum_dht_diff, temp_diff_dht_api, hum_diff_dht_api
+  // (+ hour, day_of_week, day_of_year nếu NUM_FEATURES >= 13)
   raw_features[0] = last_t_api;                   // temp_api
   raw_features[1] = last_h_api;                   // hum_api
   raw_features[2] = prev_t_dht;                   // temp_dht_lag1
@@ -385,13 +409,46 @@ void predictWeather() {
   raw_features[7] = last_h_dht - prev_h_dht;      // hum_dht_diff
   raw_features[8] = last_t_dht - last_t_api;      // temp_diff_dht_api
   raw_features[9] = last_h_dht - last_h_api;      // hum_diff_dht_api
-  
+
+  // Đặc trưng thời gian (chỉ có trong các file model_coef.h mới, luôn nằm sau cùng)
+  // day_of_week: thứ Hai = 0 giống pandas, tm_wday: Chủ nhật = 0
+  if (NUM_FEATURES >= 13) {
+    raw_features[10] = timeinfo.tm_hour;                 // hour
+    raw_features[11] = (timeinfo.tm_wday + 6) % 7;       // day_of_week
+    raw_features[12] = timeinfo.tm_yday + 1;             // day_of_year
+  }
+
+#ifdef ROLLING_FEATURES
+  // Đặc trưng cửa sổ trượt (sau đặc trưng thời gian), vị trí do model_coef.h quy định
+  rolling_fill_features(raw_features);
+#endif
+
   // Hiển thị các đặc trưng gốc
   Serial.println("\n🔢 Đặc trưng gốc:");
   for (int i = 0; i < NUM_FEATURES; i++) {
     Serial.printf("  - Đặc trưng %d: %.2f\n", i, raw_features[i]);
   }
   
+#if defined(MODEL_FUSED) && MODEL_FIXED_POINT
+  // Hệ số đã gộp chuẩn hóa, dạng fixed-point (xem fused_export.py)
+  int64_t acc_temp = model_bias[0];
+  int64_t acc_hum = model_bias[1];
+  for (int i = 0; i < NUM_FEATURES; i++) {
+    int32_t x = (int32_t)lroundf(raw_features[i] * MODEL_INPUT_SCALE);
+    acc_temp += (int64_t)model_weights[2 * i] * x;
+    acc_hum += (int64_t)model_weights[2 * i + 1] * x;
+  }
+  predicted_temp = (float)acc_temp * MODEL_OUTPUT_SCALE;
+  predicted_hum = (float)acc_hum * MODEL_OUTPUT_SCALE;
+#elif defined(MODEL_FUSED)
+  // Hệ số đã gộp chuẩn hóa: không cần chuẩn hóa đặc trưng, một vòng lặp cho cả hai mục tiêu
+  predicted_temp = model_bias[0];
+  predicted_hum = model_bias[1];
+  for (int i = 0; i < NUM_FEATURES; i++) {
+    predicted_temp += model_weights[2 * i] * raw_features[i];
+    predicted_hum += model_weights[2 * i + 1] * raw_features[i];
+  }
+#else
   // Chuẩn hóa các đặc trưng
   float features[NUM_FEATURES];
   for (int i = 0; i < NUM_FEATURES; i++) {
@@ -415,6 +472,7 @@ void predictWeather() {
   for (int i = 0; i < NUM_FEATURES; i++) {
     predicted_hum += hum_coef[i] * features[i];
   }
+#endif
   
   // Kiểm tra giá trị dự đoán hợp lý
   if (isnan(predicted_temp) || predicted_temp < 0 || predicted_temp > 50) {
@@ -0,0 +1,89 @@
+# models/training/augmentation.py
+import re
+import numpy as np
+import pandas as pd
+from lag_features import LAG_STEP_SECONDS, LAG_TOLERANCE_SECONDS, lag_indices
+from preprocess_data import LAG_COLS, MAX_LAG
+from timestamps import EPOCH_COLUMN
+
+DEFAULT_REPLICAS = 5   # Số bản sao có nhiễu được thêm vào dữ liệu gốc
+NOISE_RATIO = 0.05     # Độ lệch chuẩn của nhiễu = NOISE_RATIO * độ lệch chuẩn của cột
+AUGMENT_COLS = LAG_COLS  # Các cột được thêm nhiễu
+LAGS = (1, MAX_LAG)  # Các lag do preprocess_data tạo
+
+# Đặc trưng cửa sổ trượt dịch theo cùng nhiễu của hàng hiện tại (std không đổi)
+_SHIFTED_ROLLING_RE = re.compile(r"^(\w+?)_(?:roll\d+_(?:mean|min|max)|ewm\d+)$")
+
+def _lag_sources(df, col, lag, step, tolerance):
+    """
+    Chỉ số hàng trong df mà cột {col}_lag{lag} lấy giá trị từ đó, -1 nếu bản ghi được tham
+    chiếu không còn trong df (đã bị loại khi tiền xử lý) hoặc giá trị không khớp.
+    """
+    n = len(df)
+    if EPOCH_COLUMN in df.columns:
+        idx = lag_indices(df[EPOCH_COLUMN].values, lag * step, tolerance)
+    else:
+        idx = np.arange(n) - lag
+    values = df[col].values.astype(np.float64)
+    lagged = df[f'{col}_lag{lag}'].values.astype(np.float64)
+    found = idx >= 0
+    found[found] = np.isclose(values[idx[found]], lagged[found])
+    return np.where(found, idx, -1)
+
+def augment(df, replicas=DEFAULT_REPLICAS, noise_ratio=NOISE_RATIO, seed=None,
+            step=LAG_STEP_SECONDS, tolerance=LAG_TOLERANCE_SECONDS):
+    """
+    Tăng cường dữ liệu ít bằng replicas bản sao có nhiễu Gauss của AUGMENT_COLS, tạo trong một
+    khối NumPy cấp phát trước (replicas + 1, n, số cột số) thay cho nối DataFrame nhiều lần.
+    Các cột phụ thuộc được tính lại từ giá trị đã thêm nhiễu để bản sao vẫn nhất quán:
+    lag1/lag3 lấy nhiễu của đúng hàng được tham chiếu (nhiễu riêng nếu hàng đó không còn trong df),
+    diff = giá trị - lag1, chênh lệch DHT-API, và mean/min/max/EWMA cửa sổ trượt dịch theo nhiễu
+    của hàng hiện tại.
+    seed: hạt giống của numpy Generator để kết quả lặp lại được (None = ngẫu nhiên).
+    Trả về DataFrame gồm df gốc rồi lần lượt từng bản sao (mỗi khối len(df) hàng); df rỗng
+    được trả về nguyên vẹn.
+    """
+    n = len(df)
+    if n == 0:
+        return df
+    rng = np.random.default_rng(seed)
+    numeric_cols = [col for col in df.columns if pd.api.types.is_numeric_dtype(df[col])]
+    position = {col: j for j, col in enumerate(numeric_cols)}
+    base = df[numeric_cols].to_numpy(dtype=np.float64)
+    block = np.empty((replicas + 1, n, len(numeric_cols)))
+    block[:] = base
+
+    for col in AUGMENT_COLS:
+        if col not in position:
+            continue
+        j = position[col]
+        sigma = noise_ratio * np.nanstd(base[:, j], ddof=1) if n > 1 else 0.0
+        noise = rng.normal(0.0, sigma, size=(replicas, n))
+        block[1:, :, j] += noise
+
+        for lag in LAGS:
+            lag_col = f'{col}_lag{lag}'
+            if lag_col not in position:
+                continue
+            idx = _lag_sources(df, col, lag, step, tolerance)
+            own = rng.normal(0.0, sigma, size=(replicas, n))
+            block[1:, :, position[lag_col]] += np.where(idx >= 0, noise[:, np.maximum(idx, 0)], own)
+        if f'{col}_diff' in position and f'{col}_lag1' in position:
+            block[1:, :, position[f'{col}_diff']] = block[1:, :, j] - block[1:, :, position[f'{col}_lag1']]
+
+        prefix = col.split('_')[0]
+        api_col, dht_api_col = f'{prefix}_api', f'{prefix}_diff_dht_api'
+        if api_col in position and dht_api_col in position:
+            block[1:, :, position[dht_api_col]] = block[1:, :, j] - block[1:, :, position[api_col]]
+        for name in numeric_cols:
+            match = _SHIFTED_ROLLING_RE.match(name)
+            if match and match.group(1) in (col, dht_api_col):
+                block[1:, :, position[name]] += noise
+
+    out = pd.DataFrame(block.reshape(-1, len(numeric_cols)), columns=numeric_cols)
+    for col in df.columns:
+        if col in position:
+            out[col] = out[col].astype(df[col].dtype)
+        else:
+            out[col] = np.tile(df[col].values, replicas + 1)
+    return out[list(df.columns)]
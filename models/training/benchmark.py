@@ -0,0 +1,186 @@
+# models/training/benchmark.py
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from datetime import datetime
+from multiprocessing import get_context
+
+BENCHMARK_DIR = "../benchmarks"
+BASELINE_PATH = f"{BENCHMARK_DIR}/baseline.json"
+DEFAULT_SIZES = [10000, 100000, 1000000]
+STAGES = ['preprocess', 'preprocess_streaming', 'train', 'export', 'replay']
+DEFAULT_THRESHOLD = 0.2  # Chậm hơn / tốn bộ nhớ hơn baseline quá 20% thì coi là hồi quy
+COMPARED_METRICS = ['seconds', 'peak_rss_mb']
+
+def _make_workspace(root):
+    """
+    Tạo cây thư mục giống repo trong root để các đường dẫn tương đối (../../data, ../saved_models,
+    ../../docs/images) của các bước trỏ vào đây thay vì dữ liệu thật.
+    """
+    for sub in ['data/raw', 'data/processed', 'docs/images', 'models/saved_models',
+                'models/coefficients', 'models/training']:
+        os.makedirs(os.path.join(root, sub), exist_ok=True)
+    return os.path.join(root, 'models', 'training')
+
+def _stage_callable(stage):
+    """Import trước (không tính vào thời gian đo) và trả về hàm thực hiện một bước"""
+    if stage in ('preprocess', 'preprocess_streaming'):
+        from preprocess_data import (CHECKPOINT_PATH, DEFAULT_CHUNKSIZE, STATS_PATH,
+                                     preprocess_data)
+        # Bỏ thống kê ngoại lệ đã lưu để mỗi lần đo đều tính lại từ đầu
+        for path in (STATS_PATH, CHECKPOINT_PATH):
+            if os.path.exists(path):
+                os.remove(path)
+        if stage == 'preprocess':
+            return preprocess_data
+        return lambda: preprocess_data(chunksize=DEFAULT_CHUNKSIZE)
+    if stage == 'train':
+        from train_model import train_models
+        # Không dùng bộ đệm ma trận đặc trưng để mỗi lần đo đều chuẩn bị dữ liệu từ đầu
+        return lambda: train_models(use_cache=False)
+    if stage == 'export':
+        from fused_export import export_fused
+        return export_fused
+    if stage == 'replay':
+        from fused_export import _latest_model_timestamp
+        from replay import replay
+        timestamp = _latest_model_timestamp()
+        return lambda: replay(timestamp)
+    raise ValueError(f"Bước không hỗ trợ: {stage} (chọn trong {STAGES})")
+
+def _run_stage(stage, workdir):
+    """
+    Chạy một bước trong tiến trình con riêng (spawn) để peak RSS chỉ phản ánh bước đó.
+    Đầu ra của bước được bỏ qua, chỉ trả về thời gian và bộ nhớ.
+    """
+    os.environ['MPLBACKEND'] = 'Agg'
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(workdir)
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        func = _stage_callable(stage)
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024  # ru_maxrss: byte trên macOS, KB trên Linux
+    return {'seconds': seconds, 'peak_rss_mb': peak / scale, 'import_rss_mb': rss_before / scale}
+
+def _count_rows(path):
+    with open(path, 'rb') as f:
+        return max(sum(1 for _ in f) - 1, 0)
+
+def run_benchmarks(sizes=DEFAULT_SIZES, stages=STAGES, repeat=1, output_path=None, keep=False):
+    """
+    Chạy các bước trên dữ liệu mô phỏng với từng kích thước, mỗi lần đo trong một tiến trình mới.
+    Với repeat > 1 lấy lần chạy nhanh nhất. Trả về dict kết quả (đã lưu ra JSON).
+    """
+    from synthetic_fleet import generate_fleet
+
+    results = []
+    for rows in sizes:
+        root = tempfile.mkdtemp(prefix=f"bench_{rows}_")
+        workdir = _make_workspace(root)
+        raw_path = os.path.join(root, 'data', 'raw', 'weather_data.csv')
+        processed_path = os.path.join(root, 'data', 'processed', 'processed_data.csv')
+        print(f"\n=== {rows} bản ghi ({root}) ===")
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            generate_fleet(1, rows, raw_path)
+        try:
+            for stage in stages:
+                runs = []
+                for _ in range(repeat):
+                    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+                        runs.append(pool.submit(_run_stage, stage, workdir).result())
+                best = min(runs, key=lambda r: r['seconds'])
+                # Các bước trên dữ liệu thô tính theo số bản ghi thô, huấn luyện/xuất theo số mẫu đã xử lý
+                n = rows if stage in ('preprocess', 'preprocess_streaming', 'replay') else _count_rows(processed_path)
+                result = {'stage': stage, 'rows': rows, 'input_rows': n,
+                          'seconds': round(best['seconds'], 4),
+                          'peak_rss_mb': round(best['peak_rss_mb'], 1),
+                          'import_rss_mb': round(best['import_rss_mb'], 1),
+                          'rows_per_second': round(n / best['seconds'], 1) if best['seconds'] > 0 else None}
+                results.append(result)
+                print(f"{stage:<22} {best['seconds']:9.3f}s {best['peak_rss_mb']:9.1f} MB "
+                      f"{result['rows_per_second'] or 0:14,.0f} bản ghi/giây")
+        finally:
+            if not keep:
+                shutil.rmtree(root, ignore_errors=True)
+
+    report = {
+        'timestamp': datetime.now().strftime("%Y%m%d_%H%M%S"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'sizes': list(sizes),
+        'repeat': repeat,
+        'results': results,
+    }
+    if output_path is None:
+        os.makedirs(BENCHMARK_DIR, exist_ok=True)
+        output_path = f"{BENCHMARK_DIR}/benchmark_{report['timestamp']}.json"
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nĐã lưu kết quả benchmark vào: {output_path}")
+    return report
+
+def compare_to_baseline(report, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    So sánh từng (bước, kích thước) có trong cả hai báo cáo.
+    Trả về danh sách hồi quy: chỉ số tăng quá (1 + threshold) lần so với baseline.
+    """
+    base = {(r['stage'], r['rows']): r for r in baseline['results']}
+    regressions = []
+    print(f"\n=== SO SÁNH VỚI BASELINE ({baseline.get('timestamp')}) ===")
+    for r in report['results']:
+        ref = base.get((r['stage'], r['rows']))
+        if ref is None:
+            continue
+        ratios = {m: r[m] / ref[m] for m in COMPARED_METRICS if ref.get(m)}
+        flags = [m for m, ratio in ratios.items() if ratio > 1 + threshold]
+        print(f"{r['stage']:<22} {r['rows']:>10} " +
+              " ".join(f"{m} x{ratio:.2f}" for m, ratio in ratios.items()) +
+              ("  <-- HỒI QUY" if flags else ""))
+        regressions += [{'stage': r['stage'], 'rows': r['rows'], 'metric': m,
+                         'baseline': ref[m], 'current': r[m]} for m in flags]
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Đo thời gian, bộ nhớ và thông lượng của các bước huấn luyện")
+    parser.add_argument("--sizes", type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="Số bản ghi thô mô phỏng của mỗi lần chạy")
+    parser.add_argument("--stages", nargs='+', choices=STAGES, default=STAGES, help="Các bước cần đo")
+    parser.add_argument("--repeat", type=int, default=1, help="Số lần đo mỗi bước (lấy lần nhanh nhất)")
+    parser.add_argument("--output", default=None, help="Đường dẫn file JSON kết quả")
+    parser.add_argument("--baseline", default=None,
+                        help=f"File JSON baseline để so sánh (mặc định {BASELINE_PATH} nếu có)")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Tỷ lệ tăng cho phép so với baseline trước khi báo hồi quy")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help=f"Ghi kết quả lần này thành {BASELINE_PATH}")
+    parser.add_argument("--keep", action="store_true", help="Giữ lại thư mục dữ liệu tạm")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.sizes, args.stages, args.repeat, args.output, args.keep)
+
+    baseline_path = args.baseline or (BASELINE_PATH if os.path.exists(BASELINE_PATH) else None)
+    regressions = []
+    if baseline_path and not args.save_baseline:
+        with open(baseline_path) as f:
+            regressions = compare_to_baseline(report, json.load(f), args.threshold)
+    if args.save_baseline:
+        os.makedirs(BENCHMARK_DIR, exist_ok=True)
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Đã lưu baseline vào: {BASELINE_PATH}")
+    if regressions:
+        print(f"\nCó {len(regressions)} hồi quy vượt ngưỡng {args.threshold:.0%}")
+        sys.exit(1)
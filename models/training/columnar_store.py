@@ -0,0 +1,105 @@
+# models/training/columnar_store.py
+import json
+import os
+import numpy as np
+import pandas as pd
+from timestamps import EPOCH_COLUMN, TIMESTAMP_COLUMN, parse_timestamps
+
+# Mỗi cột được lưu thành một file nhị phân thô (little-endian) trong cùng thư mục,
+# kèm schema.json ghi kiểu dữ liệu và số bản ghi hợp lệ. Khi đọc, các cột được
+# memory-map trực tiếp nên không phải phân tích lại văn bản CSV.
+SCHEMA_FILE = "schema.json"
+FEATURE_DTYPE = np.dtype('<f4')    # float32 cho mọi cột số
+TIMESTAMP_DTYPE = np.dtype('<i8')  # int64 epoch (giây) cho cột thời gian
+
+def _column_file(path, name):
+    return os.path.join(path, f"{name}.bin")
+
+def _read_schema(path):
+    with open(os.path.join(path, SCHEMA_FILE), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _write_schema(path, schema):
+    """Ghi schema.json một cách nguyên tử để số bản ghi luôn khớp với dữ liệu đã ghi xong"""
+    schema_path = os.path.join(path, SCHEMA_FILE)
+    tmp_path = schema_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(schema, f, indent=2)
+    os.replace(tmp_path, schema_path)
+
+def columnar_rows(path):
+    """Số bản ghi trong kho cột, None nếu kho chưa tồn tại"""
+    if not os.path.exists(os.path.join(path, SCHEMA_FILE)):
+        return None
+    return _read_schema(path)['rows']
+
+class ColumnarWriter:
+    """
+    Ghi nối DataFrame đã xử lý vào kho cột.
+    Các cột số được ép về float32, riêng cột epoch 'timestamp' giữ kiểu int64
+    (được tạo từ cột Timestamp nếu DataFrame chưa có).
+    Dùng mode='a' để ghi tiếp vào kho đã có (chế độ incremental).
+    """
+
+    def __init__(self, path, mode='w'):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        if mode == 'a' and columnar_rows(path) is not None:
+            self.schema = _read_schema(path)
+            # Bỏ phần dữ liệu thừa của lần ghi bị gián đoạn trước đó
+            for name, dtype in self.schema['columns'].items():
+                with open(_column_file(path, name), 'r+b') as f:
+                    f.truncate(self.schema['rows'] * np.dtype(dtype).itemsize)
+        else:
+            self.schema = None
+
+    def _columns_of(self, df):
+        columns = {}
+        for name in df.columns:
+            if name in (TIMESTAMP_COLUMN, EPOCH_COLUMN):
+                columns[EPOCH_COLUMN] = TIMESTAMP_DTYPE.str
+            elif pd.api.types.is_numeric_dtype(df[name]):
+                columns[name] = FEATURE_DTYPE.str
+        return columns
+
+    def append(self, df):
+        if self.schema is None:
+            self.schema = {'columns': self._columns_of(df), 'rows': 0}
+            for name in self.schema['columns']:
+                open(_column_file(self.path, name), 'wb').close()
+            _write_schema(self.path, self.schema)
+        if len(df) == 0:
+            return
+
+        for name, dtype in self.schema['columns'].items():
+            if name == EPOCH_COLUMN:
+                if EPOCH_COLUMN in df.columns:
+                    values = df[EPOCH_COLUMN].values.astype(dtype)
+                else:
+                    values = parse_timestamps(df[TIMESTAMP_COLUMN])
+            else:
+                values = df[name].values.astype(dtype)
+            with open(_column_file(self.path, name), 'ab') as f:
+                values.tofile(f)
+
+        self.schema['rows'] += len(df)
+        _write_schema(self.path, self.schema)
+
+def load_columnar(path, columns=None):
+    """Memory-map các cột trong kho, trả về dict {tên cột: mảng numpy chỉ đọc}"""
+    schema = _read_schema(path)
+    rows = schema['rows']
+    arrays = {}
+    for name, dtype in schema['columns'].items():
+        if columns is not None and name not in columns:
+            continue
+        if rows == 0:
+            arrays[name] = np.empty(0, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(_column_file(path, name), dtype=dtype,
+                                     mode='r', shape=(rows,))
+    return arrays
+
+def load_columnar_frame(path, columns=None):
+    """Đọc kho cột thành DataFrame dựa trên các mảng memory-map"""
+    return pd.DataFrame(load_columnar(path, columns), copy=False)
@@ -3,18 +3,34 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
+import argparse
 from datetime import datetime
+from timestamps import EPOCH_COLUMN, NAT_EPOCH, TIMESTAMP_COLUMN, add_epoch_column, epoch_to_datetime
+from instrumentation import add_arguments, configure_from_args, quiet, stage
+from streaming_profile import DEFAULT_MAX_BUCKETS, MinMaxDownsampler, StreamingProfile
 
 # Đường dẫn đến file dữ liệu
 DATA_PATH = "../../data/raw/weather_data.csv"  # Điều chỉnh đường dẫn nếu cần
+DEFAULT_CHUNKSIZE = 500_000  # Số dòng mỗi khối khi đọc ở chế độ dữ liệu lớn
+SERIES_COLUMNS = [('temp_dht', 'r-', 'DHT'), ('temp_api', 'b--', 'API'),
+                  ('hum_dht', 'g-', 'DHT'), ('hum_api', 'm--', 'API')]
 
-def explore_data():
+def explore_data(large=False, chunksize=DEFAULT_CHUNKSIZE, max_buckets=DEFAULT_MAX_BUCKETS):
+    """
+    Khám phá dữ liệu thô và lưu các biểu đồ vào docs/images.
+    large=True: đọc theo khối chunksize dòng và tính mọi thứ trong một lượt (xem explore_data_streaming()),
+    bộ nhớ và thời gian vẽ không tăng theo số bản ghi; khi đó không trả về DataFrame.
+    """
     # Tạo thư mục cho báo cáo nếu chưa tồn tại
     os.makedirs("../../docs/images", exist_ok=True)
+    if large:
+        return explore_data_streaming(chunksize, max_buckets)
     
     # Đọc dữ liệu
     print(f"Đang đọc dữ liệu từ {DATA_PATH}...")
-    df = pd.read_csv(DATA_PATH)
+    with stage('explore/read') as span:
+        df = pd.read_csv(DATA_PATH)
+        span.rows_out = len(df)
     
     # Hiển thị thông tin cơ bản
     print("\n=== THÔNG TIN DỮ LIỆU ===")
@@ -22,79 +38,200 @@ def explore_data():
     print("\nCác cột trong dữ liệu:")
     print(df.columns.tolist())
     
-    print("\nMẫu dữ liệu:")
-    print(df.head())
-    
-    print("\nThống kê mô tả:")
-    print(df.describe())
-    
-    # Kiểm tra giá trị thiếu
-    print("\nGiá trị thiếu:")
-    print(df.isnull().sum())
+    if not quiet():
+        with stage('explore/diagnostics', rows_in=len(df)):
+            print("\nMẫu dữ liệu:")
+            print(df.head())
+
+            print("\nThống kê mô tả:")
+            print(df.describe())
+
+            # Kiểm tra giá trị thiếu
+            print("\nGiá trị thiếu:")
+            print(df.isnull().sum())
     
-    # Chuyển đổi timestamp sang datetime nếu có
-    if 'timestamp' in df.columns:
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        print("\nThời gian bắt đầu:", df['timestamp'].min())
-        print("Thời gian kết thúc:", df['timestamp'].max())
-        print(f"Tổng thời gian: {(df['timestamp'].max() - df['timestamp'].min()).total_seconds() / 3600:.1f} giờ")
+    # Chuyển đổi Timestamp sang epoch và datetime nếu có
+    if TIMESTAMP_COLUMN in df.columns:
+        with stage('explore/parse_timestamps', rows_in=len(df)) as span:
+            df = add_epoch_column(df)
+            df = df[df[EPOCH_COLUMN] != NAT_EPOCH]
+            epochs = df[EPOCH_COLUMN].values
+            df['datetime'] = epoch_to_datetime(epochs)
+            span.rows_out = len(df)
+        print("\nThời gian bắt đầu:", df['datetime'].min())
+        print("Thời gian kết thúc:", df['datetime'].max())
+        print(f"Tổng thời gian: {(epochs.max() - epochs.min()) / 3600:.1f} giờ")
     
     # Trực quan hóa
     print("\nĐang tạo biểu đồ phân tích...")
     
     # Biểu đồ nhiệt độ và độ ẩm theo thời gian
-    if 'timestamp' in df.columns and 'temp_dht' in df.columns and 'hum_dht' in df.columns:
-        plt.figure(figsize=(12, 6))
-        plt.subplot(2, 1, 1)
-        plt.plot(df['timestamp'], df['temp_dht'], 'r-', label='DHT')
-        if 'temp_api' in df.columns:
-            plt.plot(df['timestamp'], df['temp_api'], 'b--', label='API')
-        plt.title('Nhiệt độ theo thời gian')
-        plt.ylabel('Nhiệt độ (°C)')
-        plt.legend()
+    if 'datetime' in df.columns and 'temp_dht' in df.columns and 'hum_dht' in df.columns:
+        with stage('explore/time_series_plot', rows_in=len(df)):
+            plt.figure(figsize=(12, 6))
+            plt.subplot(2, 1, 1)
+            plt.plot(df['datetime'], df['temp_dht'], 'r-', label='DHT')
+            if 'temp_api' in df.columns:
+                plt.plot(df['datetime'], df['temp_api'], 'b--', label='API')
+            plt.title('Nhiệt độ theo thời gian')
+            plt.ylabel('Nhiệt độ (°C)')
+            plt.legend()
         
-        plt.subplot(2, 1, 2)
-        plt.plot(df['timestamp'], df['hum_dht'], 'g-', label='DHT')
-        if 'hum_api' in df.columns:
-            plt.plot(df['timestamp'], df['hum_api'], 'm--', label='API')
-        plt.title('Độ ẩm theo thời gian')
-        plt.ylabel('Độ ẩm (%)')
-        plt.xlabel('Thời gian')
-        plt.legend()
+            plt.subplot(2, 1, 2)
+            plt.plot(df['datetime'], df['hum_dht'], 'g-', label='DHT')
+            if 'hum_api' in df.columns:
+                plt.plot(df['datetime'], df['hum_api'], 'm--', label='API')
+            plt.title('Độ ẩm theo thời gian')
+            plt.ylabel('Độ ẩm (%)')
+            plt.xlabel('Thời gian')
+            plt.legend()
         
-        plt.tight_layout()
-        plt.savefig("../../docs/images/time_series_plot.png")
+            plt.tight_layout()
+            plt.savefig("../../docs/images/time_series_plot.png")
     
     # Biểu đồ phân phối
     if 'temp_dht' in df.columns and 'hum_dht' in df.columns:
-        plt.figure(figsize=(12, 6))
-        plt.subplot(1, 2, 1)
-        sns.histplot(df['temp_dht'], kde=True)
-        plt.title('Phân phối nhiệt độ (DHT)')
-        plt.xlabel('Nhiệt độ (°C)')
+        with stage('explore/distribution_plot', rows_in=len(df)):
+            plt.figure(figsize=(12, 6))
+            plt.subplot(1, 2, 1)
+            sns.histplot(df['temp_dht'], kde=True)
+            plt.title('Phân phối nhiệt độ (DHT)')
+            plt.xlabel('Nhiệt độ (°C)')
         
-        plt.subplot(1, 2, 2)
-        sns.histplot(df['hum_dht'], kde=True)
-        plt.title('Phân phối độ ẩm (DHT)')
-        plt.xlabel('Độ ẩm (%)')
+            plt.subplot(1, 2, 2)
+            sns.histplot(df['hum_dht'], kde=True)
+            plt.title('Phân phối độ ẩm (DHT)')
+            plt.xlabel('Độ ẩm (%)')
         
-        plt.tight_layout()
-        plt.savefig("../../docs/images/distribution_plot.png")
+            plt.tight_layout()
+            plt.savefig("../../docs/images/distribution_plot.png")
     
     # Biểu đồ tương quan
-    numeric_cols = df.select_dtypes(include=['float64', 'int64']).columns
+    numeric_cols = df.select_dtypes(include=['float64', 'int64']).columns.drop(EPOCH_COLUMN, errors='ignore')
     if len(numeric_cols) > 1:
-        plt.figure(figsize=(10, 8))
-        sns.heatmap(df[numeric_cols].corr(), annot=True, cmap='coolwarm', vmin=-1, vmax=1)
-        plt.title('Ma trận tương quan giữa các biến')
-        plt.tight_layout()
-        plt.savefig("../../docs/images/correlation_matrix.png")
+        with stage('explore/correlation_plot', rows_in=len(df)):
+            plt.figure(figsize=(10, 8))
+            sns.heatmap(df[numeric_cols].corr(), annot=True, cmap='coolwarm', vmin=-1, vmax=1)
+            plt.title('Ma trận tương quan giữa các biến')
+            plt.tight_layout()
+            plt.savefig("../../docs/images/correlation_matrix.png")
     
     print(f"Các biểu đồ đã được lưu trong thư mục docs/images")
     print("Khám phá dữ liệu hoàn tất!")
     
     return df
 
+def explore_data_streaming(chunksize=DEFAULT_CHUNKSIZE, max_buckets=DEFAULT_MAX_BUCKETS):
+    """
+    Chế độ dữ liệu lớn: một lượt đọc theo khối cập nhật StreamingProfile (số lượng, giá trị thiếu,
+    trung bình/độ lệch chuẩn, min/max, histogram bin cố định, hiệp phương sai) và MinMaxDownsampler
+    (min/max của mỗi khoảng thời gian). Các biểu đồ được vẽ từ các bộ tích lũy này chứ không từ
+    từng bản ghi. Trả về StreamingProfile.
+    """
+    print(f"Đang đọc dữ liệu từ {DATA_PATH} theo khối {chunksize} dòng...")
+    profile = downsampler = None
+    columns = None
+    t_min, t_max = None, None
+    with stage('explore/stream', chunksize=chunksize) as span:
+        rows = 0
+        for chunk in pd.read_csv(DATA_PATH, chunksize=chunksize):
+            if profile is None:
+                columns = chunk.columns.tolist()
+                numeric_cols = [col for col in chunk.select_dtypes(include=['number']).columns
+                                if col != EPOCH_COLUMN]
+                profile = StreamingProfile(numeric_cols)
+                series_cols = [col for col, _, _ in SERIES_COLUMNS if col in numeric_cols]
+                if TIMESTAMP_COLUMN in columns and series_cols:
+                    downsampler = MinMaxDownsampler(series_cols, max_buckets)
+            rows += len(chunk)
+            profile.update(chunk)
+            if TIMESTAMP_COLUMN in chunk.columns:
+                epochs = add_epoch_column(chunk)[EPOCH_COLUMN].values
+                valid = epochs[epochs != NAT_EPOCH]
+                if len(valid):
+                    t_min = valid.min() if t_min is None else min(t_min, valid.min())
+                    t_max = valid.max() if t_max is None else max(t_max, valid.max())
+                if downsampler is not None:
+                    downsampler.update(epochs, chunk)
+        span.rows_in = rows
+    if profile is None:
+        raise ValueError(f"{DATA_PATH} không có dữ liệu")
+
+    print("\n=== THÔNG TIN DỮ LIỆU ===")
+    print(f"Tổng số bản ghi: {profile.rows}")
+    print("\nCác cột trong dữ liệu:")
+    print(columns)
+    print("\nThống kê mô tả (phân vị xấp xỉ theo bin):")
+    print(profile.summary())
+    if t_min is not None:
+        print("\nThời gian bắt đầu:", epoch_to_datetime([t_min])[0])
+        print("Thời gian kết thúc:", epoch_to_datetime([t_max])[0])
+        print(f"Tổng thời gian: {(t_max - t_min) / 3600:.1f} giờ")
+
+    print("\nĐang tạo biểu đồ phân tích...")
+
+    # Biểu đồ nhiệt độ và độ ẩm theo thời gian từ các điểm min/max của mỗi khoảng
+    if downsampler is not None and 'temp_dht' in downsampler.columns and 'hum_dht' in downsampler.columns:
+        with stage('explore/time_series_plot', bucket_seconds=int(downsampler.width)) as span:
+            plt.figure(figsize=(12, 6))
+            points = 0
+            for i, (prefix, title, ylabel) in enumerate([('temp', 'Nhiệt độ theo thời gian', 'Nhiệt độ (°C)'),
+                                                         ('hum', 'Độ ẩm theo thời gian', 'Độ ẩm (%)')]):
+                plt.subplot(2, 1, i + 1)
+                for col, style, label in SERIES_COLUMNS:
+                    if col.startswith(prefix) and col in downsampler.columns:
+                        t, v = downsampler.points(col)
+                        points += len(t)
+                        plt.plot(epoch_to_datetime(t), v, style, label=label)
+                plt.title(title)
+                plt.ylabel(ylabel)
+                plt.legend()
+            plt.xlabel('Thời gian')
+            plt.tight_layout()
+            plt.savefig("../../docs/images/time_series_plot.png")
+            span.rows_in = points
+
+    # Biểu đồ phân phối từ histogram đã chia bin
+    if 'temp_dht' in profile.columns and 'hum_dht' in profile.columns:
+        with stage('explore/distribution_plot'):
+            plt.figure(figsize=(12, 6))
+            for i, (col, title, xlabel) in enumerate([('temp_dht', 'Phân phối nhiệt độ (DHT)', 'Nhiệt độ (°C)'),
+                                                      ('hum_dht', 'Phân phối độ ẩm (DHT)', 'Độ ẩm (%)')]):
+                plt.subplot(1, 2, i + 1)
+                if profile.histograms[col].total:
+                    counts, edges = profile.histograms[col].rebinned()
+                    plt.stairs(counts, edges, fill=True, alpha=0.6)
+                plt.title(title)
+                plt.xlabel(xlabel)
+                plt.ylabel('Count')
+            plt.tight_layout()
+            plt.savefig("../../docs/images/distribution_plot.png")
+
+    # Biểu đồ tương quan từ ma trận hiệp phương sai tích lũy
+    if len(profile.columns) > 1:
+        with stage('explore/correlation_plot'):
+            plt.figure(figsize=(10, 8))
+            sns.heatmap(profile.correlation(), annot=True, cmap='coolwarm', vmin=-1, vmax=1)
+            plt.title('Ma trận tương quan giữa các biến')
+            plt.tight_layout()
+            plt.savefig("../../docs/images/correlation_matrix.png")
+
+    print(f"Các biểu đồ đã được lưu trong thư mục docs/images")
+    print("Khám phá dữ liệu hoàn tất!")
+
+    return profile
+
 if __name__ == "__main__":
-    df = explore_data()
+    parser = argparse.ArgumentParser(description="Khám phá dữ liệu thời tiết thô")
+    parser.add_argument("--large", action="store_true",
+                        help="Chế độ dữ liệu lớn: đọc theo khối, thống kê một lượt, vẽ từ dữ liệu đã giảm mẫu")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE,
+                        help="Số dòng mỗi khối ở chế độ --large")
+    parser.add_argument("--max-buckets", type=int, default=DEFAULT_MAX_BUCKETS,
+                        help="Số khoảng thời gian tối đa của biểu đồ chuỗi thời gian ở chế độ --large")
+    add_arguments(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+
+    result = explore_data(args.large, args.chunksize, args.max_buckets)
     plt.show()  # Hiển thị tất cả biểu đồ
\ No newline at end of file
@@ -0,0 +1,98 @@
+# models/training/feature_cache.py
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+
+CACHE_DIR = "../../data/cache/features"
+DEFAULT_MAX_BYTES = 1 << 30  # 1 GiB
+CACHE_VERSION = 1  # Tăng khi thay đổi cách tạo ma trận đặc trưng để bỏ các mục cũ
+_META_FILE = "meta.json"
+
+def cache_key(data_hash, config):
+    """Khóa nội dung: băm của mã băm dữ liệu và toàn bộ tham số ảnh hưởng tới kết quả"""
+    payload = json.dumps({'version': CACHE_VERSION, 'data': data_hash, 'config': config},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class FeatureCache:
+    """
+    Bộ đệm trên đĩa cho ma trận thiết kế đã chuẩn bị (mảng numpy và metadata JSON).
+    Mỗi mục là một thư mục <khóa>/ chứa các file .npy (đọc bằng memory-map) và meta.json;
+    thời điểm sửa đổi của meta.json là lần dùng gần nhất, dùng cho loại bỏ LRU khi tổng
+    dung lượng vượt max_bytes.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def _entry(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        """Trả về (dict mảng, metadata) hoặc None nếu chưa có"""
+        entry = self._entry(key)
+        meta_path = os.path.join(entry, _META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(entry, f"{name}.npy"), mmap_mode='r')
+                  for name in meta['arrays']}
+        os.utime(meta_path)  # đánh dấu vừa được dùng
+        return arrays, meta['meta']
+
+    def put(self, key, arrays, meta=None):
+        """Ghi một mục (ghi vào thư mục tạm rồi đổi tên nên không có mục dở dang), sau đó loại bỏ LRU"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry = self._entry(key)
+        tmp = os.path.join(self.cache_dir, f".tmp_{key}_{os.getpid()}")
+        os.makedirs(tmp, exist_ok=True)
+        try:
+            for name, values in arrays.items():
+                np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(values))
+            with open(os.path.join(tmp, _META_FILE), 'w', encoding='utf-8') as f:
+                json.dump({'arrays': list(arrays), 'meta': meta or {}, 'created': time.time()}, f)
+            if os.path.exists(entry):  # tiến trình khác vừa ghi cùng khóa
+                shutil.rmtree(tmp)
+            else:
+                os.rename(tmp, entry)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        self.evict(keep=key)
+
+    def entries(self):
+        """Danh sách (khóa, dung lượng byte, lần dùng gần nhất) của các mục hiện có"""
+        result = []
+        if not os.path.isdir(self.cache_dir):
+            return result
+        for key in os.listdir(self.cache_dir):
+            entry = self._entry(key)
+            meta_path = os.path.join(entry, _META_FILE)
+            if key.startswith('.') or not os.path.exists(meta_path):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+            result.append((key, size, os.path.getmtime(meta_path)))
+        return result
+
+    def evict(self, keep=None):
+        """Xóa các mục lâu chưa dùng nhất cho tới khi tổng dung lượng không vượt max_bytes"""
+        entries = sorted(self.entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        removed = []
+        for key, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self._entry(key), ignore_errors=True)
+            total -= size
+            removed.append(key)
+        return removed
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
@@ -0,0 +1,221 @@
+# models/training/fused_export.py
+import argparse
+import glob
+import os
+import pickle
+from datetime import datetime
+import numpy as np
+from train_model import COEF_DIR, MODELS_DIR, get_feature_cols, load_processed_data
+from registry import REGISTRY_PATH, get_run
+from rolling_features import device_code
+
+# Kiểu số nguyên cho hệ số khi xuất dạng fixed-point
+WEIGHT_DTYPES = {'int16': np.int16, 'int32': np.int32}
+# Số bit phần lẻ mặc định của đặc trưng đầu vào (Q15.16 trong int32):
+# đủ cho giá trị tới ±32767, lớn hơn nhiều so với độ ẩm (100) hay day_of_year (366)
+DEFAULT_INPUT_FRAC_BITS = 16
+
+def fuse_coefficients(feature_means, feature_scales, temp_model, hum_model):
+    """
+    Gộp bước chuẩn hóa vào hệ số: coef * (x - mean) / scale = (coef / scale) * x - coef * mean / scale.
+    Trả về (weights dạng (số đặc trưng, 2) cột [temp, hum], bias dạng (2,)) áp dụng trực tiếp trên đặc trưng gốc.
+    """
+    means = np.asarray(feature_means, dtype=np.float64)
+    scales = np.asarray(feature_scales, dtype=np.float64)
+    coefs = np.column_stack([temp_model.coef_, hum_model.coef_]).astype(np.float64)
+    weights = coefs / scales[:, None]
+    bias = np.array([temp_model.intercept_, hum_model.intercept_], dtype=np.float64) - means @ weights
+    return weights, bias
+
+def _max_frac_bits(values, limit):
+    """Số bit phần lẻ lớn nhất để mọi giá trị sau khi nhân 2^bits vẫn không vượt quá limit"""
+    peak = np.max(np.abs(values)) if np.size(values) else 0.0
+    if peak == 0:
+        return 30
+    return int(np.floor(np.log2(limit / peak)))
+
+def quantize(weights, bias, weight_dtype='int16', frac_bits=None,
+             input_frac_bits=DEFAULT_INPUT_FRAC_BITS):
+    """
+    Lượng tử hóa hệ số đã gộp sang fixed-point:
+    weights ở dạng Q(frac_bits) kiểu int16/int32, đặc trưng ở Q(input_frac_bits) kiểu int32,
+    bias ở Q(frac_bits + input_frac_bits) kiểu int64 để cộng thẳng vào bộ tích lũy.
+    frac_bits=None chọn số bit lớn nhất mà hệ số lớn nhất vẫn không tràn.
+    """
+    dtype = WEIGHT_DTYPES[weight_dtype]
+    limit = np.iinfo(dtype).max
+    if frac_bits is None:
+        frac_bits = _max_frac_bits(weights, limit)
+    w_q = np.round(weights * 2.0 ** frac_bits)
+    if np.max(np.abs(w_q)) > limit:
+        raise ValueError(f"Hệ số vượt quá phạm vi {weight_dtype} với Q{frac_bits}, hãy giảm số bit phần lẻ")
+    b_q = np.round(bias * 2.0 ** (frac_bits + input_frac_bits))
+    if np.max(np.abs(b_q)) >= 2.0 ** 62:
+        raise ValueError(f"Bias vượt quá phạm vi int64 với Q{frac_bits + input_frac_bits}")
+    return {
+        'weight_dtype': weight_dtype,
+        'frac_bits': int(frac_bits),
+        'input_frac_bits': int(input_frac_bits),
+        'weights': w_q.astype(dtype),
+        'bias': b_q.astype(np.int64),
+    }
+
+def _round_half_away(values):
+    """Làm tròn giống lroundf() của C (nửa đơn vị làm tròn ra xa 0)"""
+    values = np.asarray(values, dtype=np.float64)
+    return np.sign(values) * np.floor(np.abs(values) + 0.5)
+
+def emulate_fused_float(raw_features, weights, bias):
+    """
+    Mô phỏng vòng lặp float32 của firmware với hệ số đã gộp:
+    acc = bias; acc += w[i] * x[i] theo đúng thứ tự i, mọi phép tính làm tròn về float32
+    (giả sử trình biên dịch không gộp nhân-cộng thành FMA).
+    raw_features: (n, số đặc trưng). Trả về (n, 2) cột [temp, hum].
+    """
+    x = np.asarray(raw_features, dtype=np.float32)
+    w = np.asarray(weights, dtype=np.float32)
+    acc = np.tile(np.asarray(bias, dtype=np.float32), (len(x), 1))
+    for i in range(x.shape[1]):
+        acc = acc + x[:, i:i + 1] * w[i]
+    return acc
+
+def emulate_fused_fixed(raw_features, quantized):
+    """
+    Mô phỏng chính xác từng bit phép tính fixed-point của firmware:
+    x_q = lroundf(x * 2^input_frac_bits) (int32), acc (int64) = bias + Σ w_q * x_q,
+    kết quả = (float)acc * 2^-(frac_bits + input_frac_bits).
+    """
+    x = np.asarray(raw_features, dtype=np.float32)
+    x_q = _round_half_away(x * np.float32(2.0 ** quantized['input_frac_bits'])).astype(np.int64)
+    acc = x_q @ quantized['weights'].astype(np.int64) + quantized['bias']
+    out_scale = np.float32(2.0 ** -(quantized['frac_bits'] + quantized['input_frac_bits']))
+    return acc.astype(np.float32) * out_scale
+
+def _format_ints(values):
+    return ", ".join(str(int(v)) for v in values)
+
+def _format_floats(values):
+    # Ép về float32 trước để literal trong header cho đúng giá trị mà trình mô phỏng dùng
+    return ", ".join(f"{float(v):.9g}f" for v in np.asarray(values, dtype=np.float32))
+
+def write_fused_header(coef_file, weights, bias, feature_cols, n_samples, quantized=None):
+    """
+    Ghi file header với hệ số đã gộp chuẩn hóa, hai mục tiêu xen kẽ trong một mảng:
+    model_weights[2*i] cho nhiệt độ, model_weights[2*i + 1] cho độ ẩm.
+    Firmware nhận biết định dạng qua MODEL_FUSED / MODEL_FIXED_POINT.
+    """
+    interleaved = np.asarray(weights).reshape(-1)  # (p, 2) theo hàng -> [t0, h0, t1, h1, ...]
+    with open(coef_file, 'w', encoding='utf-8') as f:
+        f.write("// Hệ số mô hình dự đoán thời tiết (đã gộp chuẩn hóa)\n")
+        f.write("// Được tạo tự động bởi script fused_export.py\n")
+        f.write(f"// Thời gian: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write(f"// Dựa trên {n_samples} mẫu dữ liệu\n\n")
+
+        f.write("#ifndef MODEL_COEF_H\n")
+        f.write("#define MODEL_COEF_H\n\n")
+        f.write("#include <stdint.h>\n\n")
+
+        f.write("// Dự đoán = model_bias[t] + Σ model_weights[2*i + t] * raw_features[i] (t = 0: nhiệt độ, 1: độ ẩm)\n")
+        f.write("#define MODEL_FUSED 1\n")
+        if quantized is None:
+            f.write("#define MODEL_FIXED_POINT 0\n\n")
+            f.write("const float model_bias[2] = {" + _format_floats(bias) + "};\n")
+            f.write("const float model_weights[] = {" + _format_floats(interleaved) + "};\n\n")
+        else:
+            ctype = 'int16_t' if quantized['weight_dtype'] == 'int16' else 'int32_t'
+            frac, in_frac = quantized['frac_bits'], quantized['input_frac_bits']
+            f.write("#define MODEL_FIXED_POINT 1\n")
+            f.write(f"// Hệ số Q{frac} ({ctype}), đặc trưng Q{in_frac} (int32_t), bias Q{frac + in_frac} (int64_t)\n")
+            f.write(f"#define MODEL_INPUT_SCALE {float(2.0 ** in_frac)!r}f\n")
+            f.write(f"#define MODEL_OUTPUT_SCALE {float(2.0 ** -(frac + in_frac))!r}f\n")
+            f.write(f"const int64_t model_bias[2] = {{{quantized['bias'][0]}LL, {quantized['bias'][1]}LL}};\n")
+            f.write(f"const {ctype} model_weights[] = {{" +
+                    _format_ints(quantized['weights'].reshape(-1)) + "};\n\n")
+
+        f.write("// Thứ tự các đặc trưng\n")
+        f.write("// " + ", ".join(feature_cols) + "\n\n")
+
+        f.write("// Số lượng đặc trưng\n")
+        f.write(f"const int NUM_FEATURES = {len(feature_cols)};\n\n")
+        f.write(device_code(feature_cols))
+
+        f.write("#endif // MODEL_COEF_H\n")
+
+def _latest_model_timestamp():
+    """
+    Timestamp của bộ mô hình mới nhất có đủ temp_model, hum_model và scaler.
+    Tra trong sổ đăng ký; chỉ liệt kê thư mục khi chưa có sổ (các mô hình cũ).
+    """
+    if os.path.exists(REGISTRY_PATH):
+        return get_run('latest', requires=('temp_model', 'hum_model', 'scaler'))['run_id']
+    scalers = sorted(glob.glob(f"{MODELS_DIR}/scaler_*.pkl"))
+    if not scalers:
+        raise FileNotFoundError(f"Không tìm thấy scaler_*.pkl trong {MODELS_DIR}")
+    return os.path.basename(scalers[-1])[len("scaler_"):-len(".pkl")]
+
+def load_model_set(timestamp):
+    """Đọc bộ (temp_model, hum_model, scaler) đã lưu bởi train_models()"""
+    objs = []
+    for name in ['temp_model', 'hum_model', 'scaler']:
+        with open(f"{MODELS_DIR}/{name}_{timestamp}.pkl", 'rb') as f:
+            objs.append(pickle.load(f))
+    return tuple(objs)
+
+def export_fused(timestamp=None, weight_format='float', frac_bits=None,
+                 input_frac_bits=DEFAULT_INPUT_FRAC_BITS, data_format='csv'):
+    """
+    Xuất header đã gộp chuẩn hóa (và tùy chọn lượng tử hóa int16/int32) từ một bộ mô hình đã lưu,
+    rồi so sánh dự đoán mô phỏng của firmware với mô hình sklearn float trên toàn bộ dữ liệu.
+    Trả về (đường dẫn header, dict sai số lớn nhất theo từng mục tiêu).
+    """
+    timestamp = timestamp or _latest_model_timestamp()
+    temp_model, hum_model, scaler = load_model_set(timestamp)
+    df = load_processed_data(data_format)
+    feature_cols = get_feature_cols(df)
+    if len(feature_cols) != scaler.n_features_in_ or len(temp_model.coef_) != scaler.n_features_in_:
+        raise ValueError(f"Bộ mô hình {timestamp} không khớp với {len(feature_cols)} đặc trưng hiện tại "
+                         "(mô hình có chọn đặc trưng hoặc dữ liệu đã thay đổi)")
+
+    weights, bias = fuse_coefficients(scaler.mean_, scaler.scale_, temp_model, hum_model)
+    X = df[feature_cols].values.astype(np.float64)
+    X_scaled = scaler.transform(X)
+    reference = np.column_stack([temp_model.predict(X_scaled), hum_model.predict(X_scaled)])
+
+    quantized = None
+    if weight_format == 'float':
+        emulated = emulate_fused_float(X, weights, bias)
+    else:
+        if np.max(np.abs(X)) * 2.0 ** input_frac_bits >= 2.0 ** 31:
+            raise ValueError(f"Đặc trưng vượt quá phạm vi int32 với Q{input_frac_bits}, hãy giảm --input-frac-bits")
+        quantized = quantize(weights, bias, weight_format, frac_bits, input_frac_bits)
+        emulated = emulate_fused_fixed(X, quantized)
+        print(f"Lượng tử hóa {weight_format}: hệ số Q{quantized['frac_bits']}, "
+              f"đặc trưng Q{quantized['input_frac_bits']}")
+
+    errors = np.abs(emulated.astype(np.float64) - reference)
+    max_error = {'temp': float(errors[:, 0].max()), 'hum': float(errors[:, 1].max())}
+    print(f"Sai số lớn nhất so với mô hình float trên {len(X)} mẫu: "
+          f"nhiệt độ {max_error['temp']:.6f}°C, độ ẩm {max_error['hum']:.6f}%")
+
+    os.makedirs(COEF_DIR, exist_ok=True)
+    suffix = '' if weight_format == 'float' else f"_{weight_format}"
+    coef_file = f"{COEF_DIR}/model_coef_fused{suffix}_{timestamp}.h"
+    write_fused_header(coef_file, weights, bias, feature_cols, len(X), quantized)
+    print(f"Đã lưu hệ số đã gộp vào: {coef_file}")
+    return coef_file, max_error
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Xuất hệ số đã gộp chuẩn hóa (float hoặc fixed-point) cho ESP32")
+    parser.add_argument("--timestamp", default=None,
+                        help="Timestamp của bộ mô hình trong saved_models (mặc định: mới nhất)")
+    parser.add_argument("--format", choices=['float', 'int16', 'int32'], default='float',
+                        help="Kiểu hệ số trong header")
+    parser.add_argument("--frac-bits", type=int, default=None,
+                        help="Số bit phần lẻ của hệ số (mặc định: lớn nhất không tràn)")
+    parser.add_argument("--input-frac-bits", type=int, default=DEFAULT_INPUT_FRAC_BITS,
+                        help="Số bit phần lẻ của đặc trưng đầu vào")
+    parser.add_argument("--data-format", choices=['csv', 'columnar'], default='csv',
+                        help="Định dạng dữ liệu đã xử lý dùng để kiểm tra sai số")
+    args = parser.parse_args()
+
+    export_fused(args.timestamp, args.format, args.frac_bits, args.input_frac_bits, args.data_format)
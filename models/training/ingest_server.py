@@ -0,0 +1,274 @@
+# models/training/ingest_server.py
+import argparse
+import asyncio
+import json
+import math
+import os
+import ssl
+import time
+from datetime import datetime
+from urllib.parse import parse_qsl, urlsplit
+from station_ids import STATION_COLUMN, STATIONS_DIR, station_raw_path
+from timestamps import TIMESTAMP_COLUMN, TIMESTAMP_FORMAT
+
+RAW_DATA_PATH = "../../data/raw/weather_data.csv"
+# Các cột của file thô mà preprocess_data() đọc, theo đúng thứ tự
+RAW_COLUMNS = [TIMESTAMP_COLUMN, 'temp_dht', 'hum_dht', 'temp_api', 'hum_api']
+MISSING_VALUE = "N/A"  # Giống giá trị Google Sheets ghi khi thiết bị không có dữ liệu
+
+DEFAULT_FLUSH_ROWS = 5000        # Ghi xuống đĩa khi bộ đệm đủ số bản ghi này
+DEFAULT_FLUSH_INTERVAL = 2.0     # hoặc sau số giây này
+DEFAULT_MAX_BUFFER = 200000      # Vượt quá thì request phải chờ ghi xong (backpressure)
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+def _format_value(value):
+    """Giá trị số với 2 chữ số thập phân như String(x, 2) của firmware, N/A nếu thiếu hoặc không hữu hạn"""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return MISSING_VALUE
+    if not math.isfinite(value):  # NaN, inf (ví dụ 1e309, "Infinity")
+        return MISSING_VALUE
+    return f"{value:.2f}"
+
+def _format_timestamp(value, received_at):
+    """Timestamp theo TIMESTAMP_FORMAT; nhận chuỗi cùng định dạng, epoch (giây) hoặc dùng thời điểm nhận"""
+    if value is None or value == "":
+        return datetime.fromtimestamp(received_at).strftime(TIMESTAMP_FORMAT)
+    if isinstance(value, (int, float)) or str(value).replace('.', '', 1).isdigit():
+        return datetime.fromtimestamp(float(value)).strftime(TIMESTAMP_FORMAT)
+    return datetime.strptime(str(value), TIMESTAMP_FORMAT).strftime(TIMESTAMP_FORMAT)
+
+def reading_to_line(reading, received_at):
+    """Chuyển một bản ghi (dict) thành một dòng CSV theo RAW_COLUMNS"""
+    fields = [_format_timestamp(reading.get('timestamp', reading.get(TIMESTAMP_COLUMN)), received_at)]
+    fields += [_format_value(reading.get(col)) for col in RAW_COLUMNS[1:]]
+    return ",".join(fields) + "\n"
+
+def station_of(reading):
+    """Mã trạm của bản ghi (trường station_id hoặc station), None nếu thiết bị không gửi"""
+    station = reading.get(STATION_COLUMN, reading.get('station'))
+    return None if station in (None, "") else str(station)
+
+class IngestBuffer:
+    """
+    Bộ đệm trong bộ nhớ cho các dòng CSV đã chuẩn hóa, ghi nối hàng loạt vào file thô.
+    Bản ghi có mã trạm được ghi vào file riêng của trạm trong stations_dir, còn lại ghi vào path.
+    Mỗi lần ghi là một lệnh write với các dòng hoàn chỉnh, nên preprocess_data_incremental()
+    có thể đọc song song mà không gặp dòng dở dang.
+    """
+
+    def __init__(self, path, flush_rows=DEFAULT_FLUSH_ROWS, max_buffer=DEFAULT_MAX_BUFFER,
+                 stations_dir=STATIONS_DIR):
+        self.path = path
+        self.stations_dir = stations_dir
+        self.flush_rows = flush_rows
+        self.max_buffer = max_buffer
+        self.pending = {}  # {đường dẫn file: [các dòng]}
+        self.depth = 0
+        self.lock = asyncio.Lock()
+        self.started = time.monotonic()
+        self.stats = {
+            'requests': 0,
+            'bad_requests': 0,
+            'received_rows': 0,
+            'flushed_rows': 0,
+            'flushes': 0,
+            'max_queue_depth': 0,
+        }
+
+    def path_for(self, station):
+        return self.path if station is None else station_raw_path(station, self.stations_dir)
+
+    async def add(self, lines_by_path):
+        for path, lines in lines_by_path.items():
+            self.pending.setdefault(path, []).extend(lines)
+            self.depth += len(lines)
+            self.stats['received_rows'] += len(lines)
+        self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], self.depth)
+        if self.depth >= self.max_buffer:
+            await self.flush()
+        elif self.depth >= self.flush_rows:
+            asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        async with self.lock:
+            if not self.pending:
+                return
+            pending, self.pending, depth, self.depth = self.pending, {}, self.depth, 0
+            await asyncio.get_running_loop().run_in_executor(None, self._write_all, pending)
+            self.stats['flushed_rows'] += depth
+            self.stats['flushes'] += 1
+
+    def _write_all(self, pending):
+        for path, lines in pending.items():
+            self._write(path, lines)
+
+    def _write(self, path, lines):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        with open(path, 'a+b') as f:
+            if size == 0:
+                lines = [",".join(RAW_COLUMNS) + "\n"] + lines
+            else:
+                # File xuất từ Google Sheets có thể không kết thúc bằng xuống dòng
+                f.seek(size - 1)
+                if f.read(1) != b"\n":
+                    lines = ["\n"] + lines
+            f.write("".join(lines).encode('utf-8'))
+
+    def snapshot(self):
+        """Bộ đếm hiện tại: thông lượng (bản ghi/giây) và độ sâu hàng đợi"""
+        uptime = time.monotonic() - self.started
+        return dict(self.stats,
+                    queue_depth=self.depth,
+                    pending_files=len(self.pending),
+                    uptime_seconds=round(uptime, 3),
+                    rows_per_second=round(self.stats['received_rows'] / uptime, 2) if uptime > 0 else 0.0)
+
+def parse_readings(method, target, body):
+    """
+    Lấy danh sách bản ghi từ một request:
+    - GET ?temp_dht=..&hum_dht=..&temp_api=..&hum_api=.. (giống URL sendToSheets() gửi tới Apps Script)
+    - POST JSON: một object, một mảng object hoặc {"readings": [...]}
+    """
+    if method == 'GET':
+        query = dict(parse_qsl(urlsplit(target).query))
+        return [query] if any(col in query for col in RAW_COLUMNS[1:]) else []
+    payload = json.loads(body.decode('utf-8'))
+    if isinstance(payload, dict):
+        payload = payload.get('readings', [payload])
+    if not isinstance(payload, list) or not all(isinstance(r, dict) for r in payload):
+        raise ValueError("Payload phải là object, mảng object hoặc {\"readings\": [...]}")
+    return payload
+
+def make_ssl_context(certfile, keyfile=None):
+    """
+    SSLContext phía máy chủ cho serve(). Firmware gửi qua WiFiClientSecure tới URL https và gọi
+    setInsecure(), nên chứng chỉ tự ký cũng dùng được.
+    """
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(certfile, keyfile)
+    return context
+
+class IngestServer:
+    """
+    Máy chủ HTTP/1.1 tối giản trên asyncio, giữ kết nối keep-alive cho nhiều thiết bị.
+    Thiết bị kết nối bằng https (WiFiClientSecure) nên cần chạy với TLS (--certfile/--keyfile);
+    không có chứng chỉ thì chỉ nhận http thuần, khi đó scriptUrl trong firmware phải đổi sang http://
+    và WiFiClientSecure sang WiFiClient.
+    """
+
+    def __init__(self, path=RAW_DATA_PATH, flush_rows=DEFAULT_FLUSH_ROWS,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, max_buffer=DEFAULT_MAX_BUFFER,
+                 stations_dir=STATIONS_DIR):
+        self.buffer = IngestBuffer(path, flush_rows, max_buffer, stations_dir)
+        self.flush_interval = flush_interval
+
+    async def _respond(self, writer, status, body, content_type='text/plain', keep_alive=True):
+        data = body.encode('utf-8')
+        reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large'}[status]
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}; charset=utf-8\r\n"
+                     f"Content-Length: {len(data)}\r\n"
+                     f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('ascii') + data)
+        await writer.drain()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, "Payload too large", keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                await self._dispatch(writer, method, target, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, writer, method, target, body, keep_alive):
+        path = urlsplit(target).path
+        if method == 'GET' and path == '/stats':
+            await self._respond(writer, 200, json.dumps(self.buffer.snapshot()),
+                                'application/json', keep_alive)
+            return
+        if method not in ('GET', 'POST'):
+            await self._respond(writer, 404, "Not found", keep_alive=keep_alive)
+            return
+
+        self.buffer.stats['requests'] += 1
+        received_at = time.time()
+        try:
+            lines_by_path = {}
+            readings = parse_readings(method, target, body)
+            for r in readings:
+                path = self.buffer.path_for(station_of(r))
+                lines_by_path.setdefault(path, []).append(reading_to_line(r, received_at))
+        # ValueError gồm cả lỗi JSON, timestamp sai định dạng và mã trạm không hợp lệ;
+        # epoch quá lớn hoặc vô hạn làm datetime.fromtimestamp() báo OverflowError/OSError
+        except (ValueError, OverflowError, OSError) as e:
+            self.buffer.stats['bad_requests'] += 1
+            await self._respond(writer, 400, f"Bad request: {e}", keep_alive=keep_alive)
+            return
+        await self.buffer.add(lines_by_path)
+        # Apps Script trả về văn bản, firmware chỉ kiểm tra HTTP 200
+        await self._respond(writer, 200, f"OK {len(readings)}", keep_alive=keep_alive)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.buffer.flush()
+
+    async def serve(self, host='0.0.0.0', port=8080, ssl_context=None):
+        """Chạy máy chủ; ssl_context (xem make_ssl_context()) để nhận kết nối https"""
+        server = await asyncio.start_server(self._handle, host, port, backlog=4096, ssl=ssl_context)
+        flusher = asyncio.ensure_future(self._flush_periodically())
+        scheme = 'https' if ssl_context is not None else 'http'
+        print(f"Máy chủ nhận dữ liệu đang chạy tại {scheme}://{host}:{port}, ghi vào {self.buffer.path}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            flusher.cancel()
+            await self.buffer.flush()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Máy chủ nhận dữ liệu từ các trạm ESP32 và ghi hàng loạt vào file thô")
+    parser.add_argument("--host", default="0.0.0.0", help="Địa chỉ lắng nghe")
+    parser.add_argument("--port", type=int, default=8080, help="Cổng lắng nghe")
+    parser.add_argument("--output", default=RAW_DATA_PATH, help="File CSV thô để ghi nối")
+    parser.add_argument("--stations-dir", default=STATIONS_DIR,
+                        help=f"Thư mục file thô theo trạm cho bản ghi có {STATION_COLUMN}")
+    parser.add_argument("--flush-rows", type=int, default=DEFAULT_FLUSH_ROWS,
+                        help="Ghi xuống đĩa khi bộ đệm đủ số bản ghi này")
+    parser.add_argument("--flush-interval", type=float, default=DEFAULT_FLUSH_INTERVAL,
+                        help="Khoảng thời gian (giây) giữa các lần ghi định kỳ")
+    parser.add_argument("--certfile", default=None,
+                        help="Chứng chỉ PEM để nhận kết nối https từ firmware (WiFiClientSecure)")
+    parser.add_argument("--keyfile", default=None,
+                        help="Khóa riêng PEM của chứng chỉ (bỏ qua nếu đã nằm trong --certfile)")
+    args = parser.parse_args()
+    if args.keyfile and not args.certfile:
+        parser.error("--keyfile cần đi kèm --certfile")
+    ssl_context = make_ssl_context(args.certfile, args.keyfile) if args.certfile else None
+
+    try:
+        asyncio.run(IngestServer(args.output, args.flush_rows, args.flush_interval,
+                                 stations_dir=args.stations_dir).serve(args.host, args.port, ssl_context))
+    except KeyboardInterrupt:
+        print("Đã dừng máy chủ")
@@ -0,0 +1,135 @@
+# models/training/instrumentation.py
+import cProfile
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Cấu hình dùng chung cho cả tiến trình, đặt bởi configure() / configure_from_args()
+_config = {
+    'quiet': False,         # Bỏ qua các lượt quét chẩn đoán toàn bảng (describe, head, đếm N/A, đếm 0)
+    'metrics_path': None,   # File JSON-lines nhận số liệu của mỗi bước ('-' = stderr)
+    'profile_dir': None,    # Thư mục lưu file .prof của cProfile cho mỗi bước
+    'trace_memory': False,  # Đo bộ nhớ cấp phát đỉnh của mỗi bước bằng tracemalloc
+}
+_stack = []       # Tên các bước đang chạy lồng nhau
+_profiling = []   # Chỉ bước ngoài cùng được cProfile (không lồng profiler)
+_peaks = []       # Đỉnh tracemalloc của mỗi bước đang chạy bị xóa khi bước con gọi reset_peak()
+
+def configure(quiet=False, metrics_path=None, profile_dir=None, trace_memory=False):
+    _config.update(quiet=quiet, metrics_path=metrics_path, profile_dir=profile_dir,
+                   trace_memory=trace_memory)
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def quiet():
+    """True nếu bỏ qua đầu ra chẩn đoán tốn kém"""
+    return _config['quiet']
+
+def _rss_mb():
+    """RSS hiện tại (MB); ngoài Linux dùng RSS đỉnh của tiến trình"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10)
+
+def emit(record):
+    """Ghi một bản ghi số liệu ra file JSON-lines đã cấu hình"""
+    path = _config['metrics_path']
+    if not path:
+        return
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    if path == '-':
+        sys.stderr.write(line)
+        return
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(line)
+
+class Span:
+    """Một bước đang được đo; gán rows_out hoặc thêm trường vào fields bên trong khối with"""
+
+    def __init__(self, name, rows_in=None, fields=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.fields = dict(fields or {})
+
+@contextmanager
+def stage(name, rows_in=None, **fields):
+    """
+    Đo một bước: thời gian, số bản ghi vào/ra, chênh lệch RSS, tùy chọn bộ nhớ cấp phát
+    đỉnh (tracemalloc) và cProfile. Tên đầy đủ gồm cả các bước bao ngoài, ví dụ
+    'preprocess/lag_features'. Bản ghi được phát ra cả khi bước bị lỗi (ok=false).
+    """
+    span = Span(name, rows_in, fields)
+    _stack.append(name)
+    path = "/".join(_stack)
+    profiler = None
+    if _config['profile_dir'] and not _profiling:
+        profiler = cProfile.Profile()
+        _profiling.append(profiler)
+        profiler.enable()
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        # reset_peak() xóa cả đỉnh của các bước bao ngoài: giữ lại để gộp khi kết thúc
+        traced_start, peak_before = tracemalloc.get_traced_memory()
+        if _peaks:
+            _peaks[-1] = max(_peaks[-1], peak_before)
+        tracemalloc.reset_peak()
+        _peaks.append(0)
+    rss_start = _rss_mb()
+    start = time.perf_counter()
+    ok = False
+    try:
+        yield span
+        ok = True
+    finally:
+        seconds = time.perf_counter() - start
+        rss_end = _rss_mb()
+        if profiler is not None:
+            profiler.disable()
+            _profiling.pop()
+            profile_path = os.path.join(_config['profile_dir'], f"{path.replace('/', '.')}_{os.getpid()}.prof")
+            profiler.dump_stats(profile_path)
+        _stack.pop()
+
+        record = {'stage': path, 'ok': ok, 'seconds': round(seconds, 6),
+                  'rows_in': span.rows_in, 'rows_out': span.rows_out,
+                  'rss_mb': round(rss_end, 2), 'rss_delta_mb': round(rss_end - rss_start, 2)}
+        rows = span.rows_in if span.rows_in is not None else span.rows_out
+        if rows and seconds > 0:
+            record['rows_per_second'] = round(rows / seconds, 1)
+        if tracing:
+            _, traced_peak = tracemalloc.get_traced_memory()
+            traced_peak = max(traced_peak, _peaks.pop())
+            if _peaks:
+                _peaks[-1] = max(_peaks[-1], traced_peak)
+            record['traced_peak_mb'] = round((traced_peak - traced_start) / 2 ** 20, 2)
+        if profiler is not None:
+            record['profile'] = profile_path
+        record.update(span.fields)
+        record['time'] = time.time()
+        record['pid'] = os.getpid()
+        emit(record)
+
+def add_arguments(parser):
+    """Thêm các tùy chọn đo lường chung vào argparse parser của một script"""
+    parser.add_argument("--quiet", action="store_true",
+                        help="Bỏ qua các thống kê chẩn đoán quét toàn bộ dữ liệu (describe, head, đếm N/A/0)")
+    parser.add_argument("--metrics", default=None,
+                        help="Ghi số liệu của từng bước dạng JSON-lines vào file này ('-' = stderr)")
+    parser.add_argument("--profile-dir", default=None,
+                        help="Lưu file cProfile (.prof) của từng bước vào thư mục này")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Đo bộ nhớ cấp phát đỉnh của từng bước bằng tracemalloc (chậm hơn)")
+
+def configure_from_args(args):
+    configure(args.quiet, args.metrics, args.profile_dir, args.trace_memory)
@@ -0,0 +1,41 @@
+# models/training/lag_features.py
+import numpy as np
+
+# ESP32 gửi một bản ghi mỗi SEND_INTERVAL = 60 giây, nên 1 "step" lag tương ứng 60 giây
+LAG_STEP_SECONDS = 60
+# Độ lệch tối đa cho phép giữa thời điểm cần tra và bản ghi tìm được (1.5 step,
+# vì thực tế thiết bị thường chỉ gửi được sau 1-2 phút do timeout mạng).
+# Lag vượt qua một khoảng mất dữ liệu dài hơn sẽ là NaN thay vì lấy bản ghi quá cũ.
+LAG_TOLERANCE_SECONDS = 90
+
+def lag_indices(epochs, lag_seconds, tolerance=LAG_TOLERANCE_SECONDS, order=None):
+    """
+    Với mỗi bản ghi tại thời điểm t, tìm bản ghi gần nhất tại hoặc trước
+    t - lag_seconds nhưng không cũ hơn t - lag_seconds - tolerance.
+    Dùng searchsorted trên mảng thời gian đã sắp xếp nên độ phức tạp O(n log n).
+    order: thứ tự sắp xếp ổn định của epochs nếu đã tính sẵn.
+    Trả về chỉ số (theo thứ tự gốc của epochs), -1 nếu không có bản ghi phù hợp.
+    """
+    epochs = np.asarray(epochs, dtype=np.int64)
+    if order is None:
+        order = np.argsort(epochs, kind='stable')
+    sorted_epochs = epochs[order]
+
+    target = epochs - lag_seconds
+    pos = np.searchsorted(sorted_epochs, target, side='right') - 1
+    found = pos >= 0
+    pos_clipped = np.where(found, pos, 0)
+    found &= sorted_epochs[pos_clipped] >= target - tolerance
+
+    return np.where(found, order[pos_clipped], -1)
+
+def time_lag(values, epochs, lag_steps, step=LAG_STEP_SECONDS,
+             tolerance=LAG_TOLERANCE_SECONDS, order=None):
+    """Giá trị của values cách lag_steps * step giây về trước, NaN nếu rơi vào khoảng mất dữ liệu"""
+    idx = lag_indices(epochs, lag_steps * step, tolerance, order)
+    values = np.asarray(values, dtype=np.float64)
+    return np.where(idx >= 0, values[np.maximum(idx, 0)], np.nan)
+
+def history_window(max_lag_steps, step=LAG_STEP_SECONDS, tolerance=LAG_TOLERANCE_SECONDS):
+    """Khoảng thời gian (giây) cần giữ lại phía trước để tính mọi lag tới max_lag_steps"""
+    return max_lag_steps * step + tolerance
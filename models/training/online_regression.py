@@ -0,0 +1,104 @@
+# models/training/online_regression.py
+import numpy as np
+
+class NormalEquations:
+    """
+    Thống kê đủ cho hồi quy tuyến tính (OLS) có chuẩn hóa đặc trưng:
+    số mẫu, tổng X, tổng Y, XᵀX và XᵀY. Chỉ cần cộng thêm các hàng mới để cập nhật,
+    sau đó solve() cho ra đúng hệ số của StandardScaler + LinearRegression huấn
+    luyện lại trên toàn bộ dữ liệu.
+    Các tổng được tính trên X - shift (shift = trung bình của khối đầu tiên) để
+    tránh mất độ chính xác khi giá trị đặc trưng lớn.
+    """
+
+    def __init__(self, n_features, n_targets):
+        self.n = 0
+        self.shift = np.zeros(n_features)
+        self.sum_x = np.zeros(n_features)
+        self.sum_y = np.zeros(n_targets)
+        self.xtx = np.zeros((n_features, n_features))
+        self.xty = np.zeros((n_features, n_targets))
+
+    def update(self, X, Y):
+        """Cộng dồn một khối hàng mới (X: (n, p), Y: (n, m))"""
+        X = np.asarray(X, dtype=np.float64)
+        if len(X) == 0:
+            return self
+        Y = np.asarray(Y, dtype=np.float64).reshape(len(X), -1)
+        if self.n == 0:
+            self.shift = X.mean(axis=0)
+        Xs = X - self.shift
+        self.n += len(X)
+        self.sum_x += Xs.sum(axis=0)
+        self.sum_y += Y.sum(axis=0)
+        self.xtx += Xs.T @ Xs
+        self.xty += Xs.T @ Y
+        return self
+
+    def remove(self, X, Y):
+        """Trừ một khối hàng đã cộng trước đó (dùng cho cửa sổ trượt)"""
+        X = np.asarray(X, dtype=np.float64)
+        if len(X) == 0:
+            return self
+        Y = np.asarray(Y, dtype=np.float64).reshape(len(X), -1)
+        Xs = X - self.shift
+        self.n -= len(X)
+        self.sum_x -= Xs.sum(axis=0)
+        self.sum_y -= Y.sum(axis=0)
+        self.xtx -= Xs.T @ Xs
+        self.xty -= Xs.T @ Y
+        return self
+
+    def scaler_stats(self):
+        """(mean, var) của các đặc trưng, giống StandardScaler (ddof=0)"""
+        mean_s = self.sum_x / self.n
+        var = np.diag(self.xtx) / self.n - mean_s ** 2
+        return mean_s + self.shift, np.maximum(var, 0.0)
+
+    def solve(self):
+        """
+        Trả về (mean, scale, var, coefs, intercepts) với coefs dạng (p, m) áp dụng
+        trên đặc trưng đã chuẩn hóa (x - mean) / scale, giống StandardScaler + LinearRegression.
+        """
+        if self.n == 0:
+            raise ValueError("Chưa có dữ liệu để giải hệ phương trình chuẩn")
+        mean_s = self.sum_x / self.n
+        y_mean = self.sum_y / self.n
+        # Ma trận hiệp phương sai chưa chuẩn hóa sau khi trừ trung bình
+        cxx = self.xtx - self.n * np.outer(mean_s, mean_s)
+        cxy = self.xty - self.n * np.outer(mean_s, y_mean)
+
+        mean, var = self.scaler_stats()
+        scale = np.sqrt(var)
+        scale[scale == 0] = 1.0  # giống StandardScaler với cột hằng số
+
+        # Giải trên không gian đã chuẩn hóa; lstsq cho nghiệm chuẩn nhỏ nhất khi suy biến
+        cxx_scaled = cxx / np.outer(scale, scale)
+        cxy_scaled = cxy / scale[:, None]
+        coefs, _, _, _ = np.linalg.lstsq(cxx_scaled, cxy_scaled, rcond=None)
+        return mean, scale, var, coefs, y_mean
+
+    def predict(self, X):
+        """Dự đoán (n, m) cho X chưa chuẩn hóa bằng nghiệm hiện tại"""
+        mean, scale, _, coefs, intercepts = self.solve()
+        return ((np.asarray(X, dtype=np.float64) - mean) / scale) @ coefs + intercepts
+
+    def save(self, path, **meta):
+        """Lưu trạng thái ra file .npz kèm thông tin bổ sung (danh sách đặc trưng, horizon...)"""
+        np.savez(path, n=self.n, shift=self.shift, sum_x=self.sum_x, sum_y=self.sum_y,
+                 xtx=self.xtx, xty=self.xty,
+                 **{f"meta_{k}": np.asarray(v) for k, v in meta.items()})
+
+    @classmethod
+    def load(cls, path):
+        """Đọc trạng thái đã lưu, trả về (NormalEquations, dict thông tin bổ sung)"""
+        with np.load(path, allow_pickle=False) as data:
+            state = cls(data['xtx'].shape[0], data['xty'].shape[1])
+            state.n = int(data['n'])
+            state.shift = data['shift']
+            state.sum_x = data['sum_x']
+            state.sum_y = data['sum_y']
+            state.xtx = data['xtx']
+            state.xty = data['xty']
+            meta = {k[len("meta_"):]: data[k] for k in data.files if k.startswith("meta_")}
+        return state, meta
@@ -0,0 +1,158 @@
+# models/training/predictor.py
+# Dự đoán chỉ dùng NumPy: không import scikit-learn, pandas hay matplotlib để khởi động nhanh
+# (ví dụ trong các worker serverless tồn tại ngắn).
+import argparse
+import glob
+import os
+import numpy as np
+from registry import artifact_path, get_run
+
+MODELS_DIR = "../saved_models"
+COEF_DIR = "../coefficients"
+ARTIFACT_VERSION = 1
+
+def save_artifact(path, feature_means, feature_scales, coefs, intercepts, feature_cols,
+                  targets, horizons, n_samples):
+    """
+    Ghi file hệ số gọn (.npz, không dùng pickle) cho Predictor.
+    coefs: (số đặc trưng, số mục tiêu) trên dữ liệu đã chuẩn hóa, intercepts: (số mục tiêu,).
+    targets/horizons: tên cột mục tiêu và số bản ghi dự đoán trước của từng cột hệ số.
+    """
+    coefs = np.asarray(coefs, dtype=np.float64).reshape(len(feature_cols), -1)
+    np.savez(path,
+             version=np.int64(ARTIFACT_VERSION),
+             feature_cols=np.array(feature_cols, dtype=str),
+             targets=np.array(targets, dtype=str),
+             horizons=np.asarray(horizons, dtype=np.int64),
+             feature_means=np.asarray(feature_means, dtype=np.float64),
+             feature_scales=np.asarray(feature_scales, dtype=np.float64),
+             coefs=coefs,
+             intercepts=np.asarray(intercepts, dtype=np.float64).reshape(-1),
+             n_samples=np.int64(n_samples))
+    return path
+
+class Predictor:
+    """
+    Mô hình tuyến tính đã gộp chuẩn hóa vào hệ số: predict(X) = X @ weights + bias,
+    cho kết quả giống StandardScaler + LinearRegression của train_models().
+    """
+
+    def __init__(self, feature_means, feature_scales, coefs, intercepts, feature_cols,
+                 targets, horizons, n_samples=0):
+        self.feature_cols = list(feature_cols)
+        self.targets = list(targets)
+        self.horizons = [int(h) for h in horizons]
+        self.n_samples = int(n_samples)
+        coefs = np.asarray(coefs, dtype=np.float64)
+        means = np.asarray(feature_means, dtype=np.float64)
+        scales = np.asarray(feature_scales, dtype=np.float64)
+        self.weights = coefs / scales[:, None]
+        self.bias = np.asarray(intercepts, dtype=np.float64) - means @ self.weights
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            if int(data['version']) > ARTIFACT_VERSION:
+                raise ValueError(f"{path} có phiên bản {int(data['version'])}, "
+                                 f"predictor chỉ hỗ trợ tới {ARTIFACT_VERSION}")
+            return cls(data['feature_means'], data['feature_scales'], data['coefs'],
+                       data['intercepts'], data['feature_cols'].tolist(), data['targets'].tolist(),
+                       data['horizons'], data['n_samples'])
+
+    def _matrix(self, X):
+        """Mảng (n, số đặc trưng) theo thứ tự feature_cols; nhận mảng, dict cột hoặc DataFrame"""
+        if hasattr(X, 'keys'):
+            missing = [col for col in self.feature_cols if col not in X]
+            if missing:
+                raise ValueError(f"Thiếu đặc trưng: {missing}")
+            return np.column_stack([np.asarray(X[col], dtype=np.float64).reshape(-1)
+                                    for col in self.feature_cols])
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != len(self.feature_cols):
+            raise ValueError(f"Cần {len(self.feature_cols)} đặc trưng, nhận được {X.shape[1]}")
+        return X
+
+    def predict(self, X):
+        """Dự đoán cả lô: trả về mảng (n, số mục tiêu) theo thứ tự self.targets"""
+        return self._matrix(X) @ self.weights + self.bias
+
+def find_artifact(models_dir=MODELS_DIR, which='pinned'):
+    """
+    File hệ số của lần huấn luyện which ('pinned', 'latest' hoặc run_id) theo sổ đăng ký
+    trong models_dir; nếu chưa có sổ thì lấy file model_*.npz mới nhất.
+    """
+    registry_path = os.path.join(models_dir, "registry.json")
+    if os.path.exists(registry_path):
+        return artifact_path(get_run(which, registry_path, requires=('predictor',)), 'predictor', registry_path)
+    paths = sorted(glob.glob(os.path.join(models_dir, "model_[0-9]*.npz")))
+    if not paths:
+        raise FileNotFoundError(f"Không tìm thấy model_*.npz trong {models_dir}")
+    return paths[-1]
+
+def load_predictor(path=None, models_dir=MODELS_DIR, which='pinned'):
+    """Đọc Predictor từ path hoặc từ lần huấn luyện which trong models_dir"""
+    return Predictor.load(path or find_artifact(models_dir, which))
+
+def _header_feature_cols(coef_file):
+    """Thứ tự đặc trưng ghi trong dòng chú thích của header model_coef_*.h"""
+    with open(coef_file, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    for i, line in enumerate(lines[:-1]):
+        if line.startswith("// Thứ tự các đặc trưng"):
+            return [col.strip() for col in lines[i + 1].lstrip('/ ').split(',') if col.strip()]
+    raise ValueError(f"{coef_file} không ghi thứ tự đặc trưng")
+
+def convert_model_set(timestamp, prediction_horizon=6):
+    """
+    Tạo file hệ số từ bộ temp_model/hum_model/scaler .pkl cũ (cần scikit-learn để đọc pickle).
+    Chỉ dùng một lần cho các mô hình được huấn luyện trước khi có file .npz.
+    """
+    from fused_export import load_model_set
+    temp_model, hum_model, scaler = load_model_set(timestamp)
+    if len(temp_model.coef_) != scaler.n_features_in_:
+        raise ValueError(f"Bộ mô hình {timestamp} có chọn đặc trưng, không rõ thứ tự đặc trưng")
+    feature_cols = _header_feature_cols(os.path.join(COEF_DIR, f"model_coef_{timestamp}.h"))
+    if len(feature_cols) != len(temp_model.coef_):
+        raise ValueError(f"Thứ tự đặc trưng trong header không khớp với bộ mô hình {timestamp}")
+    path = os.path.join(MODELS_DIR, f"model_{timestamp}.npz")
+    return save_artifact(path, scaler.mean_, scaler.scale_,
+                         np.column_stack([temp_model.coef_, hum_model.coef_]),
+                         [temp_model.intercept_, hum_model.intercept_], list(feature_cols),
+                         ['temp_dht', 'hum_dht'], [prediction_horizon] * 2, scaler.n_samples_seen_)
+
+def _read_csv_columns(path, columns):
+    """Đọc các cột số từ file CSV đã xử lý chỉ bằng NumPy"""
+    with open(path, encoding='utf-8') as f:
+        header = f.readline().strip().split(',')
+    missing = [col for col in columns if col not in header]
+    if missing:
+        raise ValueError(f"{path} thiếu các cột: {missing}")
+    usecols = [header.index(col) for col in columns]
+    return np.loadtxt(path, delimiter=',', skiprows=1, usecols=usecols, ndmin=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dự đoán bằng file hệ số gọn (chỉ cần NumPy)")
+    parser.add_argument("--model", default=None,
+                        help="File model_*.npz (mặc định: theo --run trong sổ đăng ký)")
+    parser.add_argument("--run", default="pinned",
+                        help="Lần huấn luyện trong sổ đăng ký: pinned (mặc định), latest hoặc run_id")
+    parser.add_argument("--data", default="../../data/processed/processed_data.csv",
+                        help="File CSV đã xử lý cần dự đoán")
+    parser.add_argument("--output", default=None, help="Lưu dự đoán ra file CSV")
+    parser.add_argument("--convert", default=None, metavar="TIMESTAMP",
+                        help="Tạo file .npz từ bộ .pkl cũ có timestamp này rồi thoát")
+    args = parser.parse_args()
+
+    if args.convert:
+        print(f"Đã lưu file hệ số vào: {convert_model_set(args.convert)}")
+    else:
+        predictor = load_predictor(args.model, which=args.run)
+        predictions = predictor.predict(_read_csv_columns(args.data, predictor.feature_cols))
+        print(f"Đã dự đoán {len(predictions)} mẫu cho {predictor.targets}")
+        if args.output:
+            np.savetxt(args.output, predictions, delimiter=',', fmt='%.6f',
+                       header=",".join(f"{t}_h{h}" for t, h in zip(predictor.targets, predictor.horizons)),
+                       comments='')
+            print(f"Đã lưu dự đoán vào: {args.output}")
@@ -2,117 +2,631 @@
 import pandas as pd
 import numpy as np
 import os
+import io
+import itertools
+import json
+import argparse
 from datetime import datetime
+from running_stats import RunningStats
+from columnar_store import ColumnarWriter, columnar_rows
+from timestamps import EPOCH_COLUMN, NAT_EPOCH, add_epoch_column, time_features
+from lag_features import LAG_STEP_SECONDS, LAG_TOLERANCE_SECONDS, lag_indices, history_window
+from resample import AGGREGATIONS, GAP_COLUMN, Resampler
+from rolling_features import RollingFeatures
+from instrumentation import add_arguments, configure_from_args, quiet, stage
 
 # Đường dẫn đến file dữ liệu
 DATA_PATH = "../../data/raw/weather_data.csv"  # Điều chỉnh đường dẫn nếu cần
 PROCESSED_PATH = "../../data/processed/processed_data.csv"
+STATS_PATH = "../../data/processed/outlier_stats.json"  # Thống kê dùng để cắt ngoại lệ
+CHECKPOINT_PATH = "../../data/processed/preprocess_checkpoint.json"  # Vị trí đã xử lý trong file thô
+COLUMNAR_PATH = "../../data/processed/processed_data_columnar"  # Kho cột float32 (memory-map)
 
-def preprocess_data():
+# Các cột quan trọng và các cột dùng để tạo đặc trưng lag
+IMPORTANT_COLS = ['temp_dht', 'hum_dht', 'temp_api', 'hum_api']
+LAG_COLS = ['temp_dht', 'hum_dht']
+MAX_LAG = 3  # Lag xa nhất (lag3 = 3 step về trước)
+OUTLIER_SIGMA = 3  # Cắt giá trị nằm ngoài trung bình ± OUTLIER_SIGMA độ lệch chuẩn
+
+# Kích thước chunk mặc định cho chế độ streaming
+DEFAULT_CHUNKSIZE = 100000
+
+def _drop_invalid_rows(df):
+    """
+    Xóa các bản ghi có giá trị 0 hoặc N/A trong các cột quan trọng, sau đó chuyển
+    Timestamp sang cột epoch và xóa các bản ghi có thời gian không hợp lệ.
+    """
+    for col in IMPORTANT_COLS:
+        if col in df.columns:
+            df = df[df[col] != 0]
+    df = add_epoch_column(df.dropna())
+    if EPOCH_COLUMN in df.columns:
+        df = df[df[EPOCH_COLUMN] != NAT_EPOCH]
+    return df
+
+def _add_time_features(df):
+    """
+    Thêm các đặc trưng thời gian từ cột epoch. Các cột này được thêm sau cùng để
+    thứ tự 10 đặc trưng đầu tiên trên ESP32 không thay đổi.
+    """
+    if EPOCH_COLUMN in df.columns:
+        for name, values in time_features(df[EPOCH_COLUMN].values).items():
+            df[name] = values
+    return df
+
+def _clip_outliers(df, bounds):
+    """Cắt các giá trị nằm ngoài khoảng (lower, upper) của từng cột, trả về số giá trị bị cắt"""
+    outlier_counts = {}
+    for col, (lower, upper) in bounds.items():
+        if col in df.columns:
+            outlier_counts[col] = int(((df[col] < lower) | (df[col] > upper)).sum())
+            df[col] = df[col].clip(lower, upper)
+    return outlier_counts
+
+def _add_lag_features(df, tail=None, step=LAG_STEP_SECONDS, tolerance=LAG_TOLERANCE_SECONDS):
+    """
+    Thêm đặc trưng lag và biến thiên, căn theo thời gian thay vì theo số dòng:
+    lag1/lag3 là giá trị cách 1/3 step (step giây) về trước, NaN nếu thời điểm đó
+    rơi vào khoảng mất dữ liệu dài hơn tolerance giây.
+    tail: các bản ghi cuối của chunk trước (đã lọc và cắt ngoại lệ) nằm trong
+    history_window() để lag ở đầu chunk hiện tại giống hệt khi xử lý trong bộ nhớ.
+    Trả về (df, tail mới).
+    """
+    lag_cols = [col for col in LAG_COLS if col in df.columns]
+    keep = [EPOCH_COLUMN] + lag_cols
+    n_tail = 0
+    if tail is not None and len(tail) > 0:
+        n_tail = len(tail)
+        combined = pd.concat([tail[keep], df[keep]], ignore_index=True)
+    else:
+        combined = df[keep]
+
+    epochs = combined[EPOCH_COLUMN].values.astype(np.int64)
+    order = np.argsort(epochs, kind='stable')
+    lag_idx = {lag: lag_indices(epochs, lag * step, tolerance, order)[n_tail:]
+               for lag in (1, MAX_LAG)}
+
+    for col in lag_cols:
+        values = combined[col].values.astype(np.float64)
+        for lag, idx in lag_idx.items():
+            # Giá trị trước đó 1 step / MAX_LAG step
+            df[f'{col}_lag{lag}'] = np.where(idx >= 0, values[np.maximum(idx, 0)], np.nan)
+
+    for col in lag_cols:
+        df[f'{col}_diff'] = df[col] - df[f'{col}_lag1']  # Sự thay đổi
+
+    if len(epochs) == 0:
+        return df, tail
+    window = history_window(MAX_LAG, step, tolerance)
+    return df, combined[epochs >= epochs.max() - window].copy()
+
+def _add_dht_api_diff(df):
+    """Thêm đặc trưng chênh lệch giữa DHT và API"""
+    if 'temp_dht' in df.columns and 'temp_api' in df.columns:
+        df['temp_diff_dht_api'] = df['temp_dht'] - df['temp_api']
+    if 'hum_dht' in df.columns and 'hum_api' in df.columns:
+        df['hum_diff_dht_api'] = df['hum_dht'] - df['hum_api']
+    return df
+
+def _source_signature(data_path):
+    """Kích thước và thời điểm sửa đổi của file dữ liệu thô, dùng để nhận biết dữ liệu đã thay đổi"""
+    st = os.stat(data_path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+def _load_cached_stats(data_path, stats_path):
+    """Đọc thống kê ngoại lệ đã lưu nếu được tính từ đúng phiên bản file dữ liệu hiện tại"""
+    if not os.path.exists(stats_path):
+        return None
+    stats, meta = RunningStats.load(stats_path)
+    if meta.get('source') != _source_signature(data_path):
+        return None
+    return stats
+
+class _BoundedReader(io.RawIOBase):
+    """Đọc file nhị phân từ vị trí hiện tại tới tối đa `limit` byte"""
+
+    def __init__(self, f, limit):
+        self._f = f
+        self._remaining = limit
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._remaining <= 0:
+            return 0
+        view = memoryview(buffer)[:min(len(buffer), self._remaining)]
+        n = self._f.readinto(view)
+        self._remaining -= n
+        return n
+
+def _complete_lines_end(data_path):
+    """
+    Vị trí byte ngay sau ký tự xuống dòng cuối cùng của file.
+    Dòng cuối chưa ghi xong (thiết bị đang ghi nối) sẽ được để lại cho lần chạy sau.
+    """
+    size = os.path.getsize(data_path)
+    with open(data_path, 'rb') as f:
+        pos = size
+        while pos > 0:
+            block = min(65536, pos)
+            f.seek(pos - block)
+            data = f.read(block)
+            idx = data.rfind(b'\n')
+            if idx >= 0:
+                return pos - block + idx + 1
+            pos -= block
+    return 0
+
+def _read_raw_chunks(data_path, chunksize, start=0, end=None, names=None, **read_kwargs):
+    """
+    Đọc file dữ liệu thô theo chunk trong khoảng byte [start, end).
+    Khi start > 0 (đọc tiếp từ checkpoint) phải truyền names vì không còn dòng tiêu đề.
+    read_kwargs: tham số thêm cho pd.read_csv (ví dụ dtype, usecols).
+    """
+    if end is None:
+        end = _complete_lines_end(data_path)
+    with open(data_path, 'rb') as f:
+        f.seek(start)
+        stream = io.TextIOWrapper(io.BufferedReader(_BoundedReader(f, end - start)),
+                                  encoding='utf-8', newline='')
+        if names is None:
+            reader = pd.read_csv(stream, chunksize=chunksize, **read_kwargs)
+        else:
+            reader = pd.read_csv(stream, chunksize=chunksize, header=None, names=names, **read_kwargs)
+        try:
+            for chunk in reader:
+                yield chunk
+        except pd.errors.EmptyDataError:
+            return
+
+def _raw_header(data_path):
+    """Danh sách cột trong dòng tiêu đề của file dữ liệu thô"""
+    with open(data_path, 'r', encoding='utf-8') as f:
+        return f.readline().strip().split(',')
+
+def _compute_outlier_stats_streaming(chunks):
+    """Lượt 1 của chế độ streaming: cộng dồn thống kê Welford qua từng chunk"""
+    stats = None
+    for chunk in chunks:
+        chunk = _drop_invalid_rows(chunk)
+        if stats is None:
+            stats = RunningStats([col for col in IMPORTANT_COLS if col in chunk.columns])
+        stats.update(chunk[stats.columns].values)
+    return stats if stats is not None else RunningStats(IMPORTANT_COLS)
+
+def _process_chunks(chunks, bounds, tail, processed_path, append, columnar_writer=None,
+                    lag_step=LAG_STEP_SECONDS, lag_tolerance=LAG_TOLERANCE_SECONDS, resampler=None,
+                    rolling=None, flush=True):
+    """
+    Lượt 2: lọc, cắt ngoại lệ, (tùy chọn) resample, tạo đặc trưng cho từng chunk và ghi nối
+    vào processed_path (và vào kho cột nếu có columnar_writer).
+    resampler: Resampler giữ bucket cuối của mỗi chunk sang chunk sau; bucket cuối cùng
+    được xử lý sau chunk cuối nếu flush, ngược lại vẫn nằm trong resampler.pending.
+    rolling: RollingFeatures (giữ các giá trị cuối của chunk trước) để thêm đặc trưng cửa sổ trượt.
+    Trả về (số bản ghi đọc, số bản ghi ghi, tail cuối cùng, số ngoại lệ theo cột, timestamp cuối).
+    """
+    rows_in = 0
+    rows_out = 0
+    last_timestamp = None
+    outliers_total = {col: 0 for col in bounds}
+    first_chunk = not append
+
+    for chunk in itertools.chain(chunks, [None]):
+        if chunk is None:
+            if resampler is None or not flush:
+                break
+            chunk = resampler.flush()
+            if len(chunk) == 0:
+                break
+        else:
+            rows_in += len(chunk)
+            chunk = _drop_invalid_rows(chunk)
+
+            for col, count in _clip_outliers(chunk, bounds).items():
+                outliers_total[col] += count
+
+            if resampler is not None:
+                chunk = resampler.push(chunk)
+
+        chunk, tail = _add_lag_features(chunk, tail, lag_step, lag_tolerance)
+        chunk = _add_dht_api_diff(chunk)
+        chunk = _add_time_features(chunk)
+        if rolling:
+            chunk = rolling.transform(chunk)
+        chunk = chunk.dropna()
+
+        chunk.to_csv(processed_path, mode='w' if first_chunk else 'a',
+                     header=first_chunk, index=False)
+        if columnar_writer is not None:
+            columnar_writer.append(chunk)
+        first_chunk = False
+        rows_out += len(chunk)
+        if len(chunk) > 0 and 'Timestamp' in chunk.columns:
+            last_timestamp = str(chunk['Timestamp'].iloc[-1])
+
+    return rows_in, rows_out, tail, outliers_total, last_timestamp
+
+def _save_checkpoint(checkpoint_path, data_path, offset, columns, tail, last_timestamp, rows,
+                     lag_step, lag_tolerance, resampler=None, rolling=None):
+    """
+    Lưu vị trí đã xử lý trong file thô cùng các bản ghi cuối cần để tính lag cho lần sau
+    (và bucket resample cuối cùng đã ghi, các bản ghi của bucket còn đang mở, trạng thái đặc trưng
+    cửa sổ trượt nếu có).
+    """
+    checkpoint = {
+        'data_path': os.path.abspath(data_path),
+        'offset': offset,
+        'columns': columns,
+        'rows': rows,
+        'lag_step': lag_step,
+        'lag_tolerance': lag_tolerance,
+        'resample': resampler.config() if resampler is not None else None,
+        'last_bucket': resampler.last_bucket if resampler is not None else None,
+        'pending': None if resampler is None or resampler.pending is None
+        else resampler.pending.to_dict(orient='list'),
+        'rolling': rolling.config() if rolling else None,
+        'rolling_state': rolling.state() if rolling else None,
+        'last_timestamp': last_timestamp,
+        'tail': None if tail is None else tail.to_dict(orient='list'),
+    }
+    tmp_path = checkpoint_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, checkpoint_path)
+
+def _load_checkpoint(checkpoint_path, data_path, processed_path, lag_step, lag_tolerance,
+                     resample_config=None, rolling_config=None):
+    """
+    Đọc checkpoint nếu còn dùng được: cùng file thô, cùng tiêu đề, cùng cấu hình lag,
+    resample và đặc trưng cửa sổ trượt, file thô không bị cắt ngắn.
+    """
+    if not os.path.exists(checkpoint_path) or not os.path.exists(processed_path):
+        return None
+    with open(checkpoint_path, 'r', encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('data_path') != os.path.abspath(data_path):
+        return None
+    if checkpoint.get('columns') != _raw_header(data_path):
+        return None
+    if checkpoint.get('offset', 0) > os.path.getsize(data_path):
+        return None
+    if (checkpoint.get('lag_step'), checkpoint.get('lag_tolerance')) != (lag_step, lag_tolerance):
+        return None
+    if checkpoint.get('resample') != resample_config:
+        return None
+    if checkpoint.get('rolling') != rolling_config:
+        return None
+    if checkpoint.get('tail') is not None:
+        checkpoint['tail'] = pd.DataFrame(checkpoint['tail'])
+    if checkpoint.get('pending') is not None:
+        checkpoint['pending'] = pd.DataFrame(checkpoint['pending'])
+    return checkpoint
+
+def _resampled_lag_params(lag_step, lag_tolerance, resample_seconds):
+    """
+    Sau khi resample mỗi bản ghi cách nhau resample_seconds giây, nên 1 step lag phải bằng đúng
+    nhịp này (sai lệch cho phép được nhân theo cùng tỉ lệ); nếu không, với nhịp từ 180 giây
+    trở lên mọi cột lag đều NaN và dropna() xóa hết dữ liệu.
+    """
+    if not resample_seconds or lag_step == resample_seconds:
+        return lag_step, lag_tolerance
+    return resample_seconds, round(lag_tolerance * resample_seconds / lag_step)
+
+def preprocess_data_streaming(data_path=DATA_PATH, processed_path=PROCESSED_PATH,
+                              chunksize=DEFAULT_CHUNKSIZE, stats_path=STATS_PATH,
+                              checkpoint_path=CHECKPOINT_PATH, columnar_path=None,
+                              lag_step=LAG_STEP_SECONDS, lag_tolerance=LAG_TOLERANCE_SECONDS,
+                              resample_seconds=None, resample_how='mean',
+                              rolling_windows=None, ewm_spans=None):
+    """
+    Xử lý dữ liệu theo từng chunk để bộ nhớ không phụ thuộc kích thước file.
+    Lượt 1 tính giới hạn ngoại lệ (3 độ lệch chuẩn) - bỏ qua nếu thống kê đã lưu
+    còn khớp với file dữ liệu, lượt 2 lọc, cắt ngoại lệ, tạo đặc trưng và ghi nối
+    vào file kết quả. Các bản ghi cuối của mỗi chunk (trong history_window) được
+    giữ lại để các cột lag/diff giống hệt chế độ xử lý trong bộ nhớ. Cuối cùng lưu checkpoint để
+    preprocess_data_incremental() có thể xử lý tiếp phần dữ liệu mới.
+    columnar_path: nếu khác None, ghi thêm kết quả vào kho cột tại đường dẫn này.
+    resample_seconds: nếu khác None, đưa dữ liệu về nhịp cố định này trước khi tạo lag (xem Resampler).
+    rolling_windows, ewm_spans: độ dài cửa sổ (số bản ghi) và span EWMA của đặc trưng cửa sổ trượt.
+    """
+    os.makedirs(os.path.dirname(processed_path), exist_ok=True)
+    lag_step, lag_tolerance = _resampled_lag_params(lag_step, lag_tolerance, resample_seconds)
+    # Xử lý toàn bộ file (kể cả dòng cuối không có ký tự xuống dòng) giống chế độ trong bộ nhớ
+    end = os.path.getsize(data_path)
+
+    print(f"Đang đọc dữ liệu từ {data_path} theo chunk {chunksize} bản ghi...")
+    stats = _load_cached_stats(data_path, stats_path)
+    if stats is not None:
+        print(f"Sử dụng lại thống kê ngoại lệ đã lưu tại {stats_path}")
+    else:
+        stats = _compute_outlier_stats_streaming(
+            _read_raw_chunks(data_path, chunksize, end=end))
+        stats.save(stats_path, source=_source_signature(data_path))
+    bounds = stats.clip_bounds(OUTLIER_SIGMA)
+    for col, (lower, upper) in bounds.items():
+        print(f"Giới hạn ngoại lệ cột {col}: [{lower:.4f}, {upper:.4f}]")
+
+    columnar_writer = ColumnarWriter(columnar_path, mode='w') if columnar_path else None
+    resampler = Resampler(resample_seconds, resample_how) if resample_seconds else None
+    rolling = RollingFeatures(rolling_windows or (), ewm_spans or ())
+    rows_in, rows_out, tail, outliers_total, last_timestamp = _process_chunks(
+        _read_raw_chunks(data_path, chunksize, end=end), bounds, None,
+        processed_path, append=False, columnar_writer=columnar_writer,
+        lag_step=lag_step, lag_tolerance=lag_tolerance, resampler=resampler, rolling=rolling)
+    _save_checkpoint(checkpoint_path, data_path, end, _raw_header(data_path),
+                     tail, last_timestamp, rows_out, lag_step, lag_tolerance, resampler, rolling)
+
+    for col, count in outliers_total.items():
+        print(f"Đã xử lý {count} giá trị ngoại lệ cho cột {col}")
+    if resampler is not None:
+        print(f"Đã resample về nhịp {resampler.cadence}s ({resampler.how})")
+    print(f"Đã lưu dữ liệu đã xử lý vào {processed_path}")
+    if columnar_path:
+        print(f"Đã lưu kho cột vào {columnar_path}")
+    print(f"Đã đọc {rows_in} bản ghi, số bản ghi cuối cùng: {rows_out}")
+
+    return rows_out
+
+def preprocess_data_incremental(data_path=DATA_PATH, processed_path=PROCESSED_PATH,
+                                chunksize=DEFAULT_CHUNKSIZE, stats_path=STATS_PATH,
+                                checkpoint_path=CHECKPOINT_PATH, columnar_path=None,
+                                lag_step=LAG_STEP_SECONDS, lag_tolerance=LAG_TOLERANCE_SECONDS,
+                                resample_seconds=None, resample_how='mean',
+                                rolling_windows=None, ewm_spans=None):
+    """
+    Chỉ xử lý các bản ghi được ghi nối vào file thô sau lần chạy trước.
+    Đọc tiếp từ vị trí byte trong checkpoint, dùng tail đã lưu để tính lag và
+    gộp thống kê của phần dữ liệu mới vào thống kê ngoại lệ đã lưu. Các bản ghi
+    cũ giữ nguyên giới hạn ngoại lệ tại thời điểm chúng được xử lý.
+    Khi resample, bucket cuối chưa được ghi mà lưu trong checkpoint để gộp với các bản ghi đến
+    sau; chỉ bản ghi đến muộn thuộc bucket đã ghi ở lần trước mới bị bỏ qua.
+    Nếu chưa có checkpoint hợp lệ thì xử lý lại toàn bộ bằng chế độ streaming.
+    Trả về số bản ghi mới đã ghi.
+    """
+    lag_step, lag_tolerance = _resampled_lag_params(lag_step, lag_tolerance, resample_seconds)
+    resampler = Resampler(resample_seconds, resample_how) if resample_seconds else None
+    rolling = RollingFeatures(rolling_windows or (), ewm_spans or ())
+    checkpoint = _load_checkpoint(checkpoint_path, data_path, processed_path, lag_step, lag_tolerance,
+                                  resampler.config() if resampler is not None else None,
+                                  rolling.config() if rolling else None)
+    stats = None
+    if checkpoint is not None and os.path.exists(stats_path):
+        stats, _ = RunningStats.load(stats_path)
+    # Kho cột phải chứa đúng các bản ghi đã ghi vào CSV thì mới ghi nối tiếp được
+    if columnar_path and checkpoint is not None \
+            and columnar_rows(columnar_path) != checkpoint.get('rows'):
+        checkpoint = None
+    if checkpoint is None or stats is None:
+        print("Không có checkpoint hợp lệ, xử lý lại toàn bộ dữ liệu...")
+        return preprocess_data_streaming(data_path, processed_path, chunksize,
+                                         stats_path, checkpoint_path, columnar_path,
+                                         lag_step, lag_tolerance, resample_seconds, resample_how,
+                                         rolling_windows, ewm_spans)
+
+    start = checkpoint['offset']
+    end = _complete_lines_end(data_path)
+    if end <= start:
+        print("Không có dữ liệu mới kể từ lần xử lý trước")
+        return 0
+
+    print(f"Đang xử lý dữ liệu mới từ byte {start} đến {end} của {data_path}...")
+    columns = checkpoint['columns']
+    stats.merge(_compute_outlier_stats_streaming(
+        _read_raw_chunks(data_path, chunksize, start, end, names=columns)))
+    stats.save(stats_path, source=_source_signature(data_path))
+    bounds = stats.clip_bounds(OUTLIER_SIGMA)
+
+    columnar_writer = ColumnarWriter(columnar_path, mode='a') if columnar_path else None
+    if resampler is not None:
+        resampler.last_bucket = checkpoint.get('last_bucket')
+        resampler.pending = checkpoint.get('pending')
+    if rolling:
+        rolling = RollingFeatures.from_state(checkpoint['rolling'], checkpoint.get('rolling_state'))
+    rows_in, rows_out, tail, outliers_total, last_timestamp = _process_chunks(
+        _read_raw_chunks(data_path, chunksize, start, end, names=columns),
+        bounds, checkpoint['tail'], processed_path, append=True,
+        columnar_writer=columnar_writer, lag_step=lag_step, lag_tolerance=lag_tolerance,
+        resampler=resampler, rolling=rolling, flush=False)
+    _save_checkpoint(checkpoint_path, data_path, end, columns, tail,
+                     last_timestamp or checkpoint.get('last_timestamp'),
+                     checkpoint.get('rows', 0) + rows_out, lag_step, lag_tolerance, resampler, rolling)
+
+    for col, count in outliers_total.items():
+        print(f"Đã xử lý {count} giá trị ngoại lệ cho cột {col}")
+    if resampler is not None and resampler.late_rows:
+        print(f"Bỏ qua {resampler.late_rows} bản ghi thuộc các bucket đã ghi ở lần trước")
+    print(f"Đã đọc {rows_in} bản ghi mới, ghi thêm {rows_out} bản ghi vào {processed_path}")
+
+    return rows_out
+
+def preprocess_data(chunksize=None, incremental=False, columnar=False,
+                    lag_step=LAG_STEP_SECONDS, lag_tolerance=LAG_TOLERANCE_SECONDS,
+                    resample_seconds=None, resample_how='mean', rolling_windows=None, ewm_spans=None):
+    """
+    Tiền xử lý dữ liệu thô.
+    chunksize: nếu khác None, xử lý theo chế độ streaming (xem preprocess_data_streaming)
+    và trả về số bản ghi đã ghi thay vì DataFrame.
+    incremental: chỉ xử lý các bản ghi mới kể từ checkpoint (xem preprocess_data_incremental).
+    columnar: ghi thêm kết quả vào kho cột float32 tại COLUMNAR_PATH cho train_models().
+    lag_step, lag_tolerance: số giây của 1 step lag và sai lệch thời gian cho phép.
+    resample_seconds: đưa dữ liệu về nhịp cố định (ví dụ 60 giây) sau khi cắt ngoại lệ và trước
+    khi tạo lag, gộp các bản ghi cùng khoảng bằng resample_how ('mean' hoặc 'last'); khi đó
+    prediction_horizon của train_models() tính theo đơn vị resample_seconds giây và 1 step lag
+    bằng resample_seconds (lag_tolerance được nhân theo cùng tỉ lệ).
+    rolling_windows, ewm_spans: thêm mean/std/min/max trên các cửa sổ (số bản ghi) và EWMA với các
+    span này cho ROLLING_SOURCES, xếp sau các đặc trưng thời gian (xem rolling_features.py).
+    """
+    options = {'resample_seconds': resample_seconds, 'resample_how': resample_how,
+                'rolling_windows': rolling_windows, 'ewm_spans': ewm_spans}
+    columnar_path = COLUMNAR_PATH if columnar else None
+    lag_step, lag_tolerance = _resampled_lag_params(lag_step, lag_tolerance, resample_seconds)
+    if incremental:
+        with stage('preprocess_incremental') as span:
+            span.rows_out = preprocess_data_incremental(chunksize=chunksize or DEFAULT_CHUNKSIZE,
+                                                        columnar_path=columnar_path,
+                                                        lag_step=lag_step, lag_tolerance=lag_tolerance,
+                                                        **options)
+        return span.rows_out
+    if chunksize:
+        with stage('preprocess_streaming', chunksize=chunksize) as span:
+            span.rows_out = preprocess_data_streaming(chunksize=chunksize, columnar_path=columnar_path,
+                                                      lag_step=lag_step, lag_tolerance=lag_tolerance,
+                                                      **options)
+        return span.rows_out
+
+    with stage('preprocess') as total:
+        df = _preprocess_in_memory(columnar, lag_step, lag_tolerance, **options)
+        total.rows_out = len(df)
+    return df
+
+def _preprocess_in_memory(columnar, lag_step, lag_tolerance, resample_seconds=None, resample_how='mean',
+                          rolling_windows=None, ewm_spans=None):
+    """Đường xử lý toàn bộ file trong bộ nhớ của preprocess_data(), mỗi bước được đo bằng stage()"""
     # Tạo thư mục cho dữ liệu đã xử lý nếu chưa tồn tại
     os.makedirs("../../data/processed", exist_ok=True)
-    
+
     # Đọc dữ liệu
     print(f"Đang đọc dữ liệu từ {DATA_PATH}...")
-    df = pd.read_csv(DATA_PATH)
-    
+    with stage('read') as span:
+        df = pd.read_csv(DATA_PATH)
+        span.rows_out = len(df)
+
     # Hiển thị thông tin dữ liệu ban đầu
     print(f"Dữ liệu ban đầu có {len(df)} bản ghi và {len(df.columns)} cột")
     print("Các cột trong dữ liệu: ", df.columns.tolist())
-    
-    # Kiểm tra dữ liệu thiếu và giá trị 0
-    print("\nSố lượng giá trị N/A trong mỗi cột:")
-    print(df.isna().sum())
-    
-    # Đếm số bản ghi có giá trị 0 trong các cột số
-    numeric_cols = df.select_dtypes(include=['float64', 'int64']).columns
-    print("\nSố lượng giá trị 0 trong mỗi cột số:")
-    for col in numeric_cols:
-        zero_count = (df[col] == 0).sum()
-        print(f"{col}: {zero_count} giá trị 0")
-    
+
+    # Kiểm tra dữ liệu thiếu và giá trị 0 (quét toàn bộ bảng, bỏ qua ở chế độ quiet)
+    if not quiet():
+        with stage('diagnostics_raw', rows_in=len(df)):
+            print("\nSố lượng giá trị N/A trong mỗi cột:")
+            print(df.isna().sum())
+
+            # Đếm số bản ghi có giá trị 0 trong các cột số
+            numeric_cols = df.select_dtypes(include=['float64', 'int64']).columns
+            print("\nSố lượng giá trị 0 trong mỗi cột số:")
+            for col in numeric_cols:
+                zero_count = (df[col] == 0).sum()
+                print(f"{col}: {zero_count} giá trị 0")
+
     # Xóa các bản ghi có giá trị 0 hoặc N/A trong các cột quan trọng
-    important_cols = ['temp_dht', 'hum_dht', 'temp_api', 'hum_api']
     original_count = len(df)
-    
-    # Lọc ra các bản ghi không có giá trị 0 trong các cột quan trọng
-    for col in important_cols:
-        if col in df.columns:
-            df = df[df[col] != 0]
-    
-    # Xóa các bản ghi có giá trị N/A
-    df = df.dropna()
-    
+    with stage('drop_invalid', rows_in=original_count) as span:
+        df = _drop_invalid_rows(df)
+        span.rows_out = len(df)
+
     zero_na_removed = original_count - len(df)
     print(f"\nĐã xóa {zero_na_removed} bản ghi có giá trị 0 hoặc N/A")
     print(f"Còn lại {len(df)} bản ghi")
-    
-    # Chuyển đổi timestamp sang datetime nếu có
-    if 'timestamp' in df.columns:
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        print(f"Đã chuyển đổi cột timestamp sang datetime")
-    
-    # Thêm các đặc trưng thời gian
-    if 'timestamp' in df.columns:
-        df['hour'] = df['timestamp'].dt.hour
-        df['day_of_week'] = df['timestamp'].dt.dayofweek
-        df['day_of_year'] = df['timestamp'].dt.dayofyear
-        print(f"Đã thêm các đặc trưng thời gian: hour, day_of_week, day_of_year")
-    
-    # Xử lý giá trị ngoại lệ
-    for col in ['temp_dht', 'hum_dht', 'temp_api', 'hum_api']:
-        if col in df.columns:
-            # Loại bỏ giá trị ngoại lệ (nằm ngoài 3 độ lệch chuẩn)
-            mean = df[col].mean()
-            std = df[col].std()
-            outliers_before = ((df[col] < mean - 3*std) | (df[col] > mean + 3*std)).sum()
-            df[col] = df[col].clip(mean - 3*std, mean + 3*std)
-            print(f"Đã xử lý {outliers_before} giá trị ngoại lệ cho cột {col}")
-    
-    # Thêm các đặc trưng lag (dữ liệu trước đó)
-    for col in ['temp_dht', 'hum_dht']:
-        if col in df.columns:
-            df[f'{col}_lag1'] = df[col].shift(1)  # Giá trị trước đó 1 step
-            df[f'{col}_lag3'] = df[col].shift(3)  # Giá trị trước đó 3 step
-            print(f"Đã thêm đặc trưng độ trễ cho cột {col}")
-    
-    # Thêm đặc trưng biến thiên
-    for col in ['temp_dht', 'hum_dht']:
-        if col in df.columns and f'{col}_lag1' in df.columns:
-            df[f'{col}_diff'] = df[col] - df[f'{col}_lag1']  # Sự thay đổi
-            print(f"Đã thêm đặc trưng biến thiên cho cột {col}")
-    
+
+    # Xử lý giá trị ngoại lệ (nằm ngoài 3 độ lệch chuẩn)
+    # Thống kê của cả 4 cột được tính trong một lượt và lưu cạnh dữ liệu đã xử lý
+    with stage('clip_outliers', rows_in=len(df)) as span:
+        stats = _load_cached_stats(DATA_PATH, STATS_PATH)
+        span.fields['cached_stats'] = stats is not None
+        if stats is None:
+            stats = RunningStats([col for col in IMPORTANT_COLS if col in df.columns])
+            stats.update(df[stats.columns].values)
+            stats.save(STATS_PATH, source=_source_signature(DATA_PATH))
+        bounds = stats.clip_bounds(OUTLIER_SIGMA)
+        for col, count in _clip_outliers(df, bounds).items():
+            print(f"Đã xử lý {count} giá trị ngoại lệ cho cột {col}")
+        span.rows_out = len(df)
+
+    # Đưa về nhịp cố định: gộp các bản ghi trùng lặp trong cùng khoảng và đánh dấu khoảng trống
+    if resample_seconds:
+        with stage('resample', rows_in=len(df), cadence=resample_seconds, how=resample_how) as span:
+            df = Resampler(resample_seconds, resample_how).push(df, final=True)
+            span.rows_out = len(df)
+        print(f"Đã resample về nhịp {resample_seconds}s ({resample_how}): còn {len(df)} bản ghi, "
+              f"{int((df[GAP_COLUMN] > 0).sum())} khoảng mất dữ liệu")
+
+    # Thêm các đặc trưng lag (dữ liệu trước đó) và biến thiên
+    with stage('lag_features', rows_in=len(df)) as span:
+        df, _ = _add_lag_features(df, step=lag_step, tolerance=lag_tolerance)
+        span.rows_out = len(df)
+    print(f"Đã thêm đặc trưng độ trễ (step {lag_step}s, sai lệch tối đa {lag_tolerance}s) "
+          f"và biến thiên cho các cột {LAG_COLS}")
+
     # Thêm đặc trưng chênh lệch giữa DHT và API (nếu có)
-    if 'temp_dht' in df.columns and 'temp_api' in df.columns:
-        df['temp_diff_dht_api'] = df['temp_dht'] - df['temp_api']
-        print("Đã thêm đặc trưng chênh lệch nhiệt độ giữa DHT và API")
-    
-    if 'hum_dht' in df.columns and 'hum_api' in df.columns:
-        df['hum_diff_dht_api'] = df['hum_dht'] - df['hum_api']
-        print("Đã thêm đặc trưng chênh lệch độ ẩm giữa DHT và API")
-    
+    with stage('diff_features', rows_in=len(df)) as span:
+        df = _add_dht_api_diff(df)
+        span.rows_out = len(df)
+    print("Đã thêm đặc trưng chênh lệch giữa DHT và API")
+
+    # Thêm các đặc trưng thời gian từ cột epoch
+    if EPOCH_COLUMN in df.columns:
+        with stage('time_features', rows_in=len(df)) as span:
+            df = _add_time_features(df)
+            span.rows_out = len(df)
+        print(f"Đã thêm các đặc trưng thời gian: hour, day_of_week, day_of_year")
+
+    # Thêm các đặc trưng cửa sổ trượt (sau đặc trưng thời gian để không đổi thứ tự trên ESP32)
+    rolling = RollingFeatures(rolling_windows or (), ewm_spans or ())
+    if rolling:
+        with stage('rolling_features', rows_in=len(df), **rolling.config()) as span:
+            df = rolling.transform(df)
+            span.rows_out = len(df)
+        print(f"Đã thêm đặc trưng cửa sổ trượt (cửa sổ {rolling.windows}, EWMA span {rolling.ewm_spans})")
+
     # Xóa các bản ghi có giá trị thiếu sau khi tạo đặc trưng mới
     rows_before = len(df)
-    df = df.dropna()
+    with stage('dropna', rows_in=rows_before) as span:
+        df = df.dropna()
+        span.rows_out = len(df)
     na_removed = rows_before - len(df)
     print(f"Đã xóa {na_removed} hàng có giá trị thiếu sau khi tạo đặc trưng mới")
-    
+
     # Kiểm tra nếu còn giá trị 0 trong các đặc trưng tạo ra
-    derived_features = [col for col in df.columns if '_lag' in col or '_diff' in col]
-    for col in derived_features:
-        zero_count = (df[col] == 0).sum()
-        print(f"{col}: {zero_count} giá trị 0")
-    
+    if not quiet():
+        derived_features = [col for col in df.columns if '_lag' in col or '_diff' in col]
+        for col in derived_features:
+            zero_count = (df[col] == 0).sum()
+            print(f"{col}: {zero_count} giá trị 0")
+
     # Lưu dữ liệu đã xử lý
-    df.to_csv(PROCESSED_PATH, index=False)
-    print(f"Đã lưu dữ liệu đã xử lý vào {PROCESSED_PATH}")
+    with stage('save', rows_in=len(df)) as span:
+        df.to_csv(PROCESSED_PATH, index=False)
+        print(f"Đã lưu dữ liệu đã xử lý vào {PROCESSED_PATH}")
+        if columnar:
+            ColumnarWriter(COLUMNAR_PATH, mode='w').append(df)
+            print(f"Đã lưu kho cột vào {COLUMNAR_PATH}")
+        span.rows_out = len(df)
     print(f"Số bản ghi cuối cùng: {len(df)}")
-    
+
     # Hiển thị thống kê mô tả
-    print("\nThống kê mô tả của dữ liệu sau xử lý:")
-    print(df.describe())
-    
+    if not quiet():
+        print("\nThống kê mô tả của dữ liệu sau xử lý:")
+        print(df.describe())
+
     return df
 
 if __name__ == "__main__":
-    df = preprocess_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Tiền xử lý dữ liệu thời tiết")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="Xử lý theo chunk (streaming) với số bản ghi mỗi chunk")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Chỉ xử lý các bản ghi mới được ghi thêm kể từ lần chạy trước")
+    parser.add_argument("--columnar", action="store_true",
+                        help="Ghi thêm dữ liệu đã xử lý dạng cột float32 để huấn luyện nhanh hơn")
+    parser.add_argument("--lag-step", type=int, default=LAG_STEP_SECONDS,
+                        help="Số giây ứng với 1 step của đặc trưng lag")
+    parser.add_argument("--lag-tolerance", type=int, default=LAG_TOLERANCE_SECONDS,
+                        help="Sai lệch thời gian tối đa (giây) khi tìm bản ghi cho lag")
+    parser.add_argument("--resample", type=int, default=None, metavar="SECONDS",
+                        help="Đưa dữ liệu về nhịp cố định (giây) trước khi tạo lag, ví dụ 60")
+    parser.add_argument("--resample-how", choices=AGGREGATIONS, default='mean',
+                        help="Cách gộp các bản ghi trong cùng khoảng thời gian")
+    parser.add_argument("--rolling-windows", type=int, nargs='+', default=None,
+                        help="Độ dài cửa sổ (số bản ghi) cho mean/std/min/max trượt, ví dụ: 5 15")
+    parser.add_argument("--ewm-spans", type=int, nargs='+', default=None,
+                        help="Span của các trung bình trượt hàm mũ (EWMA), ví dụ: 10")
+    add_arguments(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+
+    df = preprocess_data(chunksize=args.chunksize, incremental=args.incremental,
+                         columnar=args.columnar, lag_step=args.lag_step,
+                         lag_tolerance=args.lag_tolerance, resample_seconds=args.resample,
+                         resample_how=args.resample_how, rolling_windows=args.rolling_windows,
+                         ewm_spans=args.ewm_spans)
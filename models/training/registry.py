@@ -0,0 +1,258 @@
+# models/training/registry.py
+# Sổ đăng ký các lần huấn luyện: một file manifest JSON thay cho việc liệt kê thư mục và
+# đoán bộ file qua timestamp. Chỉ dùng thư viện chuẩn để predictor.py có thể import.
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import tempfile
+from datetime import datetime
+
+MODELS_DIR = "../saved_models"
+COEF_DIR = "../coefficients"
+REGISTRY_PATH = f"{MODELS_DIR}/registry.json"
+REGISTRY_VERSION = 1
+DEFAULT_KEEP = 10  # Số lần huấn luyện gần nhất được giữ lại khi dọn dẹp
+
+_TIMESTAMP_RE = re.compile(r"_(\d{8}_\d{6})\.(?:pkl|h|npz)$")
+
+def _empty():
+    return {'version': REGISTRY_VERSION, 'latest': None, 'pinned': None, 'runs': {}}
+
+def load_registry(path=REGISTRY_PATH):
+    """Đọc manifest; trả về manifest rỗng nếu chưa có"""
+    if not os.path.exists(path):
+        return _empty()
+    with open(path, encoding='utf-8') as f:
+        registry = json.load(f)
+    if registry.get('version', 0) > REGISTRY_VERSION:
+        raise ValueError(f"{path} có phiên bản {registry['version']}, chỉ hỗ trợ tới {REGISTRY_VERSION}")
+    return registry
+
+def save_registry(registry, path=REGISTRY_PATH):
+    """Ghi nguyên tử: ghi ra file tạm trong cùng thư mục rồi os.replace()"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.registry_', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(registry, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _data_files(path):
+    """Các file dữ liệu dưới path (chính path nếu là file) kèm tên tương đối dùng khi băm"""
+    if not os.path.isdir(path):
+        return [(None, path)]
+    return [(os.path.relpath(p, path), p)
+            for p in sorted(glob.glob(os.path.join(path, '**', '*'), recursive=True)) if os.path.isfile(p)]
+
+def data_fingerprint(path, algorithm='blake2b'):
+    """Băm nội dung file dữ liệu (hoặc mọi file trong thư mục, ví dụ kho cột) để biết mô hình học từ dữ liệu nào"""
+    h = hashlib.new(algorithm)
+    for name, p in _data_files(path):
+        if name is not None:
+            h.update(name.encode('utf-8'))
+        with open(p, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+    return f"{algorithm}:{h.hexdigest()}"
+
+def extend_fingerprint(path, previous=None, sizes=None, algorithm='blake2b'):
+    """
+    Mã băm nối tiếp cho dữ liệu chỉ được ghi nối (huấn luyện tăng dần): băm mã trước đó cùng phần
+    byte mới của từng file, từ kích thước đã băm (sizes) tới kích thước hiện tại, nên chi phí là
+    O(dữ liệu mới) thay vì O(toàn bộ lịch sử) như data_fingerprint(). File nhỏ đi (bị ghi lại) được
+    băm lại toàn bộ. Mã này khác data_fingerprint() của cùng dữ liệu (tiền tố "{algorithm}-chain").
+    Trả về (mã băm, {file: kích thước đã băm}) để truyền lại ở lần sau.
+    """
+    h = hashlib.new(algorithm)
+    if previous:
+        h.update(previous.encode('utf-8'))
+    sizes = dict(sizes or {})
+    for name, p in _data_files(path):
+        key = name or os.path.basename(p)
+        size = os.path.getsize(p)
+        start = sizes.get(key, 0)
+        if start > size:
+            start = 0
+        h.update(key.encode('utf-8'))
+        with open(p, 'rb') as f:
+            f.seek(start)
+            remaining = size - start
+            while remaining > 0:
+                block = f.read(min(1 << 20, remaining))
+                if not block:
+                    break
+                h.update(block)
+                remaining -= len(block)
+        sizes[key] = size
+    return f"{algorithm}-chain:{h.hexdigest()}", sizes
+
+def _relative(artifact, path):
+    """Đường dẫn artifact tính từ thư mục chứa manifest, để manifest dùng được từ thư mục làm việc khác"""
+    return os.path.relpath(artifact, os.path.dirname(path) or '.')
+
+def artifact_path(run, name, path=REGISTRY_PATH):
+    """Đường dẫn dùng được của một artifact trong run, None nếu lần huấn luyện không có artifact đó"""
+    artifact = run['artifacts'].get(name)
+    return None if artifact is None else os.path.normpath(os.path.join(os.path.dirname(path) or '.', artifact))
+
+def register_run(run_id, artifacts, feature_cols=None, horizons=None, metrics=None, data_hash=None,
+                 fallback_header=False, kind='single', n_samples=None, path=REGISTRY_PATH):
+    """
+    Ghi lại một lần huấn luyện và đặt nó làm 'latest'.
+    artifacts: {loại: đường dẫn}, ví dụ temp_model, hum_model, scaler, header, predictor, fallback_header;
+    đường dẫn được lưu tương đối với thư mục chứa manifest (đọc lại bằng artifact_path()).
+    """
+    registry = load_registry(path)
+    registry['runs'][run_id] = {
+        'run_id': run_id,
+        'kind': kind,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'artifacts': {k: _relative(v, path) for k, v in artifacts.items() if v},
+        'feature_cols': list(feature_cols) if feature_cols is not None else None,
+        'horizons': list(horizons) if horizons is not None else None,
+        'metrics': metrics or {},
+        'data_hash': data_hash,
+        'fallback_header': bool(fallback_header),
+        'n_samples': n_samples,
+    }
+    if registry['latest'] is None or run_id >= registry['latest']:
+        registry['latest'] = run_id
+    save_registry(registry, path)
+    return registry['runs'][run_id]
+
+def get_run(which='latest', path=REGISTRY_PATH, requires=()):
+    """
+    Tra cứu một lần huấn luyện: 'latest', 'pinned' (rơi về latest nếu chưa ghim) hoặc run_id.
+    requires: các artifact bắt buộc; 'latest' khi đó là lần mới nhất có đủ các artifact này
+    (ví dụ bỏ qua lần huấn luyện nhiều horizon hoặc lần cũ thiếu scaler).
+    """
+    registry = load_registry(path)
+    runs = registry['runs']
+    if which == 'pinned':
+        which = registry['pinned'] or 'latest'
+    if which == 'latest':
+        def usable(run_id):
+            return run_id in runs and all(a in runs[run_id]['artifacts'] for a in requires)
+        run_id = registry['latest']
+        if not usable(run_id):
+            candidates = [r for r in sorted(runs) if usable(r)]
+            run_id = candidates[-1] if candidates else None
+        run = runs.get(run_id)
+        if run is None:
+            raise LookupError(f"Chưa có lần huấn luyện nào trong {path}")
+        return run
+    if which not in runs:
+        raise LookupError(f"Không có lần huấn luyện {which} trong {path}")
+    missing = [a for a in requires if a not in runs[which]['artifacts']]
+    if missing:
+        raise LookupError(f"Lần huấn luyện {which} thiếu {missing}")
+    return runs[which]
+
+def pin(run_id, path=REGISTRY_PATH):
+    """Ghim một lần huấn luyện cho môi trường chạy thật; None để bỏ ghim"""
+    registry = load_registry(path)
+    if run_id is not None and run_id not in registry['runs']:
+        raise LookupError(f"Không có lần huấn luyện {run_id} trong {path}")
+    registry['pinned'] = run_id
+    save_registry(registry, path)
+
+def prune(keep=DEFAULT_KEEP, delete_files=True, path=REGISTRY_PATH):
+    """
+    Giữ keep lần huấn luyện mới nhất cùng lần đang ghim, xóa các lần còn lại khỏi manifest
+    và (tùy chọn) xóa file của chúng. Trả về danh sách run_id đã xóa.
+    """
+    registry = load_registry(path)
+    run_ids = sorted(registry['runs'])
+    keep_ids = set(run_ids[-keep:] if keep > 0 else []) | {registry['pinned'], registry['latest']}
+    removed = [r for r in run_ids if r not in keep_ids]
+    for run_id in removed:
+        run = registry['runs'].pop(run_id)
+        if delete_files:
+            for name in run['artifacts']:
+                artifact = artifact_path(run, name, path)
+                if os.path.exists(artifact):
+                    os.remove(artifact)
+    save_registry(registry, path)
+    return removed
+
+def rebuild_from_directory(models_dir=MODELS_DIR, coef_dir=COEF_DIR, path=REGISTRY_PATH):
+    """
+    Đăng ký các lần huấn luyện cũ bằng cách nhóm file theo timestamp (chỉ dùng một lần
+    khi chuyển sang manifest). Các lần đã có trong manifest được giữ nguyên.
+    """
+    registry = load_registry(path)
+    groups = {}
+    patterns = {
+        'temp_model': f"{models_dir}/temp_model_*.pkl",
+        'hum_model': f"{models_dir}/hum_model_*.pkl",
+        'scaler': f"{models_dir}/scaler_*.pkl",
+        'predictor': f"{models_dir}/model_[0-9]*.npz",
+        'header': f"{coef_dir}/model_coef_[0-9]*.h",
+        'fallback_header': f"{coef_dir}/model_coef_fallback_*.h",
+    }
+    for kind, pattern in patterns.items():
+        for p in glob.glob(pattern):
+            match = _TIMESTAMP_RE.search(p)
+            if match:
+                groups.setdefault(match.group(1), {})[kind] = _relative(p, path)
+    added = []
+    for run_id, artifacts in sorted(groups.items()):
+        if run_id in registry['runs']:
+            continue
+        registry['runs'][run_id] = {
+            'run_id': run_id, 'kind': 'legacy', 'created': None, 'artifacts': artifacts,
+            'feature_cols': None, 'horizons': None, 'metrics': {}, 'data_hash': None,
+            'fallback_header': 'fallback_header' in artifacts, 'n_samples': None,
+        }
+        added.append(run_id)
+        if registry['latest'] is None or run_id > registry['latest']:
+            registry['latest'] = run_id
+    save_registry(registry, path)
+    return added
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quản lý sổ đăng ký các lần huấn luyện mô hình")
+    parser.add_argument("--registry", default=REGISTRY_PATH, help="Đường dẫn file manifest")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="Liệt kê các lần huấn luyện")
+    show = sub.add_parser("show", help="Hiển thị một lần huấn luyện")
+    show.add_argument("which", nargs='?', default='latest', help="latest, pinned hoặc run_id")
+    pin_parser = sub.add_parser("pin", help="Ghim một lần huấn luyện")
+    pin_parser.add_argument("run_id")
+    sub.add_parser("unpin", help="Bỏ ghim")
+    prune_parser = sub.add_parser("prune", help="Xóa các lần huấn luyện cũ")
+    prune_parser.add_argument("--keep", type=int, default=DEFAULT_KEEP, help="Số lần mới nhất được giữ")
+    prune_parser.add_argument("--keep-files", action="store_true", help="Chỉ xóa khỏi manifest, giữ file")
+    sub.add_parser("rebuild", help="Đăng ký các file đã có trong saved_models/coefficients")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        registry = load_registry(args.registry)
+        for run_id, run in sorted(registry['runs'].items()):
+            marks = "".join([" [latest]" if run_id == registry['latest'] else "",
+                             " [pinned]" if run_id == registry['pinned'] else ""])
+            print(f"{run_id} {run['kind']:<7} {len(run['artifacts'])} file{marks} {run['metrics']}")
+    elif args.command == "show":
+        print(json.dumps(get_run(args.which, args.registry), indent=2, ensure_ascii=False))
+    elif args.command == "pin":
+        pin(args.run_id, args.registry)
+        print(f"Đã ghim {args.run_id}")
+    elif args.command == "unpin":
+        pin(None, args.registry)
+        print("Đã bỏ ghim")
+    elif args.command == "prune":
+        removed = prune(args.keep, not args.keep_files, args.registry)
+        print(f"Đã xóa {len(removed)} lần huấn luyện: {removed}")
+    elif args.command == "rebuild":
+        added = rebuild_from_directory(path=args.registry)
+        print(f"Đã đăng ký {len(added)} lần huấn luyện cũ: {added}")
@@ -0,0 +1,284 @@
+# models/training/replay.py
+import argparse
+import os
+import re
+import numpy as np
+import pandas as pd
+from fused_export import MODELS_DIR, emulate_fused_fixed, emulate_fused_float, load_model_set
+from rolling_features import RollingFeatures, device_rolling_features
+from timestamps import NAT_EPOCH, TIMESTAMP_COLUMN, parse_timestamps, time_features
+
+RAW_DATA_PATH = "../../data/raw/weather_data.csv"
+
+# Hằng số của firmware (esp32_ai_weather.ino)
+MAX_HISTORY = 5           # Kích thước bộ đệm vòng temp_history / hum_history
+TEMP_RANGE = (0.0, 50.0)  # Khoảng hợp lệ của dự đoán nhiệt độ
+HUM_RANGE = (0.0, 100.0)  # Khoảng hợp lệ của dự đoán độ ẩm
+BASE_FEATURES = 13        # Đặc trưng cơ bản + thời gian mà predictWeather() tự tạo
+FALLBACK_WEIGHTS = (0.7, 0.3)  # Dự đoán đơn giản: 0.7 * api + 0.3 * dht
+
+_ARRAY_RE = re.compile(r"const\s+\w+\s+(\w+)\s*(?:\[[^\]]*\])+\s*=\s*\{([^;]*)\};")
+_SCALAR_RE = re.compile(r"const\s+\w+\s+(\w+)\s*=\s*([-+0-9.eE]+)[fFL]*\s*;")
+_DEFINE_RE = re.compile(r"#define\s+(\w+)\s+([-+0-9.eE]+)[fF]?\s*$", re.MULTILINE)
+# Các dòng của rolling_fill_features() do rolling_features.device_code() tạo
+_ROLL_FILL_RE = re.compile(r"raw_features\[(\d+)\]\s*=\s*rolling_(mean|std|min|max)\(&rolling_(\w+)_(\d+)\)")
+_EWM_FILL_RE = re.compile(r"raw_features\[(\d+)\]\s*=\s*isnan\(ewm_(\w+)_(\d+)\)")
+
+def _parse_number(text):
+    text = text.strip().rstrip('fFL')
+    return float(text) if any(c in text for c in '.eE') else int(text)
+
+def parse_coef_header(path):
+    """
+    Đọc file model_coef_*.h (thông thường, nhiều horizon hoặc đã gộp) thành dict:
+    mảng một chiều -> np.ndarray, hằng số và #define -> số.
+    Với mảng hai chiều (temp_coefs[][p]) các giá trị được trải phẳng.
+    Tên các đặc trưng cửa sổ trượt (từ rolling_fill_features()) nằm trong 'rolling_names' {chỉ số: tên}.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        text = re.sub(r"//[^\n]*", "", f.read())
+    values = {}
+    for name, value in _DEFINE_RE.findall(text):
+        values[name] = _parse_number(value)
+    for name, value in _SCALAR_RE.findall(text):
+        values[name] = _parse_number(value)
+    for name, body in _ARRAY_RE.findall(text):
+        items = [v for v in re.split(r"[,{}\s]+", body) if v]
+        values[name] = np.array([_parse_number(v) for v in items])
+    rolling_names = {int(i): f"{src}_roll{w}_{stat}" for i, stat, src, w in _ROLL_FILL_RE.findall(text)}
+    rolling_names.update({int(i): f"{src}_ewm{span}" for i, src, span in _EWM_FILL_RE.findall(text)})
+    values['rolling_names'] = rolling_names
+    return values
+
+def _header_from_model_set(timestamp):
+    """
+    Tạo các hệ số giống hệt file header mà write_coef_header() sẽ ghi cho bộ .pkl
+    (định dạng %.6f), để mô phỏng đúng những gì thiết bị nhận được.
+    """
+    temp_model, hum_model, scaler = load_model_set(timestamp)
+    rounded = lambda v: np.round(np.asarray(v, dtype=np.float64), 6)
+    # Tên đặc trưng (để biết vị trí các đặc trưng cửa sổ trượt) nằm trong file .npz cùng timestamp
+    rolling_names = {}
+    artifact = f"{MODELS_DIR}/model_{timestamp}.npz"
+    if os.path.exists(artifact):
+        with np.load(artifact, allow_pickle=False) as data:
+            feature_cols = data['feature_cols'].tolist()
+        rolling_names = {i: feature_cols[i] for i in device_rolling_features(feature_cols)}
+    return {
+        'feature_means': rounded(scaler.mean_),
+        'feature_scales': rounded(scaler.scale_),
+        'temp_intercept': float(rounded(temp_model.intercept_)),
+        'temp_coef': rounded(temp_model.coef_),
+        'hum_intercept': float(rounded(hum_model.intercept_)),
+        'hum_coef': rounded(hum_model.coef_),
+        'NUM_FEATURES': len(scaler.mean_),
+        'rolling_names': rolling_names,
+    }
+
+def load_coefficients(source):
+    """source: đường dẫn file .h hoặc timestamp / đường dẫn của một bộ .pkl trong saved_models"""
+    if source.endswith('.h'):
+        coef = parse_coef_header(source)
+        required = ['model_bias', 'model_weights'] if coef.get('MODEL_FUSED') else \
+            ['feature_means', 'feature_scales', 'temp_intercept', 'temp_coef', 'hum_intercept', 'hum_coef']
+        missing = [name for name in required + ['NUM_FEATURES'] if name not in coef]
+        if missing:
+            raise ValueError(f"File {source} thiếu {', '.join(missing)}, không phải header do train_model.py tạo")
+        return coef
+    match = re.search(r"(\d{8}_\d{6})", source)
+    if match is None:
+        raise ValueError(f"Không nhận dạng được bộ hệ số: {source}")
+    return _header_from_model_set(match.group(1))
+
+def _forward_fill(values, valid, initial=0.0):
+    """Giữ giá trị hợp lệ gần nhất (giống biến toàn cục chỉ được gán khi đọc thành công)"""
+    idx = np.where(valid, np.arange(len(values)), -1)
+    idx = np.maximum.accumulate(idx) if len(idx) else idx
+    return np.where(idx >= 0, values[np.maximum(idx, 0)], np.float32(initial)).astype(np.float32)
+
+def _ring_buffer_lag3(values, valid):
+    """
+    temp_dht_lag3 / hum_dht_lag3 như updateDataHistory(): chỉ cập nhật khi đọc DHT thành công,
+    lấy giá trị 3 lần đọc trước trong bộ đệm vòng MAX_HISTORY phần tử khởi tạo bằng 0,
+    nếu giá trị đó bằng 0 thì dùng giá trị hiện tại. Trước lần đọc đầu tiên lag3 = 0.
+    """
+    readings = values[valid].astype(np.float32)
+    lag = np.zeros(len(readings) + 1, dtype=np.float32)  # lag[0]: chưa có lần đọc nào
+    lag[4:] = readings[:-3]
+    lag[1:] = np.where(lag[1:] == 0, readings, lag[1:])
+    count = np.cumsum(valid)  # số lần đọc thành công tính tới mỗi hàng
+    return lag[count]
+
+def _device_rolling(layout, sources, received):
+    """
+    Đặc trưng cửa sổ trượt như firmware: rolling_update() chạy một lần cho mỗi bản ghi gửi đi
+    (mỗi hàng nhật ký) sau khi đã có dữ liệu API, còn predictWeather() chạy trước khi gửi trong
+    cùng vòng loop(), nên hàng r thấy các giá trị tới hàng gửi trước đó. Phần cửa sổ đầy đủ được
+    tính bằng RollingFeatures như khi huấn luyện; khi chưa đủ cửa sổ thiết bị dùng các giá trị đã
+    có, chưa có giá trị nào thì 0.
+    layout: {chỉ số: (cột nguồn, cửa sổ/span, thống kê hoặc 'ewm')} (xem device_rolling_features()).
+    Trả về {chỉ số: mảng float32 (n,)}.
+    """
+    updates = sources[received].reset_index(drop=True)
+    windows = sorted({w for _, w, stat in layout.values() if stat != 'ewm'})
+    spans = sorted({s for _, s, stat in layout.values() if stat == 'ewm'})
+    computed = RollingFeatures(windows, spans, sources=list(sources.columns)).transform(updates.copy())
+    # Số lần rolling_update() đã chạy trước predictWeather() của mỗi hàng
+    done = np.cumsum(received) - received
+    out = {}
+    for i, (src, w, stat) in layout.items():
+        if stat == 'ewm':
+            values = computed[f"{src}_ewm{w}"].values
+        else:
+            values = computed[f"{src}_roll{w}_{stat}"].values
+            partial = updates[src].rolling(w, min_periods=1)
+            partial = partial.std(ddof=0) if stat == 'std' else getattr(partial, stat)()
+            values = np.where(np.isnan(values), partial.values, values)
+        values = np.concatenate([[0.0], np.nan_to_num(values, nan=0.0)])
+        out[i] = values[done].astype(np.float32)
+    return out
+
+def build_device_features(df, num_features=10, rolling_names=None):
+    """
+    Tái tạo raw_features[] của predictWeather() cho từng hàng nhật ký, coi mỗi hàng là
+    một chu kỳ đọc cảm biến + API. Giá trị thiếu (N/A) được xử lý như lần đọc thất bại:
+    biến toàn cục giữ nguyên giá trị trước đó (ban đầu bằng 0).
+    rolling_names: {chỉ số: tên} của các đặc trưng cửa sổ trượt sau BASE_FEATURES đặc trưng
+    (xem _device_rolling()); mọi đặc trưng từ BASE_FEATURES trở đi phải có trong đó.
+    Trả về (features float32 dạng (n, num_features), dht hiện tại (n, 2), api hiện tại (n, 2)).
+    """
+    names = [''] * num_features
+    for i, name in (rolling_names or {}).items():
+        if i < num_features:
+            names[i] = name
+    layout = device_rolling_features(names)
+    unknown = [i for i in range(BASE_FEATURES, num_features) if i not in layout]
+    if unknown:
+        raise ValueError(f"Header có {num_features} đặc trưng nhưng không rõ cách thiết bị tính các đặc trưng "
+                         f"{unknown}; chỉ phát lại được {BASE_FEATURES} đặc trưng cơ bản và các đặc trưng "
+                         "cửa sổ trượt do rolling_features.py tạo")
+
+    t_dht = df['temp_dht'].values.astype(np.float32)
+    h_dht = df['hum_dht'].values.astype(np.float32)
+    t_api = df['temp_api'].values.astype(np.float32)
+    h_api = df['hum_api'].values.astype(np.float32)
+
+    # readSensorData(): bỏ qua cả hai giá trị nếu một trong hai là NaN
+    dht_valid = ~np.isnan(t_dht) & ~np.isnan(h_dht)
+    api_valid = ~np.isnan(t_api) & ~np.isnan(h_api)
+    last_t_dht, last_h_dht = _forward_fill(t_dht, dht_valid), _forward_fill(h_dht, dht_valid)
+    last_t_api, last_h_api = _forward_fill(t_api, api_valid), _forward_fill(h_api, api_valid)
+    # prev_* được gán bằng last_* trước mỗi lần đọc (kể cả khi đọc thất bại)
+    prev_t_dht = np.concatenate([[np.float32(0)], last_t_dht[:-1]]).astype(np.float32)
+    prev_h_dht = np.concatenate([[np.float32(0)], last_h_dht[:-1]]).astype(np.float32)
+
+    columns = [
+        last_t_api,                                # temp_api
+        last_h_api,                                # hum_api
+        prev_t_dht,                                # temp_dht_lag1
+        _ring_buffer_lag3(t_dht, dht_valid),       # temp_dht_lag3
+        prev_h_dht,                                # hum_dht_lag1
+        _ring_buffer_lag3(h_dht, dht_valid),       # hum_dht_lag3
+        last_t_dht - prev_t_dht,                   # temp_dht_diff
+        last_h_dht - prev_h_dht,                   # hum_dht_diff
+        last_t_dht - last_t_api,                   # temp_diff_dht_api
+        last_h_dht - last_h_api,                   # hum_diff_dht_api
+    ]
+    if num_features >= BASE_FEATURES:
+        epochs = parse_timestamps(df[TIMESTAMP_COLUMN])
+        tf = time_features(np.where(epochs == NAT_EPOCH, 0, epochs))
+        columns += [tf['hour'], tf['day_of_week'], tf['day_of_year']]
+    columns = columns[:num_features]
+    if layout:
+        sources = pd.DataFrame({
+            'temp_dht': last_t_dht, 'hum_dht': last_h_dht,
+            'temp_diff_dht_api': last_t_dht - last_t_api, 'hum_diff_dht_api': last_h_dht - last_h_api,
+        }).astype(np.float64)
+        # api_received trong firmware: đã nhận dữ liệu API ít nhất một lần
+        received = np.maximum.accumulate(api_valid) if len(df) else api_valid
+        rolling = _device_rolling(layout, sources, received)
+        columns += [rolling[i] for i in range(len(columns), num_features)]
+    features = np.column_stack([np.asarray(c, dtype=np.float32) for c in columns])
+    dht = np.column_stack([last_t_dht, last_h_dht])
+    api = np.column_stack([last_t_api, last_h_api])
+    return features, dht, api
+
+def _predict_standardized(features, coef):
+    """Nhánh mặc định của predictWeather(): chuẩn hóa float32 rồi cộng dồn theo thứ tự đặc trưng"""
+    means = coef['feature_means'].astype(np.float32)
+    scales = coef['feature_scales'].astype(np.float32)
+    scaled = (features - means) / scales
+    out = np.empty((len(features), 2), dtype=np.float32)
+    for t, name in enumerate(['temp', 'hum']):
+        acc = np.full(len(features), np.float32(coef[f'{name}_intercept']), dtype=np.float32)
+        w = coef[f'{name}_coef'].astype(np.float32)
+        for i in range(features.shape[1]):
+            acc = acc + w[i] * scaled[:, i]
+        out[:, t] = acc
+    return out
+
+def predict_device(features, coef):
+    """Dự đoán thô (trước bước kiểm tra hợp lý) theo đúng nhánh mà header chọn trong firmware"""
+    if coef.get('MODEL_FUSED'):
+        weights = coef['model_weights'].reshape(-1, 2)
+        if coef.get('MODEL_FIXED_POINT'):
+            in_frac = int(round(np.log2(coef['MODEL_INPUT_SCALE'])))
+            total = int(round(-np.log2(coef['MODEL_OUTPUT_SCALE'])))
+            quantized = {'weights': weights.astype(np.int64), 'bias': coef['model_bias'].astype(np.int64),
+                         'input_frac_bits': in_frac, 'frac_bits': total - in_frac}
+            return emulate_fused_fixed(features, quantized)
+        return emulate_fused_float(features, weights, coef['model_bias'])
+    return _predict_standardized(features, coef)
+
+def apply_sanity_checks(raw_pred, dht, api):
+    """
+    Kiểm tra NaN / ngoài khoảng 0-50°C, 0-100%, thay bằng 0.7*api + 0.3*dht (tính bằng double
+    như hằng số 0.7 trong C) rồi constrain. Trả về (dự đoán cuối, mặt nạ fallback).
+    """
+    final = np.empty_like(raw_pred)
+    fallback = np.empty(raw_pred.shape, dtype=bool)
+    for t, (lo, hi) in enumerate([TEMP_RANGE, HUM_RANGE]):
+        pred = raw_pred[:, t]
+        bad = np.isnan(pred) | (pred < lo) | (pred > hi)
+        simple = (FALLBACK_WEIGHTS[0] * api[:, t].astype(np.float64) +
+                  FALLBACK_WEIGHTS[1] * dht[:, t].astype(np.float64)).astype(np.float32)
+        final[:, t] = np.clip(np.where(bad, simple, pred), lo, hi)
+        fallback[:, t] = bad
+    return final, fallback
+
+def replay(coef_source, data_path=RAW_DATA_PATH, output_path=None):
+    """
+    Phát lại đường dự đoán của thiết bị trên toàn bộ nhật ký thô trong một lượt vector hóa.
+    coef_source: file model_coef_*.h hoặc timestamp của bộ .pkl trong saved_models.
+    Trả về DataFrame gồm Timestamp, dự đoán thô, dự đoán cuối và cờ fallback cho từng hàng.
+    """
+    coef = load_coefficients(coef_source)
+    num_features = int(coef['NUM_FEATURES'])
+    df = pd.read_csv(data_path, usecols=[TIMESTAMP_COLUMN, 'temp_dht', 'hum_dht', 'temp_api', 'hum_api'])
+    print(f"Đang phát lại {len(df)} bản ghi với {num_features} đặc trưng từ {coef_source}...")
+
+    features, dht, api = build_device_features(df, num_features, coef.get('rolling_names'))
+    raw_pred = predict_device(features, coef)
+    final, fallback = apply_sanity_checks(raw_pred, dht, api)
+
+    result = pd.DataFrame({
+        TIMESTAMP_COLUMN: df[TIMESTAMP_COLUMN].values,
+        'raw_temp': raw_pred[:, 0], 'raw_hum': raw_pred[:, 1],
+        'predicted_temp': final[:, 0], 'predicted_hum': final[:, 1],
+        'fallback_temp': fallback[:, 0], 'fallback_hum': fallback[:, 1],
+    })
+    print(f"Số lần dùng dự đoán đơn giản - nhiệt độ: {fallback[:, 0].sum()}, "
+          f"độ ẩm: {fallback[:, 1].sum()} / {len(df)}")
+    if output_path:
+        result.to_csv(output_path, index=False)
+        print(f"Đã lưu kết quả phát lại vào: {output_path}")
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Phát lại predictWeather() của firmware trên nhật ký thô")
+    parser.add_argument("coefficients", help="File model_coef_*.h hoặc timestamp của bộ .pkl")
+    parser.add_argument("--data", default=RAW_DATA_PATH, help="File nhật ký thô (CSV)")
+    parser.add_argument("--output", default=None, help="Lưu kết quả ra file CSV")
+    args = parser.parse_args()
+
+    replay(args.coefficients, args.data, args.output)
@@ -0,0 +1,122 @@
+# models/training/resample.py
+import numpy as np
+import pandas as pd
+from timestamps import EPOCH_COLUMN, TIMESTAMP_COLUMN, TIMESTAMP_FORMAT
+
+DEFAULT_CADENCE_SECONDS = 60  # Bằng chu kỳ gửi của ESP32 (LAG_STEP_SECONDS)
+AGGREGATIONS = ('mean', 'last')
+GAP_COLUMN = 'gap'  # Số khoảng trống liền trước bản ghi (0 = không mất dữ liệu); không dùng làm đặc trưng
+
+def _aggregate(df, buckets, how):
+    """Gộp các hàng theo bucket (đã sắp xếp tăng dần): trả về (bucket, {cột: giá trị})"""
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]]) if len(buckets) else buckets
+    ends = np.r_[starts[1:], len(buckets)]
+    columns = {}
+    for col in df.columns:
+        if col in (TIMESTAMP_COLUMN, EPOCH_COLUMN) or not pd.api.types.is_numeric_dtype(df[col]):
+            continue
+        values = df[col].values.astype(np.float64)
+        if len(values) == 0:
+            columns[col] = values
+            continue
+        valid = ~np.isnan(values)
+        if how == 'mean':
+            sums = np.add.reduceat(np.where(valid, values, 0.0), starts)
+            counts = np.add.reduceat(valid.astype(np.int64), starts)
+            columns[col] = np.divide(sums, counts, out=np.full(len(starts), np.nan), where=counts > 0)
+        else:
+            # Giá trị hợp lệ cuối cùng của mỗi bucket: vị trí lớn nhất có valid trong [start, end)
+            last_valid = np.maximum.accumulate(np.where(valid, np.arange(len(values)), -1))[ends - 1]
+            columns[col] = np.where(last_valid >= starts, values[np.maximum(last_valid, 0)], np.nan)
+    return buckets[starts], columns
+
+class Resampler:
+    """
+    Đưa các bản ghi về nhịp cố định cadence giây: mọi bản ghi trong cùng khoảng
+    [k * cadence, (k + 1) * cadence) được gộp thành một hàng (trung bình hoặc giá trị cuối),
+    nên các đợt bản ghi trùng lặp bị loại và "1 bản ghi" luôn là cadence giây.
+    Cột GAP_COLUMN ghi số khoảng không có dữ liệu ngay trước mỗi hàng.
+
+    Dùng theo chunk: push() giữ lại bucket mới nhất (có thể còn tiếp ở chunk sau) và
+    flush() trả về nó ở cuối. Bản ghi đến muộn thuộc bucket đã trả về được bỏ qua
+    (đếm trong late_rows). last_bucket được lưu trong checkpoint để chạy tiếp.
+    """
+
+    def __init__(self, cadence=DEFAULT_CADENCE_SECONDS, how='mean', last_bucket=None):
+        if how not in AGGREGATIONS:
+            raise ValueError(f"how phải là một trong {AGGREGATIONS}, nhận được {how!r}")
+        self.cadence = int(cadence)
+        self.how = how
+        self.last_bucket = last_bucket
+        self.pending = None
+        self.late_rows = 0
+
+    def config(self):
+        return {'cadence': self.cadence, 'how': self.how}
+
+    def push(self, df, final=False):
+        """Gộp df (đã có cột epoch) với phần còn dở của chunk trước, trả về các bucket đã đủ"""
+        if self.pending is not None and len(self.pending) > 0:
+            df = pd.concat([self.pending, df], ignore_index=True)
+        self.pending = None
+        if EPOCH_COLUMN not in df.columns:
+            return pd.DataFrame()
+
+        buckets = df[EPOCH_COLUMN].values.astype(np.int64) // self.cadence
+        if self.last_bucket is not None:
+            late = buckets <= self.last_bucket
+            if late.any():
+                self.late_rows += int(late.sum())
+                df, buckets = df[~late], buckets[~late]
+        if len(buckets) > 1 and np.any(buckets[1:] < buckets[:-1]):
+            order = np.argsort(buckets, kind='stable')
+            df, buckets = df.iloc[order], buckets[order]
+        if not final and len(buckets) > 0:
+            open_bucket = buckets == buckets[-1]
+            self.pending = df[open_bucket]
+            df, buckets = df[~open_bucket], buckets[~open_bucket]
+
+        keys, columns = _aggregate(df, buckets, self.how)
+        return self._frame(df, keys, columns)
+
+    def flush(self):
+        """Trả về bucket cuối còn giữ lại (gọi sau chunk cuối cùng)"""
+        return self.push(self.pending.iloc[:0] if self.pending is not None else pd.DataFrame(),
+                         final=True)
+
+    def _frame(self, df, keys, columns):
+        previous = np.r_[self.last_bucket if self.last_bucket is not None else keys[:1] - 1, keys[:-1]] \
+            if len(keys) else keys
+        epochs = keys * self.cadence
+        out = {}
+        if TIMESTAMP_COLUMN in df.columns:
+            out[TIMESTAMP_COLUMN] = pd.DatetimeIndex(epochs.astype('datetime64[s]')).strftime(TIMESTAMP_FORMAT)
+        out.update(columns)
+        out[EPOCH_COLUMN] = epochs
+        out[GAP_COLUMN] = (keys - previous - 1).astype(np.int64)
+        if len(keys):
+            self.last_bucket = int(keys[-1])
+        return pd.DataFrame(out)
+
+def resample(df, cadence=DEFAULT_CADENCE_SECONDS, how='mean'):
+    """Đưa toàn bộ df (đã có cột epoch) về nhịp cố định cadence giây, xem Resampler"""
+    return Resampler(cadence, how).push(df, final=True)
+
+def fixed_horizon_mask(epochs, gaps, horizon):
+    """
+    Với dữ liệu đã resample, True tại các hàng mà hàng sau horizon bản ghi cách đúng
+    horizon * cadence giây, tức mục tiêu dịch horizon bản ghi không vượt qua khoảng mất dữ liệu.
+    cadence suy ra từ cột GAP_COLUMN (gaps): hàng có gap g cách hàng trước ít nhất (g + 1) * cadence
+    giây, nên kể cả khi mọi bước thời gian đều vượt qua khoảng trống cadence vẫn đúng.
+    """
+    epochs = np.asarray(epochs, dtype=np.int64)
+    gaps = np.asarray(gaps, dtype=np.int64)
+    mask = np.zeros(len(epochs), dtype=bool)
+    steps = np.diff(epochs)
+    positive = steps > 0
+    if horizon <= 0 or len(epochs) <= horizon or not positive.any():
+        mask[:] = horizon <= 0
+        return mask
+    cadence = np.min(steps[positive] // (np.maximum(gaps[1:][positive], 0) + 1))
+    mask[:-horizon] = epochs[horizon:] - epochs[:-horizon] == horizon * cadence
+    return mask
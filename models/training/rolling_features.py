@@ -0,0 +1,262 @@
+# models/training/rolling_features.py
+import re
+import numpy as np
+import pandas as pd
+
+# Các cột được tính đặc trưng cửa sổ trượt (chênh lệch DHT-API do _add_dht_api_diff() tạo)
+ROLLING_SOURCES = ['temp_dht', 'hum_dht', 'temp_diff_dht_api', 'hum_diff_dht_api']
+ROLLING_STATS = ('mean', 'std', 'min', 'max')
+
+# Biến chứa giá trị hiện tại của từng cột nguồn trên ESP32 (esp32_ai_weather.ino)
+_DEVICE_SOURCES = {
+    'temp_dht': 't_dht',
+    'hum_dht': 'h_dht',
+    'temp_diff_dht_api': 't_dht - t_api',
+    'hum_diff_dht_api': 'h_dht - h_api',
+}
+_ROLL_RE = re.compile(r"^(\w+)_roll(\d+)_(mean|std|min|max)$")
+_EWM_RE = re.compile(r"^(\w+)_ewm(\d+)$")
+
+def rolling_feature_names(windows=(), ewm_spans=(), sources=ROLLING_SOURCES):
+    """Tên các cột đặc trưng theo đúng thứ tự RollingFeatures.transform() thêm vào"""
+    names = [f"{col}_roll{w}_{stat}" for col in sources for w in windows for stat in ROLLING_STATS]
+    return names + [f"{col}_ewm{span}" for col in sources for span in ewm_spans]
+
+def _sliding_reduce(values, w, ufunc):
+    """
+    Tổng/min/max trên cửa sổ w phần tử kết thúc tại mỗi vị trí (van Herk/Gil-Werman, O(n)
+    không phụ thuộc w): chia mảng thành các khối w phần tử và tích lũy xuôi, ngược trong
+    từng khối; cửa sổ [i-w+1, i] là phần cuối một khối ghép với phần đầu khối kế tiếp.
+    Với phép cộng, tổng tích lũy chỉ kéo dài trong một khối nên không mất chính xác như
+    hiệu hai tổng tích lũy trên toàn mảng.
+    """
+    n = len(values)
+    fill = {np.minimum: np.inf, np.maximum: -np.inf}.get(ufunc, 0.0)
+    blocks = np.concatenate([values, np.full((-n) % w, fill)]).reshape(-1, w)
+    prefix = ufunc.accumulate(blocks, axis=1).ravel()
+    suffix = ufunc.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+    result = ufunc(suffix[:n - w + 1], prefix[w - 1:n])
+    if ufunc is np.add:
+        # Cửa sổ bắt đầu đúng đầu khối nằm gọn trong một khối
+        aligned = np.arange(n - w + 1) % w == 0
+        result[aligned] = prefix[w - 1:n][aligned]
+    return result
+
+def rolling_window_stats(values, w):
+    """
+    mean, std (độ lệch chuẩn tổng thể, ddof=0), min, max trên cửa sổ w bản ghi kết thúc tại
+    mỗi hàng, O(n) với mọi w. Các hàng chưa đủ w bản ghi hoặc có NaN trong cửa sổ nhận NaN.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    out = {stat: np.full(n, np.nan) for stat in ROLLING_STATS}
+    if n < w:
+        return out
+    valid = ~np.isnan(values)
+    complete = _sliding_reduce(valid.astype(np.float64), w, np.add) == w
+    # Trừ một giá trị tham chiếu trước khi cộng bình phương để tránh mất chính xác
+    shift = values[valid][0] if valid.any() else 0.0
+    centered = np.where(valid, values - shift, 0.0)
+    mean = _sliding_reduce(centered, w, np.add) / w
+    var = np.maximum(_sliding_reduce(centered * centered, w, np.add) / w - mean * mean, 0.0)
+    out['mean'][w - 1:] = np.where(complete, mean + shift, np.nan)
+    out['std'][w - 1:] = np.where(complete, np.sqrt(var), np.nan)
+    out['min'][w - 1:] = np.where(complete, _sliding_reduce(np.where(valid, values, np.inf), w, np.minimum), np.nan)
+    out['max'][w - 1:] = np.where(complete, _sliding_reduce(np.where(valid, values, -np.inf), w, np.maximum), np.nan)
+    return out
+
+def ewma(values, span, initial=None):
+    """
+    Trung bình trượt hàm mũ y[t] = y[t-1] + alpha * (x[t] - y[t-1]), alpha = 2 / (span + 1),
+    bắt đầu từ initial (giá trị cuối của chunk trước) hoặc từ phần tử đầu tiên.
+    NaN được bỏ qua (giữ giá trị trước đó), giống firmware.
+    """
+    values = pd.Series(np.asarray(values, dtype=np.float64))
+    if initial is not None and not np.isnan(initial):
+        values = pd.concat([pd.Series([initial]), values], ignore_index=True)
+        return values.ewm(span=span, adjust=False, ignore_na=True).mean().values[1:]
+    return values.ewm(span=span, adjust=False, ignore_na=True).mean().values
+
+class RollingFeatures:
+    """
+    Đặc trưng cửa sổ trượt theo số bản ghi: mean/std/min/max trên từng cửa sổ trong windows
+    và EWMA với từng span trong ewm_spans, cho các cột ROLLING_SOURCES có trong dữ liệu.
+    Dùng theo chunk: giữ max(windows) - 1 giá trị cuối và giá trị EWMA cuối của mỗi cột
+    để kết quả giống khi xử lý toàn bộ trong bộ nhớ (chỉ khác ở mức làm tròn float64);
+    state()/from_state() dùng cho checkpoint.
+    """
+
+    def __init__(self, windows=(), ewm_spans=(), sources=ROLLING_SOURCES):
+        self.windows = sorted(int(w) for w in windows)
+        self.ewm_spans = sorted(int(s) for s in ewm_spans)
+        if any(w < 2 for w in self.windows) or any(s < 1 for s in self.ewm_spans):
+            raise ValueError("Cửa sổ phải có ít nhất 2 bản ghi và span EWMA ít nhất 1")
+        self.sources = list(sources)
+        self.tail = {}  # {cột: các giá trị cuối của chunk trước}
+        self.last_ewm = {}  # {tên cột EWMA: giá trị cuối}
+
+    def __bool__(self):
+        return bool(self.windows or self.ewm_spans)
+
+    def config(self):
+        return {'windows': self.windows, 'ewm_spans': self.ewm_spans}
+
+    def state(self):
+        return {'tail': {col: list(map(float, v)) for col, v in self.tail.items()},
+                'last_ewm': dict(self.last_ewm)}
+
+    @classmethod
+    def from_state(cls, config, state):
+        rolling = cls(config['windows'], config['ewm_spans'])
+        if state:
+            rolling.tail = {col: np.asarray(v, dtype=np.float64) for col, v in state['tail'].items()}
+            rolling.last_ewm = dict(state['last_ewm'])
+        return rolling
+
+    def transform(self, df):
+        """Thêm các cột đặc trưng vào df (theo thứ tự rolling_feature_names()) và cập nhật trạng thái"""
+        keep = max(self.windows, default=1) - 1
+        columns = {}
+        for col in self.sources:
+            if col not in df.columns:
+                continue
+            tail = self.tail.get(col, np.empty(0))
+            values = np.concatenate([tail, df[col].values.astype(np.float64)])
+            for w in self.windows:
+                for stat, result in rolling_window_stats(values, w).items():
+                    columns[f"{col}_roll{w}_{stat}"] = result[len(tail):]
+            self.tail[col] = values[len(values) - min(keep, len(values)):]
+        for col in self.sources:
+            if col not in df.columns:
+                continue
+            for span in self.ewm_spans:
+                name = f"{col}_ewm{span}"
+                result = ewma(df[col].values, span, self.last_ewm.get(name))
+                columns[name] = result
+                if len(result) and not np.isnan(result[-1]):
+                    self.last_ewm[name] = float(result[-1])
+        for name, values in columns.items():
+            df[name] = values
+        return df
+
+def device_rolling_features(feature_cols):
+    """
+    Các đặc trưng cửa sổ trượt trong feature_cols mà thiết bị tính được (nguồn có trong
+    _DEVICE_SOURCES): {chỉ số: (cột nguồn, độ dài cửa sổ hoặc span, thống kê hoặc 'ewm')}.
+    """
+    layout = {}
+    for i, name in enumerate(feature_cols):
+        match = _ROLL_RE.match(name)
+        if match and match.group(1) in _DEVICE_SOURCES:
+            layout[i] = (match.group(1), int(match.group(2)), match.group(3))
+            continue
+        match = _EWM_RE.match(name)
+        if match and match.group(1) in _DEVICE_SOURCES:
+            layout[i] = (match.group(1), int(match.group(2)), 'ewm')
+    return layout
+
+def device_code(feature_cols):
+    """
+    Mã C cho file header của ESP32 tính các đặc trưng cửa sổ trượt có trong feature_cols với
+    chi phí O(1) mỗi lần đọc, không phụ thuộc độ dài cửa sổ: bộ đệm vòng cộng dồn tổng và tổng
+    bình phương (tính lại từ bộ đệm mỗi khi quay vòng để không tích lũy sai số float), hàng đợi
+    đơn điệu cho min/max (O(1) trung bình) và EWMA một biến.
+    Firmware gọi rolling_update() một lần cho mỗi bản ghi gửi đi (SEND_INTERVAL, cùng nhịp các hàng
+    đã xử lý mà cửa sổ được đếm khi huấn luyện) sau khi đã có dữ liệu API, và rolling_fill_features()
+    khi tạo raw_features[].
+    Trả về chuỗi rỗng nếu không có đặc trưng nào.
+    """
+    layout = device_rolling_features(feature_cols)
+    rolls = [(i, src, w, stat) for i, (src, w, stat) in layout.items() if stat != 'ewm']
+    ewms = [(i, src, s) for i, (src, s, stat) in layout.items() if stat == 'ewm']
+    if not rolls and not ewms:
+        return ""
+
+    windows = sorted({(src, w) for _, src, w, _ in rolls})
+    spans = sorted({(src, s) for _, src, s in ewms})
+    max_window = max([w for _, w in windows], default=1)
+    lines = [
+        "// Đặc trưng cửa sổ trượt (được tạo tự động bởi rolling_features.py), O(1) mỗi lần đọc",
+        "#include <math.h>",
+        "#define ROLLING_FEATURES 1",
+        f"#define ROLLING_MAX_WINDOW {max_window}",
+        "",
+        "typedef struct {",
+        "  int size;                          // Độ dài cửa sổ",
+        "  long count;                        // Số giá trị đã nhận",
+        "  float values[ROLLING_MAX_WINDOW];  // Bộ đệm vòng, values[seq % size]",
+        "  float sum, sumsq;                  // Tổng và tổng bình phương (đã trừ shift)",
+        "  float shift;                       // Giá trị tham chiếu để tránh mất chính xác",
+        "  long min_q[ROLLING_MAX_WINDOW], max_q[ROLLING_MAX_WINDOW];  // Hàng đợi đơn điệu (số thứ tự)",
+        "  int min_head, min_len, max_head, max_len;",
+        "} rolling_window_t;",
+        "",
+        "static inline void rolling_push(rolling_window_t *r, float x) {",
+        "  long seq = r->count++;",
+        "  int pos = seq % r->size;",
+        "  if (seq == 0) r->shift = x;",
+        "  // Bỏ các phần tử đã ra khỏi cửa sổ ở đầu hàng đợi",
+        "  if (r->min_len > 0 && r->min_q[r->min_head] <= seq - r->size) { r->min_head = (r->min_head + 1) % r->size; r->min_len--; }",
+        "  if (r->max_len > 0 && r->max_q[r->max_head] <= seq - r->size) { r->max_head = (r->max_head + 1) % r->size; r->max_len--; }",
+        "  float d = x - r->shift;",
+        "  if (seq >= r->size) {",
+        "    float old = r->values[pos] - r->shift;",
+        "    r->sum -= old;",
+        "    r->sumsq -= old * old;",
+        "  }",
+        "  r->values[pos] = x;",
+        "  r->sum += d;",
+        "  r->sumsq += d * d;",
+        "  if (pos == r->size - 1) {",
+        "    // Mỗi vòng tính lại tổng từ bộ đệm (O(1) trung bình) để sai số không tích lũy",
+        "    r->sum = 0; r->sumsq = 0;",
+        "    for (int i = 0; i < r->size; i++) { float v = r->values[i] - r->shift; r->sum += v; r->sumsq += v * v; }",
+        "  }",
+        "  // Bỏ các phần tử không thể là min/max nữa ở cuối hàng đợi",
+        "  while (r->min_len > 0 && r->values[r->min_q[(r->min_head + r->min_len - 1) % r->size] % r->size] >= x) r->min_len--;",
+        "  r->min_q[(r->min_head + r->min_len++) % r->size] = seq;",
+        "  while (r->max_len > 0 && r->values[r->max_q[(r->max_head + r->max_len - 1) % r->size] % r->size] <= x) r->max_len--;",
+        "  r->max_q[(r->max_head + r->max_len++) % r->size] = seq;",
+        "}",
+        "",
+        "// Khi chưa đủ size giá trị, thống kê được tính trên các giá trị đã có",
+        "static inline int rolling_n(const rolling_window_t *r) { return r->count < r->size ? (int)r->count : r->size; }",
+        "static inline float rolling_mean(const rolling_window_t *r) {",
+        "  int n = rolling_n(r); return n ? r->shift + r->sum / n : 0.0f;",
+        "}",
+        "static inline float rolling_std(const rolling_window_t *r) {",
+        "  int n = rolling_n(r); if (!n) return 0.0f;",
+        "  float m = r->sum / n, v = r->sumsq / n - m * m;",
+        "  return v > 0 ? sqrtf(v) : 0.0f;",
+        "}",
+        "static inline float rolling_min(const rolling_window_t *r) { return r->min_len ? r->values[r->min_q[r->min_head] % r->size] : 0.0f; }",
+        "static inline float rolling_max(const rolling_window_t *r) { return r->max_len ? r->values[r->max_q[r->max_head] % r->size] : 0.0f; }",
+        "",
+    ]
+    for src, w in windows:
+        lines.append(f"rolling_window_t rolling_{src}_{w} = {{{w}}};")
+    for src, s in spans:
+        lines.append(f"float ewm_{src}_{s} = NAN;  // alpha = {2.0 / (s + 1):.6f}")
+    lines += [
+        "",
+        "// Gọi một lần cho mỗi bản ghi gửi đi (SEND_INTERVAL), sau khi đã có dữ liệu API",
+        "static inline void rolling_update(float t_dht, float h_dht, float t_api, float h_api) {",
+    ]
+    for src, w in windows:
+        lines.append(f"  rolling_push(&rolling_{src}_{w}, {_DEVICE_SOURCES[src]});")
+    for src, s in spans:
+        x = f"({_DEVICE_SOURCES[src]})"
+        lines.append(f"  ewm_{src}_{s} = isnan(ewm_{src}_{s}) ? {x} : "
+                     f"ewm_{src}_{s} + {2.0 / (s + 1):.6f}f * ({x} - ewm_{src}_{s});")
+    lines += [
+        "}",
+        "",
+        "// Ghi các đặc trưng cửa sổ trượt vào đúng vị trí trong raw_features[]",
+        "static inline void rolling_fill_features(float *raw_features) {",
+    ]
+    for i, src, w, stat in rolls:
+        lines.append(f"  raw_features[{i}] = rolling_{stat}(&rolling_{src}_{w});  // {feature_cols[i]}")
+    for i, src, s in ewms:
+        lines.append(f"  raw_features[{i}] = isnan(ewm_{src}_{s}) ? 0.0f : ewm_{src}_{s};  // {feature_cols[i]}")
+    lines += ["}", ""]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,91 @@
+# models/training/running_stats.py
+import json
+import numpy as np
+
+class RunningStats:
+    """
+    Thống kê trung bình/phương sai trực tuyến (Welford) cho nhiều cột cùng lúc.
+    Mỗi lần update() xử lý cả một khối dữ liệu bằng numpy rồi gộp vào kết quả
+    hiện có theo công thức của Chan, nên có thể cộng dồn qua từng chunk hoặc qua
+    nhiều lần chạy mà không cần đọc lại toàn bộ lịch sử.
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.count = 0
+        self.mean = np.zeros(len(self.columns))
+        self.m2 = np.zeros(len(self.columns))
+
+    def update(self, values):
+        """Gộp một khối dữ liệu (mảng 2 chiều, mỗi cột tương ứng self.columns)"""
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            values = values.reshape(-1, 1)
+        n = len(values)
+        if n == 0:
+            return self
+
+        batch_mean = values.mean(axis=0)
+        batch_m2 = np.square(values - batch_mean).sum(axis=0)
+
+        total = self.count + n
+        delta = batch_mean - self.mean
+        self.mean = self.mean + delta * n / total
+        self.m2 = self.m2 + batch_m2 + np.square(delta) * self.count * n / total
+        self.count = total
+        return self
+
+    def merge(self, other):
+        """Gộp một RunningStats khác có cùng danh sách cột"""
+        if other.columns != self.columns:
+            raise ValueError("Không thể gộp thống kê có danh sách cột khác nhau")
+        if other.count == 0:
+            return self
+
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / total
+        self.m2 = self.m2 + other.m2 + np.square(delta) * self.count * other.count / total
+        self.count = total
+        return self
+
+    def std(self, ddof=1):
+        """Độ lệch chuẩn của từng cột (ddof=1 giống pandas)"""
+        if self.count <= ddof:
+            return np.full(len(self.columns), np.nan)
+        return np.sqrt(self.m2 / (self.count - ddof))
+
+    def clip_bounds(self, n_std=3):
+        """Giới hạn (mean - n_std*std, mean + n_std*std) cho từng cột"""
+        std = self.std()
+        return {col: (self.mean[i] - n_std * std[i], self.mean[i] + n_std * std[i])
+                for i, col in enumerate(self.columns)}
+
+    def to_dict(self):
+        return {
+            'columns': self.columns,
+            'count': int(self.count),
+            'mean': self.mean.tolist(),
+            'm2': self.m2.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls(data['columns'])
+        stats.count = data['count']
+        stats.mean = np.array(data['mean'], dtype=np.float64)
+        stats.m2 = np.array(data['m2'], dtype=np.float64)
+        return stats
+
+    def save(self, path, **extra):
+        """Lưu thống kê ra file JSON, kèm các thông tin bổ sung (ví dụ nguồn dữ liệu)"""
+        data = self.to_dict()
+        data.update(extra)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls.from_dict(data), data
@@ -0,0 +1,19 @@
+# models/training/station_ids.py
+import os
+import re
+
+# Mã trạm và file thô theo trạm. Chỉ dùng thư viện chuẩn để ingest_server.py
+# không phải nạp pandas/sklearn của phần huấn luyện (stations.py).
+STATION_COLUMN = 'station_id'
+STATIONS_DIR = "../../data/raw/stations"
+STATION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")  # Dùng làm tên file nên chỉ cho phép ký tự an toàn
+
+def check_station_id(station):
+    """Trả về station dạng chuỗi, ValueError nếu không dùng được làm tên file"""
+    station = str(station)
+    if not STATION_ID_PATTERN.match(station):
+        raise ValueError(f"Mã trạm không hợp lệ: {station!r}")
+    return station
+
+def station_raw_path(station, stations_dir=STATIONS_DIR):
+    return os.path.join(stations_dir, f"{check_station_id(station)}.csv")
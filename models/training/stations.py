@@ -0,0 +1,244 @@
+# models/training/stations.py
+import argparse
+import glob
+import json
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LinearRegression
+from sklearn.preprocessing import StandardScaler
+from lag_features import LAG_STEP_SECONDS, LAG_TOLERANCE_SECONDS
+from preprocess_data import (DATA_PATH, DEFAULT_CHUNKSIZE, _complete_lines_end, _raw_header,
+                             _read_raw_chunks, preprocess_data_incremental, preprocess_data_streaming)
+from station_ids import STATION_COLUMN, STATIONS_DIR, check_station_id, station_raw_path
+from train_model import (COEF_DIR, MODELS_DIR, TARGET_COLS, build_targets, fit_multi_output,
+                         get_feature_cols, write_coef_header)
+
+# Mỗi trạm có một file thô riêng (cùng định dạng với weather_data.csv) trong STATIONS_DIR,
+# và một thư mục kết quả riêng trong PROCESSED_STATIONS_DIR, nên lag/diff/ngoại lệ
+# của các trạm không bao giờ lẫn vào nhau.
+PROCESSED_STATIONS_DIR = "../../data/processed/stations"
+STATION_MODELS_DIR = f"{MODELS_DIR}/stations"
+STATION_COEF_DIR = f"{COEF_DIR}/stations"
+PARTITION_CHECKPOINT = "partition_checkpoint.json"  # Vị trí đã tách của từng file nguồn, trong stations_dir
+
+def station_processed_paths(station, processed_dir=PROCESSED_STATIONS_DIR):
+    """Đường dẫn dữ liệu đã xử lý, thống kê ngoại lệ, checkpoint và kho cột của một trạm"""
+    base = os.path.join(processed_dir, check_station_id(station))
+    return {
+        'processed_path': os.path.join(base, "processed_data.csv"),
+        'stats_path': os.path.join(base, "outlier_stats.json"),
+        'checkpoint_path': os.path.join(base, "preprocess_checkpoint.json"),
+        'columnar_path': os.path.join(base, "processed_data_columnar"),
+    }
+
+def list_stations(stations_dir=STATIONS_DIR):
+    """Danh sách mã trạm có file thô trong stations_dir"""
+    return sorted(os.path.splitext(os.path.basename(p))[0]
+                  for p in glob.glob(os.path.join(stations_dir, "*.csv")))
+
+def partition_raw(data_path=DATA_PATH, stations_dir=STATIONS_DIR, station_column=STATION_COLUMN,
+                  chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Tách một file thô nhiều trạm (có cột station_column) thành các file theo trạm.
+    Đọc theo chunk và giữ nguyên văn bản của từng ô, các dòng được ghi nối. Vị trí byte đã tách
+    của mỗi file nguồn được lưu trong PARTITION_CHECKPOINT nên chạy lại chỉ tách phần dữ liệu mới,
+    không ghi trùng. Mọi mã trạm được kiểm tra trước khi ghi, nên mã không hợp lệ không để lại
+    file trạm ghi dở. Trả về dict {trạm: số dòng đã ghi}.
+    """
+    os.makedirs(stations_dir, exist_ok=True)
+    checkpoint_path = os.path.join(stations_dir, PARTITION_CHECKPOINT)
+    checkpoint = {}
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    source = os.path.abspath(data_path)
+    header = _raw_header(data_path)
+    if station_column not in header:
+        raise ValueError(f"File {data_path} không có cột {station_column}")
+    done = checkpoint.get(source)
+    # File nguồn bị thay tiêu đề hoặc bị cắt ngắn thì tách lại từ đầu
+    start = done['offset'] if done and done['columns'] == header \
+        and done['offset'] <= os.path.getsize(data_path) else 0
+    end = _complete_lines_end(data_path)
+    names = header if start > 0 else None
+
+    def read_chunks(**kwargs):
+        return _read_raw_chunks(data_path, chunksize, start, end, names=names,
+                                dtype=str, keep_default_na=False, **kwargs)
+
+    for chunk in read_chunks(usecols=[station_column]):
+        for station in chunk[station_column].unique():
+            check_station_id(station)
+
+    counts = {}
+    for chunk in read_chunks():
+        columns = [c for c in chunk.columns if c != station_column]
+        for station, group in chunk.groupby(station_column, sort=False):
+            path = station_raw_path(station, stations_dir)
+            new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+            group[columns].to_csv(path, mode='a', header=new_file, index=False)
+            counts[station] = counts.get(station, 0) + len(group)
+
+    checkpoint[source] = {'offset': end, 'columns': header}
+    tmp_path = checkpoint_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, checkpoint_path)
+    print(f"Đã tách {sum(counts.values())} bản ghi thành {len(counts)} trạm trong {stations_dir}")
+    return counts
+
+def _preprocess_station(args):
+    """Tiền xử lý một trạm (chạy trong tiến trình con)"""
+    station, stations_dir, processed_dir, incremental, columnar, chunksize, lag_step, lag_tolerance = args
+    paths = station_processed_paths(station, processed_dir)
+    if not columnar:
+        paths['columnar_path'] = None
+    run = preprocess_data_incremental if incremental else preprocess_data_streaming
+    rows = run(data_path=station_raw_path(station, stations_dir), chunksize=chunksize,
+               lag_step=lag_step, lag_tolerance=lag_tolerance, **paths)
+    return station, rows
+
+def preprocess_stations(stations=None, stations_dir=STATIONS_DIR, processed_dir=PROCESSED_STATIONS_DIR,
+                        incremental=False, columnar=False, chunksize=DEFAULT_CHUNKSIZE,
+                        lag_step=LAG_STEP_SECONDS, lag_tolerance=LAG_TOLERANCE_SECONDS, workers=None):
+    """
+    Tiền xử lý từng trạm độc lập trên một process pool (lọc, ngoại lệ, lag, diff theo trạm).
+    Trả về dict {trạm: số bản ghi đã xử lý}.
+    """
+    stations = stations or list_stations(stations_dir)
+    tasks = [(s, stations_dir, processed_dir, incremental, columnar, chunksize, lag_step, lag_tolerance)
+             for s in stations]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = dict(pool.map(_preprocess_station, tasks))
+    print(f"Đã tiền xử lý {len(results)} trạm, tổng cộng {sum(results.values())} bản ghi")
+    return results
+
+def _load_station_xy(args):
+    """Đọc dữ liệu đã xử lý của một trạm và tạo (X, Y) cho prediction_horizon (chạy trong tiến trình con)"""
+    station, processed_dir, prediction_horizon = args
+    df = pd.read_csv(station_processed_paths(station, processed_dir)['processed_path'])
+    feature_cols = get_feature_cols(df)
+    X = df[feature_cols].values.astype(np.float64)
+    Y = build_targets(df, [prediction_horizon])
+    mask = ~np.isnan(Y).any(axis=1)
+    return station, feature_cols, X[mask], Y[mask]
+
+def _make_models(coefs, intercepts, n_features):
+    models = []
+    for k in range(len(TARGET_COLS)):
+        model = LinearRegression()
+        model.coef_ = coefs[:, k]
+        model.intercept_ = intercepts[k]
+        model.n_features_in_ = n_features
+        models.append(model)
+    return models
+
+def _fit_station(args):
+    """Huấn luyện StandardScaler + hồi quy tuyến tính cho một trạm (chạy trong tiến trình con)"""
+    station, feature_cols, X, Y = _load_station_xy(args)
+    if len(X) < 2:
+        return station, None
+    scaler = StandardScaler()
+    intercepts, coefs = fit_multi_output(scaler.fit_transform(X), Y)
+    return station, (feature_cols, scaler, *_make_models(coefs, intercepts, len(feature_cols)), len(X))
+
+def _fit_shared(loaded):
+    """
+    Một mô hình chung cho mọi trạm với hệ số chặn riêng từng trạm:
+    giải bình phương tối thiểu trên [X đã chuẩn hóa, one-hot trạm] không có hệ số chặn chung.
+    """
+    loaded = [item for item in loaded if len(item[2]) > 0]
+    if not loaded:
+        raise ValueError("Không đủ dữ liệu để huấn luyện mô hình chung: không trạm nào có mẫu có nhãn")
+    stations = [station for station, _, _, _ in loaded]
+    feature_cols = loaded[0][1]
+    for station, cols, _, _ in loaded:
+        if cols != feature_cols:
+            raise ValueError(f"Trạm {station} có đặc trưng khác: {cols}")
+    X = np.vstack([X_s for _, _, X_s, _ in loaded])
+    Y = np.vstack([Y_s for _, _, _, Y_s in loaded])
+    station_idx = np.concatenate([np.full(len(X_s), i) for i, (_, _, X_s, _) in enumerate(loaded)])
+
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
+    onehot = np.zeros((len(X), len(stations)))
+    onehot[np.arange(len(X)), station_idx] = 1.0
+    B, _, _, _ = np.linalg.lstsq(np.hstack([X_scaled, onehot]), Y, rcond=None)
+    coefs, station_intercepts = B[:len(feature_cols)], B[len(feature_cols):]
+
+    base = station_intercepts.mean(axis=0)
+    results = {}
+    for i, station in enumerate(stations):
+        models = _make_models(coefs, station_intercepts[i], len(feature_cols))
+        results[station] = (feature_cols, scaler, *models, int((station_idx == i).sum()))
+    offsets = {s: station_intercepts[i] - base for i, s in enumerate(stations)}
+    return results, base, offsets
+
+def train_stations(stations=None, processed_dir=PROCESSED_STATIONS_DIR, prediction_horizon=6,
+                   shared=False, workers=None):
+    """
+    Huấn luyện theo trạm và ghi một file header cho mỗi trạm.
+    shared=False: mỗi trạm một mô hình riêng, huấn luyện song song trên process pool.
+    shared=True: một bộ hệ số chung, mỗi trạm chỉ khác hệ số chặn (offset); dữ liệu
+    từng trạm vẫn được đọc song song. Header của trạm ghi sẵn hệ số chặn đã cộng offset
+    nên firmware không cần thay đổi.
+    Trả về dict {trạm: (temp_model, hum_model)}.
+    """
+    if stations is None:
+        stations = sorted(d for d in os.listdir(processed_dir)
+                          if os.path.exists(station_processed_paths(d, processed_dir)['processed_path']))
+    tasks = [(s, processed_dir, prediction_horizon) for s in stations]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if shared:
+            results, base, offsets = _fit_shared(list(pool.map(_load_station_xy, tasks)))
+        else:
+            results = {s: r for s, r in pool.map(_fit_station, tasks) if r is not None}
+
+    os.makedirs(STATION_MODELS_DIR, exist_ok=True)
+    os.makedirs(STATION_COEF_DIR, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if shared:
+        with open(f"{STATION_MODELS_DIR}/shared_model_{timestamp}.pkl", 'wb') as f:
+            pickle.dump({'stations': results, 'base_intercepts': base, 'offsets': offsets,
+                         'horizon': prediction_horizon}, f)
+
+    models = {}
+    for station, (feature_cols, scaler, temp_model, hum_model, n_samples) in results.items():
+        prefix = f"{STATION_MODELS_DIR}/{station}"
+        for name, obj in [('temp_model', temp_model), ('hum_model', hum_model), ('scaler', scaler)]:
+            with open(f"{prefix}_{name}_{timestamp}.pkl", 'wb') as f:
+                pickle.dump(obj, f)
+        write_coef_header(f"{STATION_COEF_DIR}/model_coef_{station}_{timestamp}.h", scaler.mean_,
+                          scaler.scale_, temp_model, hum_model, feature_cols, n_samples)
+        models[station] = (temp_model, hum_model)
+    mode = "mô hình chung + offset theo trạm" if shared else "mô hình riêng"
+    print(f"Đã huấn luyện {len(models)} trạm ({mode}), header lưu tại {STATION_COEF_DIR}")
+    return models
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tiền xử lý và huấn luyện theo từng trạm")
+    parser.add_argument("--partition", default=None, metavar="RAW_CSV",
+                        help=f"Tách file thô nhiều trạm (có cột {STATION_COLUMN}) vào {STATIONS_DIR} trước")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Chỉ xử lý phần dữ liệu mới của mỗi trạm")
+    parser.add_argument("--columnar", action="store_true", help="Ghi thêm kho cột cho mỗi trạm")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE,
+                        help="Số bản ghi mỗi chunk khi tiền xử lý")
+    parser.add_argument("--horizon", type=int, default=6, help="Số bản ghi dự đoán phía trước")
+    parser.add_argument("--shared", action="store_true",
+                        help="Một mô hình chung với hệ số chặn riêng từng trạm")
+    parser.add_argument("--skip-train", action="store_true", help="Chỉ tiền xử lý")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Số tiến trình (mặc định: số lõi CPU)")
+    args = parser.parse_args()
+
+    if args.partition:
+        partition_raw(args.partition, chunksize=args.chunksize)
+    preprocess_stations(incremental=args.incremental, columnar=args.columnar,
+                        chunksize=args.chunksize, workers=args.workers)
+    if not args.skip_train:
+        train_stations(prediction_horizon=args.horizon, shared=args.shared, workers=args.workers)
@@ -0,0 +1,257 @@
+# models/training/streaming_profile.py
+import numpy as np
+import pandas as pd
+from timestamps import NAT_EPOCH
+
+DEFAULT_HIST_WIDTH = 0.1   # Độ rộng bin mịn của histogram (đơn vị của cột)
+MAX_HIST_BINS = 1 << 16    # Vượt quá thì gộp đôi bin để bộ nhớ không phụ thuộc giá trị ngoại lai
+DEFAULT_MAX_BUCKETS = 2000 # Số khoảng thời gian tối đa của MinMaxDownsampler
+
+class BinnedHistogram:
+    """
+    Histogram bin cố định cập nhật theo từng khối: chỉ lưu số đếm của các bin có độ rộng width,
+    mở rộng khi gặp giá trị mới và gộp đôi bin khi số bin vượt MAX_HIST_BINS.
+    """
+
+    def __init__(self, width=DEFAULT_HIST_WIDTH):
+        self.width = width
+        self.origin = 0      # Chỉ số bin (floor(x / width)) của phần tử đầu tiên trong counts
+        self.counts = None
+
+    def _coarsen(self):
+        if self.origin % 2:
+            self.counts = np.concatenate([[0], self.counts])
+            self.origin -= 1
+        if len(self.counts) % 2:
+            self.counts = np.concatenate([self.counts, [0]])
+        self.counts = self.counts.reshape(-1, 2).sum(axis=1)
+        self.origin //= 2
+        self.width *= 2
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return self
+        lo, hi = np.floor(values.min() / self.width), np.floor(values.max() / self.width)
+        if self.counts is not None:
+            lo, hi = min(lo, self.origin), max(hi, self.origin + len(self.counts) - 1)
+        while hi - lo >= MAX_HIST_BINS:
+            if self.counts is not None:
+                self._coarsen()
+            else:
+                self.width *= 2
+            lo, hi = np.floor(values.min() / self.width), np.floor(values.max() / self.width)
+            if self.counts is not None:
+                lo, hi = min(lo, self.origin), max(hi, self.origin + len(self.counts) - 1)
+        lo, hi = int(lo), int(hi)
+        if self.counts is None:
+            self.origin, self.counts = lo, np.zeros(hi - lo + 1, dtype=np.int64)
+        elif lo < self.origin or hi >= self.origin + len(self.counts):
+            counts = np.zeros(hi - lo + 1, dtype=np.int64)
+            counts[self.origin - lo:self.origin - lo + len(self.counts)] = self.counts
+            self.origin, self.counts = lo, counts
+        idx = np.floor(values / self.width).astype(np.int64) - self.origin
+        self.counts += np.bincount(idx, minlength=len(self.counts))
+        return self
+
+    @property
+    def total(self):
+        return 0 if self.counts is None else int(self.counts.sum())
+
+    def edges(self):
+        return (self.origin + np.arange(len(self.counts) + 1)) * self.width
+
+    def rebinned(self, max_bins=60):
+        """(counts, edges) với tối đa max_bins bin để vẽ, bỏ các bin rỗng ở hai đầu"""
+        nonzero = np.flatnonzero(self.counts)
+        counts = self.counts[nonzero[0]:nonzero[-1] + 1]
+        edges = self.edges()[nonzero[0]:nonzero[-1] + 2]
+        factor = int(np.ceil(len(counts) / max_bins))
+        if factor > 1:
+            pad = (-len(counts)) % factor
+            counts = np.concatenate([counts, np.zeros(pad, dtype=np.int64)]).reshape(-1, factor).sum(axis=1)
+            edges = edges[0] + np.arange(len(counts) + 1) * factor * (edges[1] - edges[0])
+        return counts, edges
+
+    def quantile(self, q):
+        """Phân vị xấp xỉ (nội suy tuyến tính trong bin), sai số không quá một bin"""
+        if not self.total:
+            return np.nan
+        cumulative = np.cumsum(self.counts)
+        target = q * cumulative[-1]
+        i = int(np.searchsorted(cumulative, target))
+        before = cumulative[i - 1] if i > 0 else 0
+        frac = (target - before) / self.counts[i] if self.counts[i] else 0.0
+        return (self.origin + i + frac) * self.width
+
+class StreamingProfile:
+    """
+    Hồ sơ thống kê một lượt cho các cột số, cập nhật theo từng chunk:
+    số giá trị, số giá trị thiếu, trung bình/phương sai (gộp Chan bỏ qua NaN), min/max,
+    histogram bin cố định (cho phân vị và biểu đồ phân phối) và ma trận hiệp phương sai
+    trên các hàng đủ giá trị (cho heatmap tương quan).
+    """
+
+    def __init__(self, columns, hist_width=DEFAULT_HIST_WIDTH):
+        self.columns = list(columns)
+        p = len(self.columns)
+        self.rows = 0
+        self.count = np.zeros(p, dtype=np.int64)
+        self.mean = np.zeros(p)
+        self.m2 = np.zeros(p)
+        self.min = np.full(p, np.inf)
+        self.max = np.full(p, -np.inf)
+        self.histograms = {col: BinnedHistogram(hist_width) for col in self.columns}
+        # Hiệp phương sai trên các hàng không thiếu cột nào
+        self.cov_count = 0
+        self.cov_mean = np.zeros(p)
+        self.comoment = np.zeros((p, p))
+
+    def update(self, df):
+        values = np.column_stack([pd.to_numeric(df[col], errors='coerce').to_numpy(np.float64)
+                                  for col in self.columns]) if len(df) else np.empty((0, len(self.columns)))
+        self.rows += len(values)
+        valid = np.isfinite(values)
+
+        # Trung bình, phương sai, min/max từng cột
+        n = valid.sum(axis=0)
+        filled = np.where(valid, values, 0.0)
+        batch_mean = np.divide(filled.sum(axis=0), n, out=np.zeros(len(n)), where=n > 0)
+        batch_m2 = np.where(valid, np.square(values - batch_mean), 0.0).sum(axis=0)
+        total = self.count + n
+        delta = batch_mean - self.mean
+        safe_total = np.maximum(total, 1)
+        self.mean = self.mean + delta * n / safe_total
+        self.m2 = self.m2 + batch_m2 + np.square(delta) * self.count * n / safe_total
+        self.count = total
+        self.min = np.minimum(self.min, np.where(valid, values, np.inf).min(axis=0, initial=np.inf))
+        self.max = np.maximum(self.max, np.where(valid, values, -np.inf).max(axis=0, initial=-np.inf))
+
+        for j, col in enumerate(self.columns):
+            self.histograms[col].update(values[valid[:, j], j])
+
+        # Hiệp phương sai trên các hàng đủ giá trị
+        complete = values[valid.all(axis=1)]
+        if len(complete):
+            nb = len(complete)
+            mean_b = complete.mean(axis=0)
+            centered = complete - mean_b
+            total = self.cov_count + nb
+            delta = mean_b - self.cov_mean
+            self.comoment += centered.T @ centered + np.outer(delta, delta) * self.cov_count * nb / total
+            self.cov_mean += delta * nb / total
+            self.cov_count = total
+        return self
+
+    def std(self, ddof=1):
+        return np.sqrt(np.divide(self.m2, self.count - ddof, out=np.full(len(self.count), np.nan),
+                                 where=self.count > ddof))
+
+    def summary(self):
+        """Bảng giống df.describe() (phân vị xấp xỉ từ histogram) kèm số giá trị thiếu"""
+        table = pd.DataFrame({
+            'count': self.count,
+            'null': self.rows - self.count,
+            'mean': np.where(self.count > 0, self.mean, np.nan),
+            'std': self.std(),
+            'min': np.where(self.count > 0, self.min, np.nan),
+            '25%': [self.histograms[c].quantile(0.25) for c in self.columns],
+            '50%': [self.histograms[c].quantile(0.5) for c in self.columns],
+            '75%': [self.histograms[c].quantile(0.75) for c in self.columns],
+            'max': np.where(self.count > 0, self.max, np.nan),
+        }, index=self.columns)
+        return table.T
+
+    def correlation(self):
+        """Ma trận tương quan Pearson từ hiệp phương sai đã tích lũy"""
+        if self.cov_count < 2:
+            return pd.DataFrame(np.nan, index=self.columns, columns=self.columns)
+        cov = self.comoment / (self.cov_count - 1)
+        std = np.sqrt(np.diag(cov))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = cov / np.outer(std, std)
+        return pd.DataFrame(corr, index=self.columns, columns=self.columns)
+
+class MinMaxDownsampler:
+    """
+    Giảm mẫu chuỗi thời gian giữ hình dạng bằng cách chia trục thời gian thành các khoảng
+    bằng nhau và giữ điểm nhỏ nhất và lớn nhất (kèm thời điểm) của từng cột trong mỗi khoảng,
+    nên các đỉnh nhọn vẫn còn trên biểu đồ. Độ rộng khoảng tự nhân đôi khi số khoảng vượt
+    max_buckets, vì vậy bộ nhớ không phụ thuộc số bản ghi và không cần biết trước khoảng thời gian.
+    """
+
+    def __init__(self, columns, max_buckets=DEFAULT_MAX_BUCKETS):
+        self.columns = list(columns)
+        self.max_buckets = max_buckets
+        self.width = 1  # giây
+        self.keys = np.empty(0, dtype=np.int64)
+        k = len(self.columns)
+        self.min_t = np.empty((0, k), dtype=np.int64)
+        self.min_v = np.empty((0, k))
+        self.max_t = np.empty((0, k), dtype=np.int64)
+        self.max_v = np.empty((0, k))
+
+    @staticmethod
+    def _first_per_group(hit, group, n_groups):
+        """Chỉ số hàng đầu tiên thỏa hit trong mỗi nhóm (mỗi nhóm luôn có ít nhất một hàng)"""
+        rows = np.flatnonzero(hit)
+        first = np.r_[True, group[rows[1:]] != group[rows[:-1]]]
+        return rows[first][:n_groups]
+
+    def _reduce(self, keys, min_t, min_v, max_t, max_v):
+        if len(keys) > 1 and np.any(keys[1:] < keys[:-1]):
+            order = np.argsort(keys, kind='stable')
+            keys, min_t, min_v, max_t, max_v = keys[order], min_t[order], min_v[order], max_t[order], max_v[order]
+        new_group = np.r_[True, keys[1:] != keys[:-1]]
+        starts = np.flatnonzero(new_group)
+        group = np.cumsum(new_group) - 1
+        out_min_t = np.empty((len(starts), len(self.columns)), dtype=np.int64)
+        out_max_t = np.empty_like(out_min_t)
+        group_min = np.minimum.reduceat(min_v, starts, axis=0)
+        group_max = np.maximum.reduceat(max_v, starts, axis=0)
+        for j in range(len(self.columns)):
+            out_min_t[:, j] = min_t[self._first_per_group(min_v[:, j] == group_min[group, j], group, len(starts)), j]
+            out_max_t[:, j] = max_t[self._first_per_group(max_v[:, j] == group_max[group, j], group, len(starts)), j]
+        self.keys, self.min_t, self.min_v, self.max_t, self.max_v = \
+            keys[starts], out_min_t, group_min, out_max_t, group_max
+
+    def update(self, epochs, df):
+        epochs = np.asarray(epochs, dtype=np.int64)
+        values = np.column_stack([pd.to_numeric(df[col], errors='coerce').to_numpy(np.float64)
+                                  for col in self.columns])
+        keep = epochs != NAT_EPOCH
+        epochs, values = epochs[keep], values[keep]
+        if len(epochs) == 0:
+            return self
+
+        # Nhân đôi độ rộng khoảng cho tới khi toàn bộ dữ liệu nằm trong max_buckets khoảng
+        lo, hi = epochs.min(), epochs.max()
+        if len(self.keys):
+            lo, hi = min(lo, self.keys[0] * self.width), max(hi, self.keys[-1] * self.width)
+        factor = 1
+        while hi // (self.width * factor) - lo // (self.width * factor) >= self.max_buckets:
+            factor *= 2
+        self.width *= factor
+
+        # NaN được thay bằng +inf/-inf để không bao giờ là min/max nếu khoảng còn giá trị khác
+        chunk_keys = epochs // self.width
+        t = np.repeat(epochs[:, None], len(self.columns), axis=1)
+        self._reduce(np.concatenate([self.keys // factor, chunk_keys]),
+                     np.concatenate([self.min_t, t]),
+                     np.concatenate([self.min_v, np.where(np.isnan(values), np.inf, values)]),
+                     np.concatenate([self.max_t, t]),
+                     np.concatenate([self.max_v, np.where(np.isnan(values), -np.inf, values)]))
+        return self
+
+    def points(self, col):
+        """(epoch, giá trị) đã giảm mẫu của một cột, theo thứ tự thời gian"""
+        j = self.columns.index(col)
+        t = np.concatenate([self.min_t[:, j], self.max_t[:, j]])
+        v = np.concatenate([self.min_v[:, j], self.max_v[:, j]])
+        keep = np.isfinite(v)
+        t, v = t[keep], v[keep]
+        order = np.argsort(t, kind='stable')
+        t, v = t[order], v[order]
+        unique = np.r_[True, (t[1:] != t[:-1]) | (v[1:] != v[:-1])]
+        return t[unique], v[unique]
@@ -0,0 +1,165 @@
+# models/training/sweep.py
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from sklearn.feature_selection import SelectKBest, f_regression
+from sklearn.linear_model import Lasso, LinearRegression, Ridge
+from sklearn.metrics import mean_squared_error, r2_score
+from sklearn.model_selection import KFold
+from sklearn.preprocessing import StandardScaler
+from train_model import (DEFAULT_HORIZONS, MODELS_DIR, TARGET_COLS, build_targets,
+                         get_feature_cols, load_processed_data)
+
+# Các mô hình có thể quét, tham số được truyền dạng "tên:alpha", ví dụ "ridge:0.1"
+MODEL_FACTORIES = {
+    'linear': lambda alpha: LinearRegression(),
+    'ridge': lambda alpha: Ridge(alpha=alpha),
+    'lasso': lambda alpha: Lasso(alpha=alpha, max_iter=10000),
+}
+DEFAULT_MODELS = ['linear', 'ridge:0.1', 'ridge:1.0', 'ridge:10.0', 'lasso:0.01']
+
+# Mảng dùng chung trong mỗi tiến trình con (gắn vào shared memory một lần khi khởi tạo)
+_shared = {}
+
+def _parse_model(spec):
+    name, _, alpha = spec.partition(':')
+    if name not in MODEL_FACTORIES:
+        raise ValueError(f"Mô hình không hỗ trợ: {name} (chọn trong {list(MODEL_FACTORIES)})")
+    return name, float(alpha) if alpha else 1.0
+
+def _to_shared(array):
+    """Chép mảng vào một khối shared memory, trả về (khối, mô tả để tiến trình con gắn vào)"""
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+def _attach_shared(specs):
+    """Initializer của tiến trình con: gắn các mảng X, Y từ shared memory (không sao chép)"""
+    for key, (name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=name)
+        _shared[key + '_shm'] = shm  # giữ tham chiếu để bộ nhớ không bị đóng
+        _shared[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+def _evaluate(task):
+    """
+    Đánh giá một tổ hợp (fold, horizon, mô hình, k) cho cả hai mục tiêu.
+    Chọn đặc trưng chỉ dựa trên tập huấn luyện của fold để không rò rỉ dữ liệu kiểm tra.
+    Fold được truyền dạng (start, stop) của khoảng kiểm tra liên tiếp; tập huấn luyện là phần còn lại.
+    """
+    fold, (start, stop), h_idx, horizon, spec, k = task
+    X, Y = _shared['X'], _shared['Y']
+    test_idx = np.arange(start, stop)
+    train_idx = np.r_[0:start, stop:len(X)]
+    name, alpha = _parse_model(spec)
+    n_h = Y.shape[1] // len(TARGET_COLS)
+
+    result = {'horizon': horizon, 'model': spec, 'k': k, 'fold': fold}
+    for t, target in enumerate(TARGET_COLS):
+        y = Y[:, t * n_h + h_idx]
+        train = train_idx[~np.isnan(y[train_idx])]
+        test = test_idx[~np.isnan(y[test_idx])]
+        if len(train) < 2 or len(test) < 1:
+            result[f'{target}_rmse'] = np.nan
+            result[f'{target}_r2'] = np.nan
+            continue
+
+        X_train, X_test = X[train], X[test]
+        if k != 'all' and int(k) < X.shape[1]:
+            selector = SelectKBest(f_regression, k=int(k)).fit(X_train, y[train])
+            X_train, X_test = selector.transform(X_train), selector.transform(X_test)
+
+        model = MODEL_FACTORIES[name](alpha).fit(X_train, y[train])
+        pred = model.predict(X_test)
+        result[f'{target}_rmse'] = np.sqrt(mean_squared_error(y[test], pred))
+        result[f'{target}_r2'] = r2_score(y[test], pred) if len(test) > 1 else np.nan
+    return result
+
+def run_sweep(horizons=DEFAULT_HORIZONS, models=DEFAULT_MODELS, ks=('all',), cv=5,
+              data_format='csv', workers=None, output_path=None):
+    """
+    Quét mọi tổ hợp fold × horizon × mô hình × k của SelectKBest trên một process pool.
+    Ma trận đặc trưng đã chuẩn hóa và ma trận mục tiêu của mọi horizon được đặt vào
+    shared memory một lần, các tiến trình con chỉ nhận biên (start, stop) của fold và tham số.
+    Các fold là KFold liên tiếp không xáo trộn, giống cross_val_score(cv=cv) trong train_models().
+    Trả về bảng xếp hạng (DataFrame) trung bình theo fold, đồng thời lưu ra CSV.
+    """
+    horizons = sorted(set(horizons))
+    for spec in models:
+        _parse_model(spec)
+
+    df = load_processed_data(data_format)
+    feature_cols = get_feature_cols(df)
+    X = StandardScaler().fit_transform(df[feature_cols].values.astype(np.float64))
+    Y = build_targets(df, horizons)
+
+    cv = min(cv, len(X) - horizons[-1])
+    if cv < 2:
+        raise ValueError("Không đủ dữ liệu cho cross-validation")
+    # KFold không xáo trộn nên mỗi tập kiểm tra là một khoảng liên tiếp
+    folds = [(int(test_idx[0]), int(test_idx[-1]) + 1) for _, test_idx in KFold(n_splits=cv).split(X)]
+    tasks = [(fold, bounds, h_idx, h, spec, str(k))
+             for fold, bounds in enumerate(folds)
+             for h_idx, h in enumerate(horizons)
+             for spec in models
+             for k in ks]
+
+    workers = workers or os.cpu_count() or 1
+    print(f"Dữ liệu có {len(X)} mẫu, {len(feature_cols)} đặc trưng")
+    print(f"Đang đánh giá {len(tasks)} tổ hợp trên {workers} tiến trình...")
+
+    blocks = []
+    try:
+        specs = {}
+        for key, array in [('X', X), ('Y', Y)]:
+            shm, specs[key] = _to_shared(array)
+            blocks.append(shm)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach_shared,
+                                 initargs=(specs,)) as pool:
+            chunksize = max(1, len(tasks) // (workers * 4))
+            results = list(pool.map(_evaluate, tasks, chunksize=chunksize))
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    # Gộp kết quả theo fold thành bảng xếp hạng
+    scores = pd.DataFrame(results)
+    metric_cols = [f'{t}_{m}' for t in TARGET_COLS for m in ('rmse', 'r2')]
+    leaderboard = scores.groupby(['horizon', 'model', 'k'])[metric_cols].agg(['mean', 'std'])
+    leaderboard.columns = [f'{col}_{stat}' for col, stat in leaderboard.columns]
+    leaderboard['mean_r2'] = leaderboard[[f'{t}_r2_mean' for t in TARGET_COLS]].mean(axis=1)
+    leaderboard = leaderboard.sort_values('mean_r2', ascending=False).reset_index()
+
+    if output_path is None:
+        os.makedirs(MODELS_DIR, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_path = f"{MODELS_DIR}/sweep_leaderboard_{timestamp}.csv"
+    leaderboard.to_csv(output_path, index=False)
+
+    print("\n=== BẢNG XẾP HẠNG ===")
+    print(leaderboard.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    print(f"\nĐã lưu bảng xếp hạng vào: {output_path}")
+    return leaderboard
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quét song song horizon, mô hình và số đặc trưng")
+    parser.add_argument("--data-format", choices=['csv', 'columnar'], default='csv',
+                        help="Định dạng dữ liệu đã xử lý")
+    parser.add_argument("--horizons", type=int, nargs='+', default=DEFAULT_HORIZONS,
+                        help="Các horizon cần quét")
+    parser.add_argument("--models", nargs='+', default=DEFAULT_MODELS,
+                        help="Các mô hình dạng tên[:alpha], ví dụ: linear ridge:1.0 lasso:0.01")
+    parser.add_argument("--k", nargs='+', default=['all'],
+                        help="Các giá trị k của SelectKBest ('all' = dùng mọi đặc trưng)")
+    parser.add_argument("--cv", type=int, default=5, help="Số fold cross-validation")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Số tiến trình (mặc định: số lõi CPU)")
+    parser.add_argument("--output", default=None, help="Đường dẫn file CSV bảng xếp hạng")
+    args = parser.parse_args()
+
+    run_sweep(args.horizons, args.models, args.k, args.cv, args.data_format,
+              args.workers, args.output)
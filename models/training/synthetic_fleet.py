@@ -0,0 +1,279 @@
+# models/training/synthetic_fleet.py
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit
+import numpy as np
+import pandas as pd
+from ingest_server import MISSING_VALUE, RAW_COLUMNS
+from station_ids import STATION_COLUMN, STATIONS_DIR
+
+SECONDS_PER_DAY = 86400
+DEFAULT_START = "2025-05-20 15:30:00"
+DEFAULT_BLOCK_ROWS = 500000  # Số bản ghi mỗi khối sinh ra / ghi xuống đĩa
+
+# Tham số mô phỏng mặc định, gần với dữ liệu thật ở Hà Nội trong weather_data.csv
+DEFAULT_PARAMS = {
+    'interval': 60,          # ESP32 gửi mỗi 60 giây...
+    'jitter': 70,            # ...nhưng thường trễ thêm tới ~70 giây do mạng
+    'temp_mean': 30.0,       # Nhiệt độ trung bình (°C), mỗi trạm lệch thêm ±2°C
+    'temp_amplitude': 4.0,   # Biên độ dao động ngày đêm (°C), cao nhất lúc ~14h
+    'hum_mean': 70.0,        # Độ ẩm trung bình (%), ngược pha với nhiệt độ
+    'hum_per_degree': 3.0,   # Độ ẩm giảm bao nhiêu % khi nhiệt độ tăng 1°C
+    'api_temp_offset': 1.5,  # API thường cao hơn cảm biến trong nhà
+    'api_hum_offset': -8.0,
+    'api_period': 300,       # API chỉ được cập nhật mỗi 5 phút (API_INTERVAL)
+    'p_blank': 0.02,         # Bản ghi N/A (thiết bị chưa có dữ liệu)
+    'p_zero': 0.01,          # Bản ghi DHT bằng 0 (đọc lỗi)
+    'p_spike': 0.002,        # Giá trị đột biến (ngoại lệ)
+    'p_gap': 0.0005,         # Mất kết nối: nhảy thời gian 10 phút - 6 giờ
+}
+
+def _format_timestamps(epochs):
+    """Vector hóa định dạng 'dd/mm/YYYY HH:MM:SS' bằng cách hoán vị ký tự của chuỗi ISO"""
+    iso = np.datetime_as_string(epochs.astype('datetime64[s]'), unit='s').astype('S19')
+    chars = iso.view(np.uint8).reshape(-1, 19)  # YYYY-MM-DDTHH:MM:SS
+    out = np.empty_like(chars)
+    out[:, 0:2] = chars[:, 8:10]
+    out[:, 2] = ord('/')
+    out[:, 3:5] = chars[:, 5:7]
+    out[:, 5] = ord('/')
+    out[:, 6:10] = chars[:, 0:4]
+    out[:, 10] = ord(' ')
+    out[:, 11:19] = chars[:, 11:19]
+    return out.reshape(-1).view('S19').astype(str)
+
+class StationSimulator:
+    """
+    Sinh dữ liệu của một trạm ESP32 theo từng khối, giữ trạng thái (thời gian, giá trị API,
+    bộ sinh số ngẫu nhiên) giữa các khối để có thể tạo tới hàng trăm triệu bản ghi
+    với bộ nhớ cố định.
+    """
+
+    def __init__(self, station, start_epoch, seed, params=None):
+        self.station = station
+        self.params = dict(DEFAULT_PARAMS, **(params or {}))
+        self.rng = np.random.default_rng(seed)
+        self.epoch = int(start_epoch) + int(self.rng.integers(0, self.params['interval']))
+        self.temp_offset = self.rng.uniform(-2, 2)
+        self.hum_offset = self.rng.uniform(-5, 5)
+        self.drift = 0.0
+        self.api_slot = None
+        self.api_value = (0.0, 0.0)
+
+    def next_block(self, n_rows):
+        """Trả về DataFrame n_rows bản ghi: epoch (int64) và 4 cột số (NaN = N/A)"""
+        p, rng = self.params, self.rng
+        steps = p['interval'] + rng.integers(0, p['jitter'] + 1, n_rows)
+        gaps = rng.random(n_rows) < p['p_gap']
+        steps = steps + np.where(gaps, rng.integers(600, 6 * 3600, n_rows), 0)
+        epochs = self.epoch + np.cumsum(steps)
+        self.epoch = int(epochs[-1]) if n_rows else self.epoch
+
+        # Chu kỳ ngày đêm (cao nhất ~14h, thấp nhất ~2h) + trôi chậm theo ngày + nhiễu cảm biến
+        hours = (epochs % SECONDS_PER_DAY) / 3600.0
+        diurnal = np.sin(2 * np.pi * (hours - 8) / 24)
+        drift = self.drift + np.cumsum(rng.normal(0, 0.002, n_rows))
+        self.drift = float(drift[-1]) if n_rows else self.drift
+        temp_true = p['temp_mean'] + self.temp_offset + p['temp_amplitude'] * diurnal + drift
+        hum_true = p['hum_mean'] + self.hum_offset - p['hum_per_degree'] * (temp_true - p['temp_mean'])
+        temp_dht = np.round(temp_true + rng.normal(0, 0.2, n_rows), 1)  # DHT11 có độ phân giải 0.1
+        hum_dht = np.clip(np.round(hum_true + rng.normal(0, 1.0, n_rows)), 0, 100)
+
+        # API: giá trị giữ nguyên trong mỗi chu kỳ api_period, lệch cố định so với cảm biến
+        slots = epochs // p['api_period']
+        new_slot = np.r_[slots[:1] != self.api_slot, slots[1:] != slots[:-1]]
+        api_t = np.round(temp_true + p['api_temp_offset'] + rng.normal(0, 0.5, n_rows), 2)
+        api_h = np.clip(np.round(hum_true + p['api_hum_offset'] + rng.normal(0, 2.0, n_rows)), 0, 100)
+        idx = np.maximum.accumulate(np.where(new_slot, np.arange(n_rows), -1))
+        temp_api = np.where(idx >= 0, api_t[np.maximum(idx, 0)], self.api_value[0])
+        hum_api = np.where(idx >= 0, api_h[np.maximum(idx, 0)], self.api_value[1])
+        if n_rows:
+            self.api_slot = slots[-1]
+            self.api_value = (temp_api[-1], hum_api[-1])
+
+        # Đột biến, bản ghi 0 và bản ghi N/A mà preprocess_data() phải lọc bỏ
+        spikes = rng.random(n_rows) < p['p_spike']
+        temp_dht = np.where(spikes, temp_dht + rng.choice([-15.0, 15.0], n_rows), temp_dht)
+        hum_dht = np.where(spikes, np.clip(hum_dht + rng.choice([-40.0, 40.0], n_rows), 0, 100), hum_dht)
+        zeros = rng.random(n_rows) < p['p_zero']
+        temp_dht = np.where(zeros, 0.0, temp_dht)
+        hum_dht = np.where(zeros, 0.0, hum_dht)
+        blank = rng.random(n_rows) < p['p_blank']
+
+        values = np.column_stack([temp_dht, hum_dht, temp_api, hum_api])
+        values[blank] = np.nan
+        df = pd.DataFrame(values, columns=RAW_COLUMNS[1:])
+        df.insert(0, 'epoch', epochs.astype(np.int64))
+        return df
+
+def _to_raw_frame(block, station=None):
+    """Khối mô phỏng -> DataFrame đúng định dạng file thô (thêm station_id nếu cần)"""
+    df = block[RAW_COLUMNS[1:]].copy()
+    df.insert(0, RAW_COLUMNS[0], _format_timestamps(block['epoch'].values))
+    if station is not None:
+        df[STATION_COLUMN] = station
+    return df
+
+def _write_frame(df, path, header):
+    df.to_csv(path, mode='w' if header else 'a', header=header, index=False,
+              float_format='%.2f', na_rep=MISSING_VALUE)
+
+def _station_ids(n_stations):
+    return [f"station-{i:04d}" for i in range(n_stations)]
+
+def _rows_per_station(n_rows, n_stations):
+    base, extra = divmod(n_rows, n_stations)
+    return [base + (1 if i < extra else 0) for i in range(n_stations)]
+
+def _generate_station_file(args):
+    """Sinh toàn bộ dữ liệu của một trạm vào một file riêng (chạy trong tiến trình con)"""
+    station, n_rows, path, start_epoch, seed, params, block_rows = args
+    sim = StationSimulator(station, start_epoch, seed, params)
+    _write_frame(pd.DataFrame(columns=RAW_COLUMNS), path, header=True)
+    written = 0
+    while written < n_rows:
+        block = sim.next_block(min(block_rows, n_rows - written))
+        _write_frame(_to_raw_frame(block), path, header=False)
+        written += len(block)
+    return station, written
+
+def generate_fleet(n_stations, n_rows, output, per_station=False, start=DEFAULT_START, seed=0,
+                   params=None, block_rows=DEFAULT_BLOCK_ROWS, workers=None):
+    """
+    Sinh n_rows bản ghi cho n_stations trạm.
+    per_station=True: mỗi trạm một file '<output>/<trạm>.csv' đúng định dạng file thô
+    (dùng trực tiếp với stations.py), các trạm được sinh song song trên process pool.
+    per_station=False: một file output theo thứ tự thời gian; với nhiều trạm có thêm cột
+    station_id để stations.partition_raw() tách ra.
+    Trả về tổng số bản ghi đã ghi.
+    """
+    start_epoch = int(pd.Timestamp(start).timestamp())
+    stations = _station_ids(n_stations)
+    counts = _rows_per_station(n_rows, n_stations)
+    t0 = time.perf_counter()
+
+    if per_station:
+        os.makedirs(output, exist_ok=True)
+        tasks = [(s, c, os.path.join(output, f"{s}.csv"), start_epoch, seed + i, params, block_rows)
+                 for i, (s, c) in enumerate(zip(stations, counts))]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            total = sum(n for _, n in pool.map(_generate_station_file, tasks))
+    else:
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        # Các trạm được sinh xen kẽ theo khối và sắp xếp theo thời gian trong mỗi khối,
+        # giống thứ tự các bản ghi đến máy chủ
+        sims = [StationSimulator(s, start_epoch, seed + i, params) for i, s in enumerate(stations)]
+        remaining = list(counts)
+        per_block = max(1, block_rows // n_stations)
+        columns = RAW_COLUMNS + ([STATION_COLUMN] if n_stations > 1 else [])
+        _write_frame(pd.DataFrame(columns=columns), output, header=True)
+        total = 0
+        while any(remaining):
+            frames, epochs = [], []
+            for i, sim in enumerate(sims):
+                n = min(per_block, remaining[i])
+                if n:
+                    block = sim.next_block(n)
+                    frames.append(_to_raw_frame(block, sim.station if n_stations > 1 else None))
+                    epochs.append(block['epoch'].values)
+                    remaining[i] -= n
+            order = np.argsort(np.concatenate(epochs), kind='stable')
+            _write_frame(pd.concat(frames, ignore_index=True).iloc[order], output, header=False)
+            total += len(order)
+
+    elapsed = time.perf_counter() - t0
+    print(f"Đã sinh {total} bản ghi cho {n_stations} trạm vào {output} "
+          f"trong {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} bản ghi/giây)")
+    return total
+
+async def _post_batches(host, port, path, batches):
+    """Một kết nối keep-alive gửi lần lượt các lô JSON"""
+    reader, writer = await asyncio.open_connection(host, port)
+    sent = 0
+    try:
+        for batch in batches:
+            body = json.dumps({'readings': batch}).encode('utf-8')
+            writer.write(f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                         f"Content-Length: {len(body)}\r\n\r\n".encode('ascii') + body)
+            await writer.drain()
+            status = await reader.readline()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.strip().lower() == 'content-length':
+                    length = int(value)
+            await reader.readexactly(length)
+            if b' 200 ' not in status:
+                raise RuntimeError(f"Máy chủ trả về lỗi: {status.decode('latin-1').strip()}")
+            sent += len(batch)
+    finally:
+        writer.close()
+    return sent
+
+def _readings(block, station):
+    """Khối mô phỏng -> danh sách bản ghi JSON cho ingest_server.py (NaN -> null)"""
+    timestamps = _format_timestamps(block['epoch'].values)
+    values = block[RAW_COLUMNS[1:]].values
+    return [dict({'timestamp': ts, STATION_COLUMN: station},
+                 **{col: (None if v != v else float(v)) for col, v in zip(RAW_COLUMNS[1:], row)})
+            for ts, row in zip(timestamps, values)]
+
+def stream_fleet(url, n_stations, n_rows, batch_size=100, start=DEFAULT_START, seed=0, params=None):
+    """
+    Gửi dữ liệu mô phỏng tới ingest_server.py: mỗi trạm một kết nối keep-alive,
+    gửi các lô batch_size bản ghi song song. Trả về số bản ghi đã gửi.
+    """
+    parts = urlsplit(url)
+    path = parts.path or '/ingest'
+    start_epoch = int(pd.Timestamp(start).timestamp())
+    counts = _rows_per_station(n_rows, n_stations)
+
+    def batches(i, station):
+        sim = StationSimulator(station, start_epoch, seed + i, params)
+        remaining = counts[i]
+        while remaining > 0:
+            n = min(batch_size, remaining)
+            yield _readings(sim.next_block(n), station)
+            remaining -= n
+
+    async def run():
+        tasks = [_post_batches(parts.hostname, parts.port or 80, path, batches(i, s))
+                 for i, s in enumerate(_station_ids(n_stations))]
+        return sum(await asyncio.gather(*tasks))
+
+    t0 = time.perf_counter()
+    total = asyncio.run(run())
+    elapsed = time.perf_counter() - t0
+    print(f"Đã gửi {total} bản ghi của {n_stations} trạm tới {url} "
+          f"trong {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} bản ghi/giây)")
+    return total
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sinh dữ liệu mô phỏng cho nhiều trạm ESP32")
+    parser.add_argument("--stations", type=int, default=1, help="Số trạm")
+    parser.add_argument("--rows", type=int, default=100000, help="Tổng số bản ghi (10^3 - 10^8)")
+    parser.add_argument("--output", default=None,
+                        help="File CSV (hoặc thư mục với --per-station) để ghi kết quả")
+    parser.add_argument("--per-station", action="store_true",
+                        help=f"Mỗi trạm một file trong thư mục output (mặc định {STATIONS_DIR})")
+    parser.add_argument("--url", default=None,
+                        help="Gửi tới ingest_server.py thay vì ghi file, ví dụ http://localhost:8080/ingest")
+    parser.add_argument("--batch-size", type=int, default=100, help="Số bản ghi mỗi request khi gửi")
+    parser.add_argument("--start", default=DEFAULT_START, help="Thời điểm bắt đầu")
+    parser.add_argument("--seed", type=int, default=0, help="Seed của bộ sinh số ngẫu nhiên")
+    parser.add_argument("--workers", type=int, default=None, help="Số tiến trình khi dùng --per-station")
+    args = parser.parse_args()
+
+    if args.url:
+        stream_fleet(args.url, args.stations, args.rows, args.batch_size, args.start, args.seed)
+    else:
+        output = args.output or (STATIONS_DIR if args.per_station else "../../data/raw/synthetic_data.csv")
+        generate_fleet(args.stations, args.rows, output, args.per_station, args.start, args.seed,
+                       workers=args.workers)
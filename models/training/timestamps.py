@@ -0,0 +1,58 @@
+# models/training/timestamps.py
+import numpy as np
+import pandas as pd
+
+# Định dạng cột Timestamp do Google Sheets xuất ra, ví dụ '20/05/2025 15:44:17'
+# (giờ có thể chỉ có 1 chữ số: '21/05/2025 0:06:10')
+TIMESTAMP_COLUMN = "Timestamp"
+EPOCH_COLUMN = "timestamp"  # Cột int64 epoch (giây) dùng chung cho mọi bước phía sau
+TIMESTAMP_FORMAT = "%d/%m/%Y %H:%M:%S"
+NAT_EPOCH = np.iinfo(np.int64).min  # Giá trị epoch cho timestamp không đọc được
+
+SECONDS_PER_DAY = 86400
+
+def parse_timestamps(values):
+    """
+    Chuyển chuỗi Timestamp sang int64 epoch (giây).
+    Chỉ phân tích mỗi giá trị khác nhau một lần (dữ liệu thường có nhiều bản ghi
+    trùng giây) với định dạng cố định, tránh việc pandas phải tự đoán dayfirst.
+    Giá trị không hợp lệ trả về NAT_EPOCH.
+    """
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    parsed = pd.to_datetime(pd.Index(uniques, dtype=object), format=TIMESTAMP_FORMAT,
+                            errors='coerce')
+    unique_epochs = parsed.values.astype('datetime64[s]').astype(np.int64)
+
+    epochs = np.full(len(codes), NAT_EPOCH, dtype=np.int64)
+    valid = codes >= 0  # codes = -1 với giá trị thiếu
+    epochs[valid] = unique_epochs[codes[valid]]
+    return epochs
+
+def add_epoch_column(df):
+    """Thêm cột EPOCH_COLUMN từ cột Timestamp (nếu chưa có)"""
+    if EPOCH_COLUMN not in df.columns and TIMESTAMP_COLUMN in df.columns:
+        df[EPOCH_COLUMN] = parse_timestamps(df[TIMESTAMP_COLUMN])
+    return df
+
+def epoch_to_datetime(epochs):
+    """Chuyển int64 epoch sang datetime64 để vẽ biểu đồ"""
+    epochs = np.asarray(epochs, dtype=np.int64)
+    return np.where(epochs == NAT_EPOCH, np.datetime64('NaT'),
+                    epochs.astype('datetime64[s]'))
+
+def time_features(epochs):
+    """
+    Tính hour, day_of_week (thứ Hai = 0 giống pandas) và day_of_year trực tiếp
+    từ epoch bằng số học numpy.
+    """
+    epochs = np.asarray(epochs, dtype=np.int64)
+    days = epochs // SECONDS_PER_DAY
+    hour = (epochs % SECONDS_PER_DAY) // 3600
+    day_of_week = (days + 3) % 7  # 01/01/1970 là thứ Năm
+    dates = days.astype('datetime64[D]')
+    day_of_year = (dates - dates.astype('datetime64[Y]')).astype(np.int64) + 1
+    return {
+        'hour': hour,
+        'day_of_week': day_of_week,
+        'day_of_year': day_of_year,
+    }
@@ -8,73 +8,212 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.feature_selection import SelectKBest, f_regression
 import matplotlib.pyplot as plt
 import pickle
+import io
+import json
 import os
+import argparse
 from datetime import datetime
+from columnar_store import load_columnar_frame
+from online_regression import NormalEquations
+from instrumentation import add_arguments, configure_from_args, quiet, stage
+from predictor import save_artifact
+from registry import data_fingerprint, extend_fingerprint, register_run
+from feature_cache import DEFAULT_MAX_BYTES, FeatureCache, cache_key
+from preprocess_data import IMPORTANT_COLS, OUTLIER_SIGMA
+from resample import GAP_COLUMN, fixed_horizon_mask
+from rolling_features import device_code
+from augmentation import DEFAULT_REPLICAS, augment
 
 # Đường dẫn đến file dữ liệu
 DATA_PATH = "../../data/processed/processed_data.csv"  # Đường dẫn đến dữ liệu đã xử lý
+COLUMNAR_PATH = "../../data/processed/processed_data_columnar"  # Kho cột do preprocess_data(columnar=True) tạo
 MODELS_DIR = "../saved_models"
 COEF_DIR = "../coefficients"
+ONLINE_STATE_PATH = f"{MODELS_DIR}/online_state.npz"  # Thống kê XᵀX/XᵀY cho huấn luyện tăng dần
 
-def train_models(prediction_horizon=6):
-    """Huấn luyện mô hình với dữ liệu đã xử lý"""
-    # Tạo thư mục cho models nếu chưa tồn tại
-    os.makedirs(MODELS_DIR, exist_ok=True)
-    os.makedirs(COEF_DIR, exist_ok=True)
-    
-    # Đọc dữ liệu đã xử lý
+# Các cột mục tiêu và các mốc dự đoán mặc định khi huấn luyện nhiều horizon cùng lúc
+TARGET_COLS = ['temp_dht', 'hum_dht']
+DEFAULT_HORIZONS = [1, 3, 6, 12, 24]
+
+# Tăng cường dữ liệu khi ít hơn MIN_ROWS bản ghi; chọn tối đa SELECT_K đặc trưng khi
+# số đặc trưng vượt SELECT_FEATURE_RATIO số mẫu
+MIN_ROWS = 30
+SELECT_K = 5
+SELECT_FEATURE_RATIO = 0.2
+
+def load_processed_data(data_format='csv'):
+    """Đọc dữ liệu đã xử lý từ CSV hoặc từ kho cột (memory-map)"""
+    if data_format == 'columnar':
+        print(f"Đang đọc dữ liệu dạng cột từ {COLUMNAR_PATH}...")
+        return load_columnar_frame(COLUMNAR_PATH)
     print(f"Đang đọc dữ liệu từ {DATA_PATH}...")
-    df = pd.read_csv(DATA_PATH)
+    return pd.read_csv(DATA_PATH)
+
+def data_source_path(data_format='csv'):
+    """File hoặc thư mục dữ liệu đã xử lý mà load_processed_data() đọc"""
+    return COLUMNAR_PATH if data_format == 'columnar' else DATA_PATH
+
+def get_feature_cols(df):
+    """Các cột số dùng làm đặc trưng (ngoại trừ timestamp, cờ khoảng trống của resample và các cột mục tiêu)"""
+    feature_cols = df.select_dtypes(include=['float64', 'int64', 'float32']).columns.tolist()
+    for col in ['timestamp', GAP_COLUMN] + TARGET_COLS:
+        if col in feature_cols:
+            feature_cols.remove(col)
+    return feature_cols
+
+def build_targets(df, horizons):
+    """
+    Ma trận mục tiêu Y với các cột [temp_h1, ..., temp_hN, hum_h1, ..., hum_hN],
+    mỗi cột là giá trị sau h bản ghi (NaN ở h hàng cuối).
+    Với dữ liệu đã resample (có cột GAP_COLUMN), mục tiêu không cách đúng h nhịp
+    (vượt qua khoảng mất dữ liệu) cũng là NaN, xem fixed_horizon_mask().
+    """
+    n = len(df)
+    Y = np.full((n, len(TARGET_COLS) * len(horizons)), np.nan)
+    for t, target in enumerate(TARGET_COLS):
+        values = df[target].values.astype(np.float64)
+        for j, h in enumerate(horizons):
+            Y[:max(n - h, 0), t * len(horizons) + j] = values[h:]
+    if GAP_COLUMN in df.columns and 'timestamp' in df.columns:
+        for j, h in enumerate(horizons):
+            invalid = ~fixed_horizon_mask(df['timestamp'].values, df[GAP_COLUMN].values, h)
+            Y[invalid, j::len(horizons)] = np.nan
+    return Y
+
+def fit_multi_output(X, Y):
+    """
+    Bình phương tối thiểu cho nhiều mục tiêu trong một lần giải:
+    trả về (intercepts dạng (m,), coefs dạng (số đặc trưng, m)).
+    """
+    Xa = np.column_stack([np.ones(len(X)), X])
+    B, _, _, _ = np.linalg.lstsq(Xa, Y, rcond=None)
+    return B[0], B[1:]
+
+def _format_floats(values):
+    return ", ".join(f"{v:.6f}f" for v in values)
+
+def write_coef_header(coef_file, feature_means, feature_scales, temp_model, hum_model,
+                      feature_cols, n_samples):
+    """Ghi file header hệ số mô hình cho ESP32"""
+    with open(coef_file, 'w', encoding='utf-8') as f:
+        f.write("// Hệ số mô hình dự đoán thời tiết\n")
+        f.write("// Được tạo tự động bởi script train_model.py\n")
+        f.write(f"// Thời gian: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write(f"// Dựa trên {n_samples} mẫu dữ liệu\n\n")
+
+        f.write("#ifndef MODEL_COEF_H\n")
+        f.write("#define MODEL_COEF_H\n\n")
+
+        # Lưu thông tin chuẩn hóa
+        f.write("// Thông tin chuẩn hóa dữ liệu\n")
+        f.write("const float feature_means[] = {" + _format_floats(feature_means) + "};\n\n")
+        f.write("const float feature_scales[] = {" + _format_floats(feature_scales) + "};\n\n")
+
+        f.write("// Hệ số cho mô hình nhiệt độ\n")
+        f.write(f"const float temp_intercept = {temp_model.intercept_:.6f}f;\n")
+        f.write("const float temp_coef[] = {" + _format_floats(temp_model.coef_) + "};\n\n")
+
+        f.write("// Hệ số cho mô hình độ ẩm\n")
+        f.write(f"const float hum_intercept = {hum_model.intercept_:.6f}f;\n")
+        f.write("const float hum_coef[] = {" + _format_floats(hum_model.coef_) + "};\n\n")
+
+        f.write("// Thứ tự các đặc trưng\n")
+        f.write("// " + ", ".join(feature_cols) + "\n\n")
+
+        f.write("// Số lượng đặc trưng\n")
+        f.write(f"const int NUM_FEATURES = {len(feature_cols)};\n\n")
+        f.write(device_code(feature_cols))
+
+        f.write("#endif // MODEL_COEF_H\n")
+
+def save_model_artifact(timestamp, feature_means, feature_scales, temp_model, hum_model,
+                        feature_cols, prediction_horizon, n_samples):
+    """Ghi file hệ số gọn model_<timestamp>.npz cho predictor.py (không cần scikit-learn khi đọc)"""
+    path = f"{MODELS_DIR}/model_{timestamp}.npz"
+    save_artifact(path, feature_means, feature_scales,
+                  np.column_stack([temp_model.coef_, hum_model.coef_]),
+                  [temp_model.intercept_, hum_model.intercept_], feature_cols,
+                  TARGET_COLS, [prediction_horizon] * len(TARGET_COLS), n_samples)
+    return path
+
+def _training_cache_config(prediction_horizon, data_format, augment=None):
+    """
+    Các tham số quyết định ma trận đặc trưng của train_models(), dùng làm một phần khóa bộ đệm.
+    augment: (augment_replicas, augment_seed), chỉ truyền khi dữ liệu ít hơn MIN_ROWS bản ghi
+    (tăng cường dữ liệu có tác dụng), để các tham số này không tách khóa của dữ liệu đủ lớn.
+    """
+    config = {
+        'prediction_horizon': prediction_horizon,
+        'data_format': data_format,
+        'target_cols': TARGET_COLS,
+        'important_cols': IMPORTANT_COLS,
+        'outlier_sigma': OUTLIER_SIGMA,
+        'select_k': SELECT_K,
+        'select_ratio': SELECT_FEATURE_RATIO,
+        'min_rows': MIN_ROWS,
+    }
+    if augment is not None:
+        config['augment_replicas'], config['augment_seed'] = augment
+    return config
+
+def _prepare_training_data(prediction_horizon, data_format, augment_replicas=DEFAULT_REPLICAS,
+                           augment_seed=None):
+    """
+    Đọc dữ liệu đã xử lý và tạo ma trận thiết kế cho train_models(): đặc trưng đã chuẩn hóa,
+    mục tiêu sau prediction_horizon bản ghi, scaler đã fit và các đặc trưng được chọn.
+    Dưới MIN_ROWS bản ghi thì thêm augment_replicas bản sao có nhiễu (xem augmentation.augment()).
+    """
+    # Đọc dữ liệu đã xử lý
+    with stage('train/load', data_format=data_format) as span:
+        df = load_processed_data(data_format)
+        span.rows_out = len(df)
     
     # Kiểm tra và hiển thị thông tin dữ liệu ban đầu
     print(f"Dữ liệu ban đầu có {len(df)} mẫu")
-    print("5 dòng đầu tiên:")
-    print(df.head())
-    print("\nThống kê mô tả:")
-    print(df.describe())
+    if not quiet():
+        with stage('train/diagnostics', rows_in=len(df)):
+            print("5 dòng đầu tiên:")
+            print(df.head())
+            print("\nThống kê mô tả:")
+            print(df.describe())
 
-    # Kiểm tra dữ liệu
-    print("\nKiểm tra dữ liệu:")
-    print("Số lượng giá trị NaN:")
-    print(df.isna().sum())
+            # Kiểm tra dữ liệu
+            print("\nKiểm tra dữ liệu:")
+            print("Số lượng giá trị NaN:")
+            print(df.isna().sum())
     
     # Kiểm tra số lượng dữ liệu
     print(f"Số lượng bản ghi: {len(df)}")
-    if len(df) < 30:
+    original_rows = len(df)
+    augmented = original_rows < MIN_ROWS and augment_replicas > 0
+    if augmented:
         print("CẢNH BÁO: Dữ liệu quá ít cho mô hình chính xác!")
         print("Đang thực hiện data augmentation...")
-        # Thực hiện data augmentation đơn giản
-        original_df = df.copy()
-        for i in range(5):  # Tạo thêm 5 bản sao với nhiễu nhỏ
-            noisy_df = original_df.copy()
-            for col in ['temp_dht', 'hum_dht']:
-                if col in noisy_df.columns:
-                    # Thêm nhiễu ngẫu nhiên khoảng ±5%
-                    noise = np.random.normal(0, 0.05 * noisy_df[col].std(), size=len(noisy_df))
-                    noisy_df[col] = noisy_df[col] + noise
-            df = pd.concat([df, noisy_df])
+        with stage('train/augment', rows_in=len(df), replicas=augment_replicas) as span:
+            # Thêm augment_replicas bản sao có nhiễu nhỏ, lag/diff được tính lại theo nhiễu
+            df = augment(df, augment_replicas, seed=augment_seed)
+            span.rows_out = len(df)
         print(f"Đã tăng kích thước dữ liệu lên {len(df)} bản ghi")
     
     # Chuẩn bị đặc trưng cho mô hình
     # Lọc các cột số (ngoại trừ timestamp và các cột mục tiêu)
-    feature_cols = df.select_dtypes(include=['float64', 'int64']).columns.tolist()
-    
-    # Loại bỏ các cột mục tiêu và timestamp
-    for col in ['timestamp', 'temp_dht', 'hum_dht']:
-        if col in feature_cols:
-            feature_cols.remove(col)
+    feature_cols = get_feature_cols(df)
     
     print(f"Các đặc trưng được sử dụng: {feature_cols}")
     
     # Tạo đặc trưng X và mục tiêu y
-    X = df[feature_cols].values
+    with stage('train/features', rows_in=len(df)) as span:
+        X = df[feature_cols].values
+        span.rows_out = len(X)
     
     # Tạo nhãn cho nhiệt độ và độ ẩm trong tương lai (sau n bản ghi)
-    y_temp = df['temp_dht'].shift(-prediction_horizon).values
-    y_hum = df['hum_dht'].shift(-prediction_horizon).values
+    y_temp, y_hum = build_targets(df, [prediction_horizon]).T
     
-    # Xóa các hàng cuối không có nhãn
-    mask = ~np.isnan(y_temp)
+    # Xóa các hàng không có nhãn (h hàng cuối, hoặc nhãn vượt qua khoảng mất dữ liệu)
+    mask = ~np.isnan(y_temp) & ~np.isnan(y_hum)
+    if augmented:
+        # Nhãn không được lấy từ bản sao kế tiếp
+        mask &= np.arange(len(df)) % original_rows < original_rows - prediction_horizon
     X = X[mask]
     y_temp = y_temp[mask]
     y_hum = y_hum[mask]
@@ -83,13 +222,15 @@ def train_models(prediction_horizon=6):
     
     # Chuẩn hóa dữ liệu
     scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+    with stage('train/scale', rows_in=len(X)):
+        X_scaled = scaler.fit_transform(X)
     print("Đã chuẩn hóa dữ liệu - trung bình 0, phương sai 1")
     
     # Chọn đặc trưng tốt nhất nếu có quá nhiều đặc trưng so với số mẫu
-    if X.shape[1] > X.shape[0] / 5:  # Nếu số đặc trưng > 20% số mẫu
+    selected_indices = None
+    if X.shape[1] > X.shape[0] * SELECT_FEATURE_RATIO:  # Nếu số đặc trưng > 20% số mẫu
         print("Số lượng đặc trưng nhiều so với số mẫu, thực hiện lựa chọn đặc trưng...")
-        k = min(5, X_scaled.shape[1])  # Chọn tối đa 5 đặc trưng hoặc ít hơn
+        k = min(SELECT_K, X_scaled.shape[1])  # Chọn tối đa SELECT_K đặc trưng hoặc ít hơn
         selector = SelectKBest(f_regression, k=k)
         X_selected = selector.fit_transform(X_scaled, y_temp)
         
@@ -101,17 +242,100 @@ def train_models(prediction_horizon=6):
         # Cập nhật X_scaled và feature_cols
         X_scaled = X_selected
         feature_cols = selected_features
+
+    return {
+        'X_scaled': X_scaled, 'y_temp': y_temp, 'y_hum': y_hum,
+        'feature_cols': feature_cols, 'scaler': scaler,
+        'selected_indices': selected_indices, 'augmented': augmented,
+        'small_data': original_rows < MIN_ROWS,
+    }
+
+def _prepared_to_cache(prepared):
+    """Tách kết quả của _prepare_training_data() thành (mảng, metadata) để lưu vào FeatureCache"""
+    scaler = prepared['scaler']
+    selected = prepared['selected_indices']
+    arrays = {
+        'X_scaled': prepared['X_scaled'], 'y_temp': prepared['y_temp'], 'y_hum': prepared['y_hum'],
+        'scaler_mean': scaler.mean_, 'scaler_scale': scaler.scale_, 'scaler_var': scaler.var_,
+        'selected_indices': np.asarray(selected if selected is not None else [], dtype=np.int64),
+    }
+    meta = {'feature_cols': prepared['feature_cols'], 'selected': selected is not None,
+            'n_samples_seen': int(scaler.n_samples_seen_)}
+    return arrays, meta
+
+def _prepared_from_cache(arrays, meta):
+    """Dựng lại kết quả của _prepare_training_data() từ một mục của FeatureCache"""
+    scaler = StandardScaler()
+    scaler.mean_ = np.array(arrays['scaler_mean'])
+    scaler.scale_ = np.array(arrays['scaler_scale'])
+    scaler.var_ = np.array(arrays['scaler_var'])
+    scaler.n_features_in_ = len(scaler.mean_)
+    scaler.n_samples_seen_ = meta['n_samples_seen']
+    return {
+        'X_scaled': arrays['X_scaled'], 'y_temp': arrays['y_temp'], 'y_hum': arrays['y_hum'],
+        'feature_cols': meta['feature_cols'], 'scaler': scaler,
+        'selected_indices': np.array(arrays['selected_indices']) if meta['selected'] else None,
+        'augmented': False,
+    }
+
+def train_models(prediction_horizon=6, data_format='csv', use_cache=True,
+                 cache_max_bytes=DEFAULT_MAX_BYTES, augment_replicas=DEFAULT_REPLICAS, augment_seed=None):
+    """
+    Huấn luyện mô hình với dữ liệu đã xử lý.
+    data_format: 'csv' đọc DATA_PATH, 'columnar' memory-map kho cột float32 tại COLUMNAR_PATH.
+    use_cache: dùng lại ma trận đặc trưng đã chuẩn bị (xem _prepare_training_data) từ bộ đệm
+    trên đĩa khi dữ liệu đã xử lý và các tham số chuẩn bị không đổi; cache_max_bytes giới hạn
+    dung lượng bộ đệm (loại bỏ mục lâu chưa dùng nhất).
+    augment_replicas, augment_seed: số bản sao có nhiễu và hạt giống khi dữ liệu ít hơn MIN_ROWS
+    bản ghi; với seed cố định kết quả lặp lại được và được lưu vào bộ đệm.
+    """
+    # Tạo thư mục cho models nếu chưa tồn tại
+    os.makedirs(MODELS_DIR, exist_ok=True)
+    os.makedirs(COEF_DIR, exist_ok=True)
     
-    # Chia dữ liệu thành tập huấn luyện và kiểm tra
-    X_train, X_test, y_temp_train, y_temp_test = train_test_split(
-        X_scaled, y_temp, test_size=0.2, random_state=42)
-    _, _, y_hum_train, y_hum_test = train_test_split(
-        X_scaled, y_hum, test_size=0.2, random_state=42, shuffle=False)
+    # Băm dữ liệu một lần, dùng cho cả khóa bộ đệm và sổ đăng ký mô hình
+    data_hash = data_fingerprint(data_source_path(data_format))
+    cache = FeatureCache(max_bytes=cache_max_bytes) if use_cache else None
+    # Số bản ghi (nên việc tăng cường có tác dụng hay không) chỉ biết sau khi đọc dữ liệu:
+    # tra khóa không có tham số tăng cường trước, rồi khóa có tham số nếu kết quả lặp lại được
+    base_key = cache_key(data_hash, _training_cache_config(prediction_horizon, data_format))
+    augment_key = cache_key(data_hash, _training_cache_config(prediction_horizon, data_format,
+                                                              (augment_replicas, augment_seed)))
+    # Dữ liệu ít được tăng cường bằng nhiễu không có seed thì không lưu để mỗi lần chạy vẫn lấy nhiễu mới
+    augment_cacheable = augment_seed is not None or augment_replicas <= 0
+    cached = None
+    if cache is not None:
+        with stage('train/cache_get') as span:
+            for key in [base_key, augment_key] if augment_cacheable else [base_key]:
+                cached = cache.get(key)
+                if cached is not None:
+                    break
+            span.fields['hit'] = cached is not None
+    if cached is not None:
+        print(f"Dùng lại ma trận đặc trưng đã chuẩn bị từ bộ đệm ({key[:12]})")
+        prepared = _prepared_from_cache(*cached)
+    else:
+        prepared = _prepare_training_data(prediction_horizon, data_format, augment_replicas, augment_seed)
+        key = augment_key if prepared['small_data'] else base_key
+        if cache is not None and (not prepared['small_data'] or augment_cacheable):
+            with stage('train/cache_put', rows_in=len(prepared['X_scaled'])):
+                cache.put(key, *_prepared_to_cache(prepared))
+    X_scaled, y_temp, y_hum = prepared['X_scaled'], prepared['y_temp'], prepared['y_hum']
+    feature_cols, scaler = prepared['feature_cols'], prepared['scaler']
+    selected_indices = prepared['selected_indices']
+    n_samples = len(X_scaled)
+    
+    
+    # Chia dữ liệu thành tập huấn luyện và kiểm tra theo thời gian (không xáo trộn)
+    # để hai mô hình được đánh giá trên cùng một tập kiểm tra và không dùng dữ liệu tương lai
+    X_train, X_test, y_temp_train, y_temp_test, y_hum_train, y_hum_test = train_test_split(
+        X_scaled, y_temp, y_hum, test_size=0.2, shuffle=False)
     
     # Huấn luyện mô hình nhiệt độ
     print("\nĐang huấn luyện mô hình nhiệt độ...")
     temp_model = LinearRegression()
-    temp_model.fit(X_train, y_temp_train)
+    with stage('train/fit_temp', rows_in=len(X_train)):
+        temp_model.fit(X_train, y_temp_train)
     
     # Đánh giá mô hình nhiệt độ
     temp_pred = temp_model.predict(X_test)
@@ -125,14 +349,16 @@ def train_models(prediction_horizon=6):
     if cv_size <= 1:
         print("CẢNH BÁO: Không đủ dữ liệu cho cross-validation")
     else:
-        temp_cv_scores = cross_val_score(LinearRegression(), X_scaled, y_temp, 
-                                       cv=cv_size, scoring='r2')
+        with stage('train/cv_temp', rows_in=len(X_scaled), folds=cv_size):
+            temp_cv_scores = cross_val_score(LinearRegression(), X_scaled, y_temp, 
+                                           cv=cv_size, scoring='r2')
         print(f"Điểm R² cross-validation (nhiệt độ): {np.mean(temp_cv_scores):.2f} ± {np.std(temp_cv_scores):.2f}")
     
     # Huấn luyện mô hình độ ẩm
     print("\nĐang huấn luyện mô hình độ ẩm...")
     hum_model = LinearRegression()
-    hum_model.fit(X_train, y_hum_train)
+    with stage('train/fit_hum', rows_in=len(X_train)):
+        hum_model.fit(X_train, y_hum_train)
     
     # Đánh giá mô hình độ ẩm
     hum_pred = hum_model.predict(X_test)
@@ -143,49 +369,51 @@ def train_models(prediction_horizon=6):
     
     # Cross-validation
     if cv_size > 1:
-        hum_cv_scores = cross_val_score(LinearRegression(), X_scaled, y_hum, 
-                                       cv=cv_size, scoring='r2')
+        with stage('train/cv_hum', rows_in=len(X_scaled), folds=cv_size):
+            hum_cv_scores = cross_val_score(LinearRegression(), X_scaled, y_hum, 
+                                           cv=cv_size, scoring='r2')
         print(f"Điểm R² cross-validation (độ ẩm): {np.mean(hum_cv_scores):.2f} ± {np.std(hum_cv_scores):.2f}")
     
     # Trực quan hóa kết quả
-    plt.figure(figsize=(12, 8))
-    
-    # Biểu đồ nhiệt độ
-    plt.subplot(2, 2, 1)
-    plt.scatter(y_temp_test, temp_pred, alpha=0.5)
-    plt.plot([min(y_temp_test), max(y_temp_test)], [min(y_temp_test), max(y_temp_test)], 'r--')
-    plt.title(f'Nhiệt độ: Thực tế vs Dự đoán (R² = {temp_r2:.2f})')
-    plt.xlabel('Thực tế (°C)')
-    plt.ylabel('Dự đoán (°C)')
-    
-    # Biểu đồ độ ẩm
-    plt.subplot(2, 2, 2)
-    plt.scatter(y_hum_test, hum_pred, alpha=0.5)
-    plt.plot([min(y_hum_test), max(y_hum_test)], [min(y_hum_test), max(y_hum_test)], 'r--')
-    plt.title(f'Độ ẩm: Thực tế vs Dự đoán (R² = {hum_r2:.2f})')
-    plt.xlabel('Thực tế (%)')
-    plt.ylabel('Dự đoán (%)')
-    
-    # Biểu đồ nhiệt độ theo thời gian
-    plt.subplot(2, 2, 3)
-    plt.plot(range(len(y_temp_test)), y_temp_test, 'b-', label='Thực tế')
-    plt.plot(range(len(temp_pred)), temp_pred, 'r--', label='Dự đoán')
-    plt.title('Nhiệt độ theo thời gian')
-    plt.xlabel('Mẫu')
-    plt.ylabel('Nhiệt độ (°C)')
-    plt.legend()
-    
-    # Biểu đồ độ ẩm theo thời gian
-    plt.subplot(2, 2, 4)
-    plt.plot(range(len(y_hum_test)), y_hum_test, 'b-', label='Thực tế')
-    plt.plot(range(len(hum_pred)), hum_pred, 'r--', label='Dự đoán')
-    plt.title('Độ ẩm theo thời gian')
-    plt.xlabel('Mẫu')
-    plt.ylabel('Độ ẩm (%)')
-    plt.legend()
-    
-    plt.tight_layout()
-    plt.savefig("../../docs/images/model_evaluation.png")
+    with stage('train/plot', rows_in=len(y_temp_test)):
+        plt.figure(figsize=(12, 8))
+    
+        # Biểu đồ nhiệt độ
+        plt.subplot(2, 2, 1)
+        plt.scatter(y_temp_test, temp_pred, alpha=0.5)
+        plt.plot([min(y_temp_test), max(y_temp_test)], [min(y_temp_test), max(y_temp_test)], 'r--')
+        plt.title(f'Nhiệt độ: Thực tế vs Dự đoán (R² = {temp_r2:.2f})')
+        plt.xlabel('Thực tế (°C)')
+        plt.ylabel('Dự đoán (°C)')
+    
+        # Biểu đồ độ ẩm
+        plt.subplot(2, 2, 2)
+        plt.scatter(y_hum_test, hum_pred, alpha=0.5)
+        plt.plot([min(y_hum_test), max(y_hum_test)], [min(y_hum_test), max(y_hum_test)], 'r--')
+        plt.title(f'Độ ẩm: Thực tế vs Dự đoán (R² = {hum_r2:.2f})')
+        plt.xlabel('Thực tế (%)')
+        plt.ylabel('Dự đoán (%)')
+    
+        # Biểu đồ nhiệt độ theo thời gian
+        plt.subplot(2, 2, 3)
+        plt.plot(range(len(y_temp_test)), y_temp_test, 'b-', label='Thực tế')
+        plt.plot(range(len(temp_pred)), temp_pred, 'r--', label='Dự đoán')
+        plt.title('Nhiệt độ theo thời gian')
+        plt.xlabel('Mẫu')
+        plt.ylabel('Nhiệt độ (°C)')
+        plt.legend()
+    
+        # Biểu đồ độ ẩm theo thời gian
+        plt.subplot(2, 2, 4)
+        plt.plot(range(len(y_hum_test)), y_hum_test, 'b-', label='Thực tế')
+        plt.plot(range(len(hum_pred)), hum_pred, 'r--', label='Dự đoán')
+        plt.title('Độ ẩm theo thời gian')
+        plt.xlabel('Mẫu')
+        plt.ylabel('Độ ẩm (%)')
+        plt.legend()
+    
+        plt.tight_layout()
+        plt.savefig("../../docs/images/model_evaluation.png")
     
     # Kiểm tra các hệ số bất thường
     def check_large_coefficients(model, feature_names, model_name):
@@ -207,98 +435,42 @@ def train_models(prediction_horizon=6):
     # Lưu mô hình
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     
-    # Lưu mô hình bằng pickle
-    temp_model_path = f"{MODELS_DIR}/temp_model_{timestamp}.pkl"
-    hum_model_path = f"{MODELS_DIR}/hum_model_{timestamp}.pkl"
-    scaler_path = f"{MODELS_DIR}/scaler_{timestamp}.pkl"
+    with stage('train/save'):
+        # Lưu mô hình bằng pickle
+        temp_model_path = f"{MODELS_DIR}/temp_model_{timestamp}.pkl"
+        hum_model_path = f"{MODELS_DIR}/hum_model_{timestamp}.pkl"
+        scaler_path = f"{MODELS_DIR}/scaler_{timestamp}.pkl"
     
-    with open(temp_model_path, 'wb') as f:
-        pickle.dump(temp_model, f)
+        with open(temp_model_path, 'wb') as f:
+            pickle.dump(temp_model, f)
     
-    with open(hum_model_path, 'wb') as f:
-        pickle.dump(hum_model, f)
+        with open(hum_model_path, 'wb') as f:
+            pickle.dump(hum_model, f)
     
-    with open(scaler_path, 'wb') as f:
-        pickle.dump(scaler, f)
+        with open(scaler_path, 'wb') as f:
+            pickle.dump(scaler, f)
     
-    print(f"\nĐã lưu mô hình nhiệt độ vào: {temp_model_path}")
-    print(f"Đã lưu mô hình độ ẩm vào: {hum_model_path}")
-    print(f"Đã lưu scaler vào: {scaler_path}")
+        print(f"\nĐã lưu mô hình nhiệt độ vào: {temp_model_path}")
+        print(f"Đã lưu mô hình độ ẩm vào: {hum_model_path}")
+        print(f"Đã lưu scaler vào: {scaler_path}")
     
-    # Lưu hệ số cho ESP32
-    coef_file = f"{COEF_DIR}/model_coef_{timestamp}.h"
+        # Lưu hệ số cho ESP32
+        coef_file = f"{COEF_DIR}/model_coef_{timestamp}.h"
     
-    with open(coef_file, 'w', encoding='utf-8') as f:
-        f.write("// Hệ số mô hình dự đoán thời tiết\n")
-        f.write("// Được tạo tự động bởi script train_model.py\n")
-        f.write(f"// Thời gian: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"// Dựa trên {len(X)} mẫu dữ liệu\n\n")
-        
-        f.write("#ifndef MODEL_COEF_H\n")
-        f.write("#define MODEL_COEF_H\n\n")
-        
-        # Lưu thông tin chuẩn hóa
-        f.write("// Thông tin chuẩn hóa dữ liệu\n")
-        f.write("const float feature_means[] = {")
-        
-        # Nếu đã chọn đặc trưng, chỉ lưu giá trị means cho những đặc trưng được chọn
-        if 'selected_indices' in locals():
-            for i, idx in enumerate(selected_indices):
-                f.write(f"{scaler.mean_[idx]:.6f}f")
-                if i < len(selected_indices) - 1:
-                    f.write(", ")
-        else:
-            for i, mean in enumerate(scaler.mean_):
-                f.write(f"{mean:.6f}f")
-                if i < len(scaler.mean_) - 1:
-                    f.write(", ")
-        f.write("};\n\n")
-        
-        f.write("const float feature_scales[] = {")
-        if 'selected_indices' in locals():
-            for i, idx in enumerate(selected_indices):
-                f.write(f"{scaler.scale_[idx]:.6f}f")
-                if i < len(selected_indices) - 1:
-                    f.write(", ")
+        # Nếu đã chọn đặc trưng, chỉ lưu giá trị means/scales cho những đặc trưng được chọn
+        if selected_indices is not None:
+            feature_means = scaler.mean_[selected_indices]
+            feature_scales = scaler.scale_[selected_indices]
         else:
-            for i, scale in enumerate(scaler.scale_):
-                f.write(f"{scale:.6f}f")
-                if i < len(scaler.scale_) - 1:
-                    f.write(", ")
-        f.write("};\n\n")
-        
-        f.write("// Hệ số cho mô hình nhiệt độ\n")
-        f.write(f"const float temp_intercept = {temp_model.intercept_:.6f}f;\n")
-        f.write("const float temp_coef[] = {")
-        for i, coef in enumerate(temp_model.coef_):
-            f.write(f"{coef:.6f}f")
-            if i < len(temp_model.coef_) - 1:
-                f.write(", ")
-        f.write("};\n\n")
-        
-        f.write("// Hệ số cho mô hình độ ẩm\n")
-        f.write(f"const float hum_intercept = {hum_model.intercept_:.6f}f;\n")
-        f.write("const float hum_coef[] = {")
-        for i, coef in enumerate(hum_model.coef_):
-            f.write(f"{coef:.6f}f")
-            if i < len(hum_model.coef_) - 1:
-                f.write(", ")
-        f.write("};\n\n")
-        
-        f.write("// Thứ tự các đặc trưng\n")
-        f.write("// ")
-        for i, feature in enumerate(feature_cols):
-            f.write(feature)
-            if i < len(feature_cols) - 1:
-                f.write(", ")
-        f.write("\n\n")
-        
-        f.write("// Số lượng đặc trưng\n")
-        f.write(f"const int NUM_FEATURES = {len(feature_cols)};\n\n")
-        
-        f.write("#endif // MODEL_COEF_H\n")
+            feature_means = scaler.mean_
+            feature_scales = scaler.scale_
+        write_coef_header(coef_file, feature_means, feature_scales, temp_model, hum_model,
+                          feature_cols, n_samples)
+        artifact_path = save_model_artifact(timestamp, feature_means, feature_scales, temp_model,
+                                            hum_model, feature_cols, prediction_horizon, n_samples)
     
     print(f"Đã lưu hệ số mô hình vào: {coef_file}")
+    print(f"Đã lưu file hệ số cho predictor vào: {artifact_path}")
     print("\nQuá trình huấn luyện mô hình hoàn tất!")
     
     # Hiển thị đóng góp của các đặc trưng
@@ -338,7 +510,7 @@ def train_models(prediction_horizon=6):
             f.write("// Hệ số mô hình dự đoán thời tiết đơn giản (fall-back)\n")
             f.write("// Được tạo tự động bởi script train_model.py\n")
             f.write(f"// Thời gian: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"// Dựa trên {len(X)} mẫu dữ liệu\n\n")
+            f.write(f"// Dựa trên {n_samples} mẫu dữ liệu\n\n")
             
             f.write("#ifndef MODEL_COEF_H\n")
             f.write("#define MODEL_COEF_H\n\n")
@@ -387,14 +559,328 @@ def train_models(prediction_horizon=6):
             
             f.write("// Số lượng đặc trưng\n")
             f.write(f"const int NUM_FEATURES = {len(feature_cols)};\n\n")
+            f.write(device_code(feature_cols))
             
             f.write("#endif // MODEL_COEF_H\n")
         
         print(f"Đã lưu mô hình fall-back vào: {fallback_file}")
         print("LƯU Ý: Đề xuất sử dụng mô hình fall-back này nếu mô hình chính không ổn định!")
     
+    # Ghi lần huấn luyện vào sổ đăng ký để công cụ khác tìm bộ file mà không cần liệt kê thư mục
+    register_run(timestamp, {
+        'temp_model': temp_model_path,
+        'hum_model': hum_model_path,
+        'scaler': scaler_path,
+        'header': coef_file,
+        'predictor': artifact_path,
+        'fallback_header': fallback_file if has_large_coefficients else None,
+    }, feature_cols=feature_cols, horizons=[prediction_horizon],
+        metrics={'temp_rmse': float(temp_rmse), 'temp_r2': float(temp_r2),
+                 'hum_rmse': float(hum_rmse), 'hum_r2': float(hum_r2)},
+        data_hash=data_hash,
+        fallback_header=has_large_coefficients, kind='single', n_samples=n_samples)
+    print(f"Đã ghi lần huấn luyện {timestamp} vào sổ đăng ký mô hình")
+    
+    return temp_model, hum_model, feature_cols
+
+def train_models_multi_horizon(horizons=DEFAULT_HORIZONS, data_format='csv',
+                               default_horizon=6, test_size=0.2):
+    """
+    Huấn luyện mô hình nhiệt độ và độ ẩm cho nhiều horizon trong một lần:
+    ma trận đặc trưng được tạo và chuẩn hóa một lần, các mục tiêu của mọi horizon
+    được xếp thành một ma trận Y và giải bằng một lần bình phương tối thiểu.
+    Ghi một file header chứa bộ hệ số cho từng horizon; temp_coef/hum_coef thông
+    thường ứng với default_horizon để firmware hiện tại dùng được ngay.
+    Trả về dict {horizon: (temp_model, hum_model)} và danh sách đặc trưng.
+    """
+    horizons = sorted(set(horizons))
+    if default_horizon not in horizons:
+        default_horizon = horizons[0]
+    os.makedirs(MODELS_DIR, exist_ok=True)
+    os.makedirs(COEF_DIR, exist_ok=True)
+
+    with stage('train_multi/load', data_format=data_format) as span:
+        df = load_processed_data(data_format)
+        span.rows_out = len(df)
+    feature_cols = get_feature_cols(df)
+    print(f"Dữ liệu có {len(df)} mẫu, các đặc trưng được sử dụng: {feature_cols}")
+    print(f"Huấn luyện cho các horizon: {horizons}")
+
+    # Ma trận đặc trưng và ma trận mục tiêu dùng chung cho mọi horizon
+    X = df[feature_cols].values.astype(np.float64)
+    Y = build_targets(df, horizons)
+    mask = ~np.isnan(Y).any(axis=1)
+    X = X[mask]
+    Y = Y[mask]
+    if len(X) < 2:
+        raise ValueError(f"Không đủ dữ liệu cho horizon lớn nhất {horizons[-1]}")
+    print(f"Kích thước đặc trưng: {X.shape}, kích thước mục tiêu: {Y.shape}")
+
+    # Chia theo thời gian (không xáo trộn) để mọi mục tiêu dùng cùng một tập kiểm tra
+    n_train = max(1, int(round(len(X) * (1 - test_size))))
+    scaler = StandardScaler()
+    X_train = scaler.fit_transform(X[:n_train])
+    X_test = scaler.transform(X[n_train:])
+    with stage('train_multi/fit', rows_in=n_train, horizons=len(horizons)):
+        intercepts, coefs = fit_multi_output(X_train, Y[:n_train])
+
+    n_h = len(horizons)
+    models = {}
+    metrics = {}
+    for j, h in enumerate(horizons):
+        pair = []
+        for t, target in enumerate(TARGET_COLS):
+            k = t * n_h + j
+            model = LinearRegression()
+            model.coef_ = coefs[:, k]
+            model.intercept_ = intercepts[k]
+            model.n_features_in_ = len(feature_cols)
+            pair.append(model)
+            if len(X_test) > 0:
+                pred = X_test @ coefs[:, k] + intercepts[k]
+                rmse = np.sqrt(mean_squared_error(Y[n_train:, k], pred))
+                r2 = r2_score(Y[n_train:, k], pred) if len(X_test) > 1 else float('nan')
+                print(f"Horizon {h:>3} - {target}: RMSE {rmse:.2f}, R² {r2:.2f}")
+                metrics[f"{target}_h{h}_rmse"] = float(rmse)
+                metrics[f"{target}_h{h}_r2"] = float(r2)
+        models[h] = tuple(pair)
+
+    # Lưu mô hình
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    model_path = f"{MODELS_DIR}/multi_horizon_{timestamp}.pkl"
+    with open(model_path, 'wb') as f:
+        pickle.dump({
+            'horizons': horizons,
+            'feature_cols': feature_cols,
+            'scaler': scaler,
+            'models': models,
+        }, f)
+    artifact_path = save_artifact(f"{MODELS_DIR}/model_multi_{timestamp}.npz", scaler.mean_, scaler.scale_,
+                                  coefs, intercepts, feature_cols,
+                                  [t for t in TARGET_COLS for _ in horizons], horizons * len(TARGET_COLS),
+                                  len(X))
+    print(f"\nĐã lưu mô hình nhiều horizon vào: {model_path}, {artifact_path}")
+
+    # Lưu hệ số cho ESP32
+    coef_file = f"{COEF_DIR}/model_coef_multi_{timestamp}.h"
+    default_idx = horizons.index(default_horizon)
+    with open(coef_file, 'w', encoding='utf-8') as f:
+        f.write("// Hệ số mô hình dự đoán thời tiết cho nhiều horizon\n")
+        f.write("// Được tạo tự động bởi script train_model.py\n")
+        f.write(f"// Thời gian: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write(f"// Dựa trên {len(X)} mẫu dữ liệu\n\n")
+
+        f.write("#ifndef MODEL_COEF_H\n")
+        f.write("#define MODEL_COEF_H\n\n")
+
+        f.write("// Thông tin chuẩn hóa dữ liệu\n")
+        f.write("const float feature_means[] = {" + _format_floats(scaler.mean_) + "};\n\n")
+        f.write("const float feature_scales[] = {" + _format_floats(scaler.scale_) + "};\n\n")
+
+        f.write("// Các horizon (số bản ghi phía trước)\n")
+        f.write(f"const int NUM_HORIZONS = {n_h};\n")
+        f.write("const int HORIZONS[] = {" + ", ".join(str(h) for h in horizons) + "};\n\n")
+
+        for t, name in enumerate(['temp', 'hum']):
+            cols = slice(t * n_h, (t + 1) * n_h)
+            f.write(f"// Hệ số {name} theo từng horizon\n")
+            f.write(f"const float {name}_intercepts[] = {{" + _format_floats(intercepts[cols]) + "};\n")
+            f.write(f"const float {name}_coefs[][{len(feature_cols)}] = {{\n")
+            for j, h in enumerate(horizons):
+                f.write("  {" + _format_floats(coefs[:, t * n_h + j]) + "},")
+                f.write(f"  // horizon {h}\n")
+            f.write("};\n\n")
+
+        f.write(f"// Hệ số mặc định (horizon {default_horizon}) cho predictWeather()\n")
+        f.write(f"const float temp_intercept = {intercepts[default_idx]:.6f}f;\n")
+        f.write("const float temp_coef[] = {" + _format_floats(coefs[:, default_idx]) + "};\n")
+        f.write(f"const float hum_intercept = {intercepts[n_h + default_idx]:.6f}f;\n")
+        f.write("const float hum_coef[] = {" + _format_floats(coefs[:, n_h + default_idx]) + "};\n\n")
+
+        f.write("// Thứ tự các đặc trưng\n")
+        f.write("// " + ", ".join(feature_cols) + "\n\n")
+
+        f.write("// Số lượng đặc trưng\n")
+        f.write(f"const int NUM_FEATURES = {len(feature_cols)};\n\n")
+        f.write(device_code(feature_cols))
+
+        f.write("#endif // MODEL_COEF_H\n")
+
+    print(f"Đã lưu hệ số mô hình vào: {coef_file}")
+    register_run(timestamp, {'multi_horizon': model_path, 'header': coef_file, 'predictor': artifact_path},
+                 feature_cols=feature_cols, horizons=horizons, metrics=metrics,
+                 data_hash=data_fingerprint(data_source_path(data_format)), kind='multi',
+                 n_samples=len(X))
+    return models, feature_cols
+
+def _read_processed_rows(data_format, start, offset=None):
+    """
+    Đọc các hàng dữ liệu đã xử lý từ hàng thứ start trở đi.
+    Với CSV, offset là vị trí byte đầu hàng start đã lưu ở lần trước: chỉ đọc phần file từ đó,
+    không phân tích lại toàn bộ lịch sử. Thiếu offset (hoặc offset không ở đầu dòng) thì dò
+    vị trí bằng cách đọc lướt từng dòng một lần.
+    Trả về (df, vị trí byte đầu mỗi hàng của df; None với kho cột).
+    """
+    if data_format == 'columnar':
+        return load_columnar_frame(COLUMNAR_PATH).iloc[start:].reset_index(drop=True), None
+    with open(DATA_PATH, 'rb') as f:
+        header = f.readline()
+        if offset is not None and offset > len(header):
+            f.seek(offset - 1)
+            if f.read(1) != b'\n':
+                offset = None
+        if offset is None or offset < len(header) or start == 0:
+            f.seek(len(header))
+            for _ in range(start):
+                f.readline()
+            offset = f.tell()
+        f.seek(offset)
+        data = f.read()
+    # Chỉ lấy các dòng hoàn chỉnh
+    ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord('\n')) + 1
+    data = data[:ends[-1]] if len(ends) else b''
+    names = header.decode('utf-8').strip().split(',')
+    if not data:
+        return pd.DataFrame(columns=names), np.empty(0, dtype=np.int64)
+    return pd.read_csv(io.BytesIO(data), header=None, names=names), offset + np.r_[0, ends[:-1]]
+
+def train_models_online(prediction_horizon=6, data_format='csv', state_path=ONLINE_STATE_PATH):
+    """
+    Huấn luyện tăng dần bằng phương trình chuẩn tích lũy.
+    Trạng thái (số mẫu, tổng X/Y, XᵀX, XᵀY) được lưu tại state_path cạnh các file .pkl;
+    mỗi lần chạy chỉ đọc các hàng đã xử lý mới và cộng vào trạng thái, nên chi phí
+    là O(số hàng mới). Hệ số thu được giống hệt StandardScaler + LinearRegression
+    huấn luyện lại trên toàn bộ dữ liệu (không chia tập kiểm tra).
+    Trạng thái được tạo lại từ đầu nếu danh sách đặc trưng, horizon hoặc dữ liệu
+    đã dùng trước đó thay đổi (ví dụ sau khi tiền xử lý lại toàn bộ).
+    """
+    os.makedirs(MODELS_DIR, exist_ok=True)
+    os.makedirs(COEF_DIR, exist_ok=True)
+
+    state, rows_used, last_epoch, feature_cols = None, 0, None, None
+    data_hash, hashed_sizes, row_offset = None, None, None
+    if os.path.exists(state_path):
+        state, meta = NormalEquations.load(state_path)
+        if int(meta['horizon']) == prediction_horizon:
+            rows_used = int(meta['rows_used'])
+            last_epoch = int(meta['last_epoch'])
+            feature_cols = meta['feature_cols'].tolist()
+            if 'data_hash' in meta:
+                data_hash, hashed_sizes = str(meta['data_hash']), json.loads(str(meta['hashed_sizes']))
+            if int(meta.get('row_offset', -1)) >= 0:
+                row_offset = int(meta['row_offset'])
+        else:
+            state = None
+
+    # Đọc từ hàng cuối cùng đã dùng (CSV: từ vị trí byte đã lưu của hàng đó) để kiểm tra
+    # dữ liệu cũ không bị thay đổi
+    start = max(rows_used - 1, 0)
+    with stage('train_online/load', data_format=data_format) as span:
+        df, offsets = _read_processed_rows(data_format, start, row_offset)
+        span.rows_out = len(df)
+    if state is not None and rows_used > 0:
+        if len(df) == 0 or get_feature_cols(df) != feature_cols or \
+                ('timestamp' in df.columns and int(df['timestamp'].iloc[0]) != last_epoch):
+            print("Dữ liệu đã xử lý đã thay đổi, tích lũy lại từ đầu...")
+            state, rows_used, data_hash, hashed_sizes, row_offset = None, 0, None, None, None
+            df, offsets = _read_processed_rows(data_format, 0)
+        else:
+            df = df.iloc[1:].reset_index(drop=True)
+            offsets = offsets[1:] if offsets is not None else None
+
+    if state is None:
+        feature_cols = get_feature_cols(df)
+        state = NormalEquations(len(feature_cols), len(TARGET_COLS))
+        data_hash, hashed_sizes = None, None
+    # Dữ liệu đã xử lý chỉ được ghi nối: băm nối tiếp phần mới thay vì băm lại toàn bộ lịch sử
+    data_hash, hashed_sizes = extend_fingerprint(data_source_path(data_format), data_hash, hashed_sizes)
+
+    # Chỉ các hàng đã có nhãn (sau prediction_horizon bản ghi) mới được cộng vào
+    n_usable = max(len(df) - prediction_horizon, 0)
+    X = df[feature_cols].values[:n_usable]
+    Y = build_targets(df, [prediction_horizon])[:n_usable]
+    # Nhãn vượt qua khoảng mất dữ liệu (NaN) không được cộng, nhưng hàng vẫn tính là đã đọc
+    labeled = ~np.isnan(Y).any(axis=1)
+    with stage('train_online/update', rows_in=n_usable):
+        state.update(X[labeled], Y[labeled])
+    rows_used += n_usable
+    if n_usable > 0 and 'timestamp' in df.columns:
+        last_epoch = int(df['timestamp'].iloc[n_usable - 1])
+    if offsets is None:
+        row_offset = None
+    elif n_usable > 0:
+        row_offset = int(offsets[n_usable - 1])
+    print(f"Đã cộng thêm {int(labeled.sum())} mẫu mới, tổng cộng {state.n} mẫu")
+
+    mean, scale, var, coefs, intercepts = state.solve()
+    scaler = StandardScaler()
+    scaler.mean_, scaler.scale_, scaler.var_ = mean, scale, var
+    scaler.n_features_in_ = len(feature_cols)
+    scaler.n_samples_seen_ = state.n
+
+    models = []
+    for k in range(len(TARGET_COLS)):
+        model = LinearRegression()
+        model.coef_ = coefs[:, k]
+        model.intercept_ = intercepts[k]
+        model.n_features_in_ = len(feature_cols)
+        models.append(model)
+    temp_model, hum_model = models
+
+    state.save(state_path, horizon=prediction_horizon, rows_used=rows_used,
+               last_epoch=last_epoch if last_epoch is not None else -1,
+               feature_cols=feature_cols, data_hash=data_hash, hashed_sizes=json.dumps(hashed_sizes),
+               row_offset=row_offset if row_offset is not None else -1)
+
+    # Lưu mô hình và hệ số cho ESP32 giống train_models()
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    artifacts = {}
+    for name, obj in [('temp_model', temp_model), ('hum_model', hum_model), ('scaler', scaler)]:
+        artifacts[name] = f"{MODELS_DIR}/{name}_{timestamp}.pkl"
+        with open(artifacts[name], 'wb') as f:
+            pickle.dump(obj, f)
+    coef_file = f"{COEF_DIR}/model_coef_{timestamp}.h"
+    write_coef_header(coef_file, scaler.mean_, scaler.scale_, temp_model, hum_model,
+                      feature_cols, state.n)
+    artifacts['header'] = coef_file
+    artifacts['predictor'] = save_model_artifact(timestamp, scaler.mean_, scaler.scale_, temp_model,
+                                                 hum_model, feature_cols, prediction_horizon, state.n)
+    # Mã băm nối tiếp ứng với toàn bộ dữ liệu đã đọc vào trạng thái
+    register_run(timestamp, artifacts, feature_cols=feature_cols, horizons=[prediction_horizon],
+                 data_hash=data_hash, kind='online',
+                 n_samples=state.n)
+    print(f"Đã lưu mô hình và hệ số vào: {MODELS_DIR}, {coef_file}")
+
     return temp_model, hum_model, feature_cols
 
 if __name__ == "__main__":
-    temp_model, hum_model, features = train_models()
+    parser = argparse.ArgumentParser(description="Huấn luyện mô hình dự đoán thời tiết")
+    parser.add_argument("--data-format", choices=['csv', 'columnar'], default='csv',
+                        help="Định dạng dữ liệu đã xử lý dùng để huấn luyện")
+    parser.add_argument("--horizons", type=int, nargs='+', default=None,
+                        help="Huấn luyện nhiều horizon trong một lần, ví dụ: --horizons 1 3 6 12 24")
+    parser.add_argument("--online", action="store_true",
+                        help="Huấn luyện tăng dần, chỉ cộng thêm các hàng mới vào phương trình chuẩn")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Luôn chuẩn bị lại ma trận đặc trưng, không dùng bộ đệm")
+    parser.add_argument("--cache-max-mb", type=int, default=DEFAULT_MAX_BYTES >> 20,
+                        help="Dung lượng tối đa (MB) của bộ đệm ma trận đặc trưng")
+    parser.add_argument("--augment-replicas", type=int, default=DEFAULT_REPLICAS,
+                        help=f"Số bản sao có nhiễu khi dữ liệu ít hơn {MIN_ROWS} bản ghi (0 = tắt)")
+    parser.add_argument("--augment-seed", type=int, default=None,
+                        help="Hạt giống cho nhiễu tăng cường dữ liệu để kết quả lặp lại được")
+    add_arguments(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+
+    if args.horizons:
+        models, features = train_models_multi_horizon(args.horizons, data_format=args.data_format)
+    elif args.online:
+        temp_model, hum_model, features = train_models_online(data_format=args.data_format)
+    else:
+        temp_model, hum_model, features = train_models(data_format=args.data_format,
+                                                       use_cache=not args.no_cache,
+                                                       cache_max_bytes=args.cache_max_mb << 20,
+                                                       augment_replicas=args.augment_replicas,
+                                                       augment_seed=args.augment_seed)
     plt.show()
\ No newline at end of file
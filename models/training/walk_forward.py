@@ -0,0 +1,124 @@
+# models/training/walk_forward.py
+import argparse
+import os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from online_regression import NormalEquations
+from train_model import MODELS_DIR, TARGET_COLS, build_targets, get_feature_cols, load_processed_data
+
+def walk_forward_windows(n_rows, initial_train, test_size, step=None, window='expanding',
+                         train_size=None, gap=0):
+    """
+    Sinh các cửa sổ kiểm tra theo thời gian: (train_start, train_end, test_start, test_end).
+    window='expanding' giữ nguyên train_start = 0, 'sliding' giữ train_size hàng gần nhất.
+    gap: số hàng bỏ qua giữa tập huấn luyện và tập kiểm tra; với mục tiêu dự đoán sau
+    h bản ghi cần gap = h để nhãn của tập huấn luyện không nằm trong giai đoạn kiểm tra.
+    """
+    if window not in ('expanding', 'sliding'):
+        raise ValueError(f"Kiểu cửa sổ không hỗ trợ: {window}")
+    step = step or test_size
+    train_size = train_size or initial_train
+    windows = []
+    test_start = initial_train + gap
+    while test_start < n_rows:
+        train_end = test_start - gap
+        train_start = 0 if window == 'expanding' else max(train_end - train_size, 0)
+        windows.append((train_start, train_end, test_start, min(test_start + test_size, n_rows)))
+        test_start += step
+    return windows
+
+def walk_forward(X, Y, windows):
+    """
+    Backtest theo các cửa sổ đã sinh, cập nhật phương trình chuẩn tăng dần giữa các cửa sổ:
+    chỉ cộng các hàng mới vào cuối tập huấn luyện và trừ các hàng đã trượt khỏi đầu,
+    nên mỗi cửa sổ tốn O(số hàng thay đổi) thay vì huấn luyện lại từ đầu.
+    Mỗi cửa sổ cho ra cùng mô hình như StandardScaler + LinearRegression huấn luyện
+    trên đúng tập huấn luyện của cửa sổ đó, và mọi mục tiêu dùng chung một tập kiểm tra.
+    Trả về mảng RMSE dạng (số cửa sổ, số mục tiêu).
+    """
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64).reshape(len(X), -1)
+    state = NormalEquations(X.shape[1], Y.shape[1])
+    lo = hi = 0  # khoảng [lo, hi) đang có trong state
+    rmse = np.full((len(windows), Y.shape[1]), np.nan)
+
+    for w, (train_start, train_end, test_start, test_end) in enumerate(windows):
+        if train_start >= hi or train_end < lo:
+            # Cửa sổ mới không chồng lên cửa sổ cũ: tích lũy lại từ đầu
+            state = NormalEquations(X.shape[1], Y.shape[1])
+            lo = hi = train_start
+        if train_start < lo:
+            state.update(X[train_start:lo], Y[train_start:lo])
+        else:
+            state.remove(X[lo:train_start], Y[lo:train_start])
+        if train_end > hi:
+            state.update(X[hi:train_end], Y[hi:train_end])
+        else:
+            state.remove(X[train_end:hi], Y[train_end:hi])
+        lo, hi = train_start, train_end
+
+        if state.n < 2 or test_end <= test_start:
+            continue
+        pred = state.predict(X[test_start:test_end])
+        rmse[w] = np.sqrt(np.mean((pred - Y[test_start:test_end]) ** 2, axis=0))
+    return rmse
+
+def run_walk_forward(prediction_horizon=6, initial_train=None, test_size=None, step=None,
+                     window='expanding', train_size=None, data_format='csv', output_path=None):
+    """
+    Backtest walk-forward cho cả nhiệt độ và độ ẩm trên cùng các cửa sổ.
+    Mặc định: tập huấn luyện ban đầu 50% dữ liệu, mỗi cửa sổ kiểm tra 10%.
+    Trả về DataFrame RMSE theo từng cửa sổ và lưu ra CSV.
+    """
+    df = load_processed_data(data_format)
+    feature_cols = get_feature_cols(df)
+    X = df[feature_cols].values.astype(np.float64)
+    Y = build_targets(df, [prediction_horizon])
+    mask = ~np.isnan(Y).any(axis=1) & ~np.isnan(X).any(axis=1)
+    X, Y = X[mask], Y[mask]
+
+    initial_train = initial_train or max(len(X) // 2, 2)
+    test_size = test_size or max(len(X) // 10, 1)
+    windows = walk_forward_windows(len(X), initial_train, test_size, step, window,
+                                   train_size, gap=prediction_horizon)
+    if not windows:
+        raise ValueError("Không đủ dữ liệu để tạo cửa sổ walk-forward")
+    print(f"Dữ liệu có {len(X)} mẫu, {len(windows)} cửa sổ ({window}), horizon {prediction_horizon}")
+
+    rmse = walk_forward(X, Y, windows)
+    result = pd.DataFrame(windows, columns=['train_start', 'train_end', 'test_start', 'test_end'])
+    for t, target in enumerate(TARGET_COLS):
+        result[f'{target}_rmse'] = rmse[:, t]
+
+    if output_path is None:
+        os.makedirs(MODELS_DIR, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_path = f"{MODELS_DIR}/walk_forward_{timestamp}.csv"
+    result.to_csv(output_path, index=False)
+
+    print(result.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    print(f"\nRMSE trung bình - nhiệt độ: {np.nanmean(rmse[:, 0]):.2f}°C, "
+          f"độ ẩm: {np.nanmean(rmse[:, 1]):.2f}%")
+    print(f"Đã lưu kết quả walk-forward vào: {output_path}")
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest walk-forward theo thời gian")
+    parser.add_argument("--data-format", choices=['csv', 'columnar'], default='csv',
+                        help="Định dạng dữ liệu đã xử lý")
+    parser.add_argument("--horizon", type=int, default=6, help="Số bản ghi dự đoán phía trước")
+    parser.add_argument("--window", choices=['expanding', 'sliding'], default='expanding',
+                        help="Cửa sổ huấn luyện mở rộng hoặc trượt")
+    parser.add_argument("--initial-train", type=int, default=None,
+                        help="Số hàng huấn luyện của cửa sổ đầu tiên")
+    parser.add_argument("--train-size", type=int, default=None,
+                        help="Số hàng huấn luyện của cửa sổ trượt (mặc định bằng --initial-train)")
+    parser.add_argument("--test-size", type=int, default=None, help="Số hàng mỗi cửa sổ kiểm tra")
+    parser.add_argument("--step", type=int, default=None,
+                        help="Khoảng dịch giữa hai cửa sổ (mặc định bằng --test-size)")
+    parser.add_argument("--output", default=None, help="Đường dẫn file CSV kết quả")
+    args = parser.parse_args()
+
+    run_walk_forward(args.horizon, args.initial_train, args.test_size, args.step, args.window,
+                     args.train_size, args.data_format, args.output)